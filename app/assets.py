@@ -0,0 +1,321 @@
+"""
+Сборка статических файлов: локальные копии сторонних библиотек, минификация,
+имена с хэшем содержимого и заранее сжатые варианты.
+
+    python -m app.assets           # vendor + build
+    python -m app.assets vendor    # только скачать сторонние файлы в <STATIC_BUILD_DIR>/vendor
+    python -m app.assets build     # только собрать <STATIC_BUILD_DIR>/dist и манифест
+
+Исходники берутся из app/static, результат пишется в STATIC_BUILD_DIR (по умолчанию тоже
+app/static); оба каталога раздаются по /static/. Без доступа к сети сборка не падает:
+не скачанные сторонние файлы остаются на CDN.
+
+Шаблоны получают адреса через static_url(): после сборки это /static/dist/<имя с хэшем>,
+которые отдаются с Cache-Control: immutable; без сборки - исходные /static/... (а для
+не скачанных сторонних файлов - адрес CDN), так что приложение работает и без этого шага.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import re
+import shutil
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Optional
+
+from app import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+    import rjsmin
+except ImportError:
+    rcssmin = rjsmin = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path("app/static")
+BUILD_DIR = Path(config.STATIC_BUILD_DIR)
+DIST_DIR = BUILD_DIR / "dist"
+VENDOR_DIR = BUILD_DIR / "vendor"
+MANIFEST_VERSION = 1
+
+# Сторонние файлы: путь внутри /static -> адрес CDN, с которого они скачиваются.
+# Ресурсы, на которые ссылаются CSS (шрифты, картинки), скачиваются вместе с ними.
+VENDOR_ASSETS = {
+    "vendor/pdfjs/build/pdf.min.js": "https://cdn.jsdelivr.net/npm/pdfjs-dist@3.11.174/build/pdf.min.js",
+    "vendor/pdfjs/build/pdf.worker.min.js": "https://cdn.jsdelivr.net/npm/pdfjs-dist@3.11.174/build/pdf.worker.min.js",
+    "vendor/pdfjs/web/pdf_viewer.min.css": "https://cdn.jsdelivr.net/npm/pdfjs-dist@3.11.174/web/pdf_viewer.min.css",
+    "vendor/fontawesome/css/all.min.css":
+        "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css",
+}
+
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+# Текстовые форматы, для которых сохраняются .gz и .br; шрифты woff2 и картинки уже сжаты
+PRECOMPRESS_SUFFIXES = (".css", ".js", ".svg", ".json", ".txt", ".map", ".ttf", ".eot")
+MIN_PRECOMPRESS_SIZE = 512
+
+
+def _is_local_reference(url: str) -> bool:
+    return not (url.startswith(("data:", "#", "/")) or "://" in url or url.startswith("//"))
+
+
+def _split_reference(url: str) -> tuple[str, str]:
+    """Путь ссылки и суффикс (?v=... или #...), который сохраняется при переписывании"""
+    match = re.search(r"[?#]", url)
+    return (url[:match.start()], url[match.start():]) if match else (url, "")
+
+
+# --- Сторонние файлы ---
+
+DOWNLOAD_TIMEOUT = 30
+
+
+def vendor_path(rel_path: str) -> Path:
+    """Сторонний файл на диске (rel_path начинается с vendor/)"""
+    return BUILD_DIR / rel_path
+
+
+def download(url: str, target: Path) -> bytes:
+    with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+        data = response.read()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(target.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, target)
+    return data
+
+
+def vendor(force: bool = False) -> tuple[int, int]:
+    """
+    Скачивает сторонние файлы (и ресурсы из их CSS) в <STATIC_BUILD_DIR>/vendor.
+    Ошибка скачивания не прерывает сборку: CSS, ресурсы которого не скачались, удаляется,
+    и страницы берут его с CDN. После первой сетевой ошибки остальные файлы не запрашиваются.
+    Возвращает число скачанных и не скачанных файлов.
+    """
+    downloaded = failed = 0
+    offline = False
+    # Ресурс -> CSS, который на него ссылается
+    parents: dict[str, str] = {}
+    pending = list(VENDOR_ASSETS.items())
+    seen: set[str] = set()
+    while pending:
+        rel_path, url = pending.pop()
+        if rel_path in seen:
+            continue
+        seen.add(rel_path)
+        target = vendor_path(rel_path)
+        if force or not target.exists():
+            try:
+                if offline:
+                    raise urllib.error.URLError("network is unavailable")
+                data = download(url, target)
+            except OSError as e:
+                # HTTPError - ошибка одного файла, остальные ошибки означают, что сети нет
+                offline = offline or not isinstance(e, urllib.error.HTTPError)
+                failed += 1
+                logger.warning(f"Could not download {url}: {str(e)}; pages will load it from the CDN")
+                if rel_path in parents:
+                    vendor_path(parents[rel_path]).unlink(missing_ok=True)
+                continue
+            downloaded += 1
+            logger.info(f"Downloaded {url}")
+        else:
+            data = target.read_bytes()
+        if rel_path.endswith(".css"):
+            for _, reference in CSS_URL_RE.findall(data.decode("utf-8", errors="replace")):
+                path, _ = _split_reference(reference)
+                if _is_local_reference(reference) and path:
+                    resource = posixpath.normpath(posixpath.join(posixpath.dirname(rel_path), path))
+                    parents.setdefault(resource, rel_path)
+                    pending.append((resource, urllib.request.urljoin(url, path)))
+    return downloaded, failed
+
+
+# --- Сборка ---
+
+def minify(rel_path: str, data: bytes) -> bytes:
+    """Минифицирует CSS и JS (уже минифицированные .min.* не трогает)"""
+    if rcssmin is None or ".min." in rel_path:
+        return data
+    if rel_path.endswith(".css"):
+        return rcssmin.cssmin(data.decode("utf-8")).encode("utf-8")
+    if rel_path.endswith(".js"):
+        return rjsmin.jsmin(data.decode("utf-8")).encode("utf-8")
+    return data
+
+
+def hashed_name(rel_path: str, data: bytes) -> str:
+    """css/styles.css -> css/styles.<хэш>.css (хэш вставляется перед первым суффиксом, .min.js сохраняется)"""
+    directory, name = posixpath.split(rel_path)
+    stem, dot, suffix = name.partition(".")
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return posixpath.join(directory, f"{stem}.{digest}{dot}{suffix}" if dot else f"{stem}.{digest}")
+
+
+def rewrite_css_urls(rel_path: str, css: str, assets: dict[str, str]) -> str:
+    """Заменяет относительные url() в CSS на собранные файлы с хэшем"""
+    def replace(match: re.Match) -> str:
+        quote, reference = match.groups()
+        path, suffix = _split_reference(reference)
+        if not _is_local_reference(reference) or not path:
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(rel_path), path))
+        hashed = assets.get(target)
+        if hashed is None:
+            return match.group(0)
+        # Собранный CSS лежит в том же каталоге dist, что и исходный в static
+        relative = posixpath.relpath(hashed, posixpath.dirname(rel_path) or ".")
+        return f"url({quote}{relative}{suffix}{quote})"
+
+    return CSS_URL_RE.sub(replace, css)
+
+
+def precompress(path: Path, data: bytes) -> None:
+    """Сохраняет .gz и .br рядом с файлом (максимальное сжатие: делается один раз при сборке)"""
+    if len(data) < MIN_PRECOMPRESS_SIZE or not path.name.endswith(PRECOMPRESS_SUFFIXES):
+        return
+    Path(f"{path}.gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        Path(f"{path}.br").write_bytes(brotli.compress(data, quality=11))
+
+
+def source_files() -> dict[str, Path]:
+    """Исходные файлы сборки: путь внутри /static -> файл на диске (app/static и скачанные vendor)"""
+    # Результаты сборки (в том числе прежней, если STATIC_BUILD_DIR менялся) в исходники не входят
+    skipped = {"dist", "dist.tmp", "vendor"}
+    files = {}
+    for base, prefix in ((STATIC_DIR, ""), (VENDOR_DIR, "vendor/")):
+        if not base.exists():
+            continue
+        for path in base.rglob("*"):
+            rel_path = path.relative_to(base).as_posix()
+            if (path.is_file() and not path.name.endswith(".tmp")
+                    and (prefix or rel_path.split("/", 1)[0] not in skipped)):
+                files[prefix + rel_path] = path
+    return files
+
+
+def static_files() -> dict[str, Path]:
+    """Все файлы, которые раздаются по /static/: исходники, сторонние файлы и собранный dist"""
+    files = source_files()
+    if DIST_DIR.exists():
+        for path in DIST_DIR.rglob("*"):
+            if path.is_file():
+                files[f"dist/{path.relative_to(DIST_DIR).as_posix()}"] = path
+    return files
+
+
+def build() -> dict[str, str]:
+    """
+    Собирает <STATIC_BUILD_DIR>/dist: минифицирует, переименовывает по хэшу, сжимает заранее
+    и пишет manifest.json (исходный путь -> путь с хэшем внутри dist)
+    """
+    tmp_dir = DIST_DIR.with_name(DIST_DIR.name + ".tmp")
+    sources = source_files()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    assets: dict[str, str] = {}
+    # CSS собираются последними: в них подставляются уже известные имена шрифтов и картинок
+    for rel_path in sorted(sorted(sources), key=lambda p: p.endswith(".css")):
+        data = minify(rel_path, sources[rel_path].read_bytes())
+        if rel_path.endswith(".css"):
+            data = rewrite_css_urls(rel_path, data.decode("utf-8"), assets).encode("utf-8")
+        assets[rel_path] = hashed_name(rel_path, data)
+        target = tmp_dir / assets[rel_path]
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        precompress(target, data)
+
+    with open(tmp_dir / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "assets": assets}, f, indent=1, sort_keys=True)
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.replace(tmp_dir, DIST_DIR)
+    asset_manifest.reload()
+    return assets
+
+
+# --- Адреса для шаблонов ---
+
+class AssetManifest:
+    """Соответствие исходных путей статических файлов собранным файлам с хэшем"""
+
+    def __init__(self, dist_dir: Path):
+        self.dist_dir = dist_dir
+        self.assets: Optional[dict[str, str]] = None
+        self._hashed: set[str] = set()
+        self.digest = ""
+
+    def reload(self) -> None:
+        try:
+            with open(self.dist_dir / "manifest.json", "rb") as f:
+                raw = f.read()
+            data = json.loads(raw)
+            assets = data["assets"] if data.get("version") == MANIFEST_VERSION else {}
+        except FileNotFoundError:
+            raw, assets = b"", {}
+        except Exception as e:
+            logger.error(f"Error loading asset manifest: {str(e)}")
+            raw, assets = b"", {}
+        self.assets = assets
+        self._hashed = set(assets.values())
+        self.digest = hashlib.sha256(raw).hexdigest()[:16] if raw else ""
+
+    def _ensure_loaded(self) -> dict[str, str]:
+        if self.assets is None:
+            self.reload()
+        return self.assets
+
+    def url(self, rel_path: str) -> str:
+        """Адрес статического файла для шаблона"""
+        assets = self._ensure_loaded()
+        hashed = assets.get(rel_path)
+        if hashed is not None:
+            return f"/static/dist/{hashed}"
+        # Сторонний файл ещё не скачан - берём его с CDN
+        if rel_path in VENDOR_ASSETS and not vendor_path(rel_path).exists():
+            return VENDOR_ASSETS[rel_path]
+        return f"/static/{rel_path}"
+
+    def is_hashed(self, dist_rel_path: str) -> bool:
+        """Файл из dist с хэшем в имени: его содержимое по этому адресу никогда не меняется"""
+        self._ensure_loaded()
+        return dist_rel_path in self._hashed
+
+
+asset_manifest = AssetManifest(DIST_DIR)
+
+
+def static_url(rel_path: str) -> str:
+    return asset_manifest.url(rel_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка статических файлов")
+    parser.add_argument("step", nargs="?", choices=("all", "vendor", "build"), default="all")
+    parser.add_argument("--force", action="store_true", help="Скачать сторонние файлы заново")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.step in ("all", "vendor"):
+        downloaded, failed = vendor(args.force)
+        print(f"vendored: {downloaded} downloaded, {failed} left on the CDN")
+    if args.step in ("all", "build"):
+        if rcssmin is None:
+            print("rcssmin/rjsmin are not installed, CSS and JS are not minified")
+        assets = build()
+        print(f"built {len(assets)} assets into {DIST_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Общая основа фоновых стадий обработки PDF (извлечение текста, миниатюры, линеаризация).
+
+Каждая стадия ведёт манифест "путь -> хэш содержимого, mtime, размер", при старте и после
+каждого изменения библиотеки сверяет с ним дерево и обрабатывает в пуле процессов только
+изменившиеся файлы. Хэши содержимого общие для всех стадий: файл читается для хэширования
+один раз, сколько бы стадий его ни обрабатывало.
+"""
+import abc
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+from app.executor import SingleFlight
+from app.library import FileEntry, LibraryIndex
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: Path) -> str:
+    """SHA-256 содержимого файла, читается блоками"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentHashes:
+    """
+    Хэши содержимого файлов библиотеки, общие для фоновых стадий и загрузок.
+    Хэш действителен, пока у файла те же mtime и размер; для каждого пути хранится
+    только последняя версия. Одновременные запросы хэша одного файла схлопываются.
+    """
+
+    def __init__(self):
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.computed = 0
+
+    def remember(self, rel_path: str, mtime_ns: int, size: int, sha256: str) -> None:
+        with self._lock:
+            self._hashes[rel_path] = (mtime_ns, size, sha256)
+
+    def cached(self, file: FileEntry) -> Optional[str]:
+        with self._lock:
+            entry = self._hashes.get(file.path)
+        if entry is None or entry[:2] != (file.mtime_ns, file.size):
+            return None
+        return entry[2]
+
+    def get(self, root: Path, file: FileEntry) -> str:
+        """Хэш файла (блокирующий вызов)"""
+        digest = self.cached(file)
+        if digest is None:
+            digest = hash_file(root / file.path)
+            self.computed += 1
+            self.remember(file.path, file.mtime_ns, file.size, digest)
+        return digest
+
+    async def sha256(self, root: Path, file: FileEntry) -> str:
+        """Хэш файла для фоновых стадий: вычисляется в потоке, одновременные запросы ждут один расчёт"""
+        digest = self.cached(file)
+        if digest is not None:
+            return digest
+        return await self._flight.do((file.path, file.mtime_ns, file.size),
+                                     lambda: asyncio.to_thread(self.get, root, file))
+
+    def forget(self, rel_path: str) -> None:
+        with self._lock:
+            self._hashes.pop(rel_path, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._hashes), "computed": self.computed}
+
+
+content_hashes = ContentHashes()
+
+
+class BackgroundStage(abc.ABC):
+    """
+    Фоновая стадия обработки PDF-файлов библиотеки.
+    Подкласс задаёт store (объект с загрузкой и словарём records: путь -> запись с полями
+    sha256, mtime_ns и size), проверку доступности зависимостей, загрузку состояния,
+    сверку reconcile и обработку одного файла process_file.
+    """
+
+    # Для сообщений в логе
+    unavailable_message = "background stage dependencies are not installed"
+    error_message = "Error processing"
+
+    def __init__(self, library: LibraryIndex, store, workers: int = 0):
+        self.library = library
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.progress = {"state": "idle", "total": 0, "done": 0, "failed": 0}
+        self._changes: Optional[asyncio.Event] = None
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    def load(self) -> None:
+        """Загружает манифест стадии с диска (вызывается в потоке)"""
+
+    def wake(self) -> None:
+        """Запускает внеочередную сверку (вызывается из цикла событий)"""
+        if self._changes is not None:
+            self._changes.set()
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Первичная обработка библиотеки и дальнейшая реакция на изменения"""
+        if not self.available():
+            logger.warning(self.unavailable_message)
+            self.progress["state"] = "unavailable"
+            return
+
+        loop = asyncio.get_running_loop()
+        self._changes = asyncio.Event()
+        self.library.add_listener(lambda paths: loop.call_soon_threadsafe(self._changes.set))
+        await asyncio.to_thread(self.load)
+        # Хэши из манифеста не нужно пересчитывать ни этой, ни другим стадиям
+        for rel_path, record in list(self.store.records.items()):
+            content_hashes.remember(rel_path, record.mtime_ns, record.size, record.sha256)
+
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            while not stop_event.is_set():
+                self._changes.clear()
+                await self.reconcile(pool)
+                # Ждём изменений в библиотеке или остановки приложения
+                waiters = [asyncio.create_task(self._changes.wait()), asyncio.create_task(stop_event.wait())]
+                _, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                for task in pending:
+                    task.cancel()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @abc.abstractmethod
+    async def reconcile(self, pool: ProcessPoolExecutor) -> None:
+        """Сверяет библиотеку с манифестом и обрабатывает изменившиеся файлы"""
+
+    def scan(self) -> tuple[dict[str, FileEntry], list[str], list[FileEntry]]:
+        """
+        Сверяет PDF-файлы библиотеки с манифестом: текущие файлы, пути, удалённые из манифеста
+        (файлов больше нет), и файлы, изменившиеся с последней обработки (по mtime и размеру)
+        """
+        current = {file.path: file for file in self.library.iter_files((".pdf",))}
+        removed = [path for path in self.store.records if path not in current]
+        for rel_path in removed:
+            del self.store.records[rel_path]
+            content_hashes.forget(rel_path)
+        changed = []
+        for rel_path, file in current.items():
+            record = self.store.records.get(rel_path)
+            if record is None or record.mtime_ns != file.mtime_ns or record.size != file.size:
+                changed.append(file)
+        return current, removed, changed
+
+    async def process(self, pool: ProcessPoolExecutor, files: list[FileEntry]) -> None:
+        """Обрабатывает файлы параллельно; ошибка в одном файле не останавливает остальные"""
+        self.progress.update(state="running" if files else "idle", total=len(files), done=0, failed=0)
+        await asyncio.gather(*(self._process_one(pool, file) for file in files))
+        self.progress["state"] = "idle"
+
+    async def _process_one(self, pool: ProcessPoolExecutor, file: FileEntry) -> None:
+        try:
+            await self.process_file(pool, file)
+        except Exception as e:
+            logger.error(f"{self.error_message} {file.path}: {str(e)}")
+            self.progress["failed"] += 1
+        finally:
+            self.progress["done"] += 1
+
+    @abc.abstractmethod
+    async def process_file(self, pool: ProcessPoolExecutor, file: FileEntry) -> None:
+        """Обрабатывает один файл; исключение учитывается как ошибка обработки файла"""
+
+    async def content_hash(self, file: FileEntry) -> str:
+        return await content_hashes.sha256(self.library.root, file)
+
+    @staticmethod
+    async def in_pool(pool: ProcessPoolExecutor, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+    def status(self) -> dict:
+        return dict(self.progress, workers=self.workers)
@@ -0,0 +1,314 @@
+import functools
+import gzip
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from app import config
+from app.assets import DIST_DIR, asset_manifest
+from app.executor import run_io
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Меньше этого размера сжатие не окупается
+MIN_COMPRESS_SIZE = 512
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Потоковые ответы сжимаются на лету, поэтому уровень ниже, чем для кэшируемых вариантов
+STREAM_GZIP_LEVEL = 6
+STREAM_BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def supported_encodings() -> tuple[str, ...]:
+    """Поддерживаемые кодировки в порядке предпочтения"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def is_compressible(media_type: Optional[str]) -> bool:
+    """PDF, изображения и архивы уже сжаты - их не трогаем"""
+    if not media_type:
+        return False
+    return media_type.split(";")[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Выбирает кодировку по заголовку Accept-Encoding с учётом q-значений"""
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """ETag сжатого варианта отличается от исходного: "abc" -> "abc-br" """
+    if etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return f"{etag}-{encoding}"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Сравнивает If-None-Match с ETag содержимого и ETag его сжатых вариантов"""
+    if if_none_match is None:
+        return False
+    candidates = {etag, variant_etag(etag, "gzip"), variant_etag(etag, "br")}
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in candidates:
+            return True
+    return False
+
+
+class StreamCompressor:
+    """
+    Сжатие потокового ответа по частям. Каждая часть сбрасывается в выходной поток
+    (Z_SYNC_FLUSH / flush brotli), чтобы браузер мог показать её, не дожидаясь остальных.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=STREAM_BROTLI_QUALITY)
+        elif encoding == "gzip":
+            self._compressor = zlib.compressobj(STREAM_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class VariantCache:
+    """
+    LRU-кэш сжатых вариантов ответа с ограничением по памяти.
+    Ключ содержит ETag исходного содержимого, поэтому каждая версия сжимается один раз.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple[str, str], bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def contains(self, key: str, encoding: str) -> bool:
+        with self._lock:
+            return (key, encoding) in self._entries
+
+    def get_or_compress(self, key: str, encoding: str, load: Callable[[], bytes]) -> bytes:
+        cache_key = (key, encoding)
+        with self._lock:
+            data = self._entries.get(cache_key)
+            if data is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        data = compress(load(), encoding)
+        if len(data) <= self.max_bytes:
+            with self._lock:
+                if cache_key not in self._entries:
+                    self._entries[cache_key] = data
+                    self._size += len(data)
+                while self._size > self.max_bytes and self._entries:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+        return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+variant_cache = VariantCache(config.COMPRESSION_CACHE_MAX_BYTES)
+
+
+def negotiate(request_headers: Headers, size: int, media_type: Optional[str]) -> Optional[str]:
+    """Кодировка для ответа или None, если отдаём как есть"""
+    if size < MIN_COMPRESS_SIZE or not is_compressible(media_type):
+        return None
+    return choose_encoding(request_headers.get("accept-encoding"))
+
+
+def compressed_response(key: str, etag: str, encoding: str, load: Callable[[], bytes],
+                        media_type: str, headers: dict, method: str = "GET") -> Response:
+    """Ответ со сжатым вариантом содержимого из кэша вариантов"""
+    body = variant_cache.get_or_compress(key, encoding, load)
+    headers = dict(headers)
+    headers["ETag"] = variant_etag(etag, encoding)
+    headers["Content-Encoding"] = encoding
+    headers["Vary"] = "Accept-Encoding"
+    response = Response(content=b"" if method.upper() == "HEAD" else body,
+                        media_type=media_type, headers=headers)
+    response.headers["Content-Length"] = str(len(body))
+    return response
+
+
+class DeferredResponse(Response):
+    """
+    Ответ, который строится при отправке в пуле ввода-вывода: StaticFiles.file_response
+    синхронный, а чтение и сжатие файла не должны блокировать цикл событий.
+    Заголовки становятся известны только при отправке: до неё у ответа пустые заголовки
+    """
+
+    def __init__(self, build: Callable[[], Response]):
+        super().__init__()
+        # Content-Length пустого тела к настоящему ответу не относится
+        self.raw_headers = []
+        self.build = build
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = await run_io(self.build)
+        await response(scope, receive, send)
+
+
+# Собранные файлы с хэшем в имени не меняются по своему адресу
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class CompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles, отдающие gzip/brotli-варианты текстовых ассетов.
+    Для собранных файлов из dist (app.assets) используются заранее сжатые .br/.gz
+    и долгое кэширование.
+    """
+
+    @staticmethod
+    def _hashed_asset(full_path: os.PathLike) -> bool:
+        rel_path = os.path.relpath(full_path, os.path.abspath(DIST_DIR))
+        return not rel_path.startswith("..") and asset_manifest.is_hashed(rel_path.replace(os.sep, "/"))
+
+    def file_response(self, full_path: os.PathLike, stat_result: os.stat_result,
+                      scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        immutable = self._hashed_asset(full_path)
+        if immutable:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        if not isinstance(response, FileResponse) or status_code != 200:
+            return response
+        if not is_compressible(response.media_type):
+            return response
+
+        request_headers = Headers(scope=scope)
+        response.headers["Vary"] = "Accept-Encoding"
+        encoding = negotiate(request_headers, stat_result.st_size, response.media_type)
+        if encoding is None:
+            return response
+
+        etag = '"' + response.headers["etag"].strip('"') + '"'
+        if etag_matches(request_headers.get("if-none-match"), etag):
+            headers = {"ETag": variant_etag(etag, encoding), "Vary": "Accept-Encoding"}
+            if immutable:
+                headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+            return Response(status_code=304, headers=headers)
+
+        if immutable:
+            precompressed = self._precompressed_response(full_path, encoding, response, scope["method"])
+            if precompressed is not None:
+                return precompressed
+        headers = {"Last-Modified": response.headers["last-modified"]}
+        if immutable:
+            headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        key = f"{full_path}:{etag}"
+        build = functools.partial(
+            compressed_response,
+            key=key,
+            etag=etag,
+            encoding=encoding,
+            load=Path(full_path).read_bytes,
+            media_type=response.media_type,
+            headers=headers,
+            method=scope["method"],
+        )
+        # Готовый вариант из кэша отдаётся сразу, промах (чтение + сжатие) - вне цикла событий
+        return build() if variant_cache.contains(key, encoding) else DeferredResponse(build)
+
+    @staticmethod
+    def _precompressed_response(full_path: os.PathLike, encoding: str,
+                                response: FileResponse, method: str) -> Optional[Response]:
+        """Готовый .br/.gz рядом с файлом; без него сжатие идёт через кэш вариантов"""
+        suffix = {"br": ".br", "gzip": ".gz"}[encoding]
+        variant_path = f"{full_path}{suffix}"
+        try:
+            variant_stat = os.stat(variant_path)
+        except FileNotFoundError:
+            return None
+        etag = '"' + response.headers["etag"].strip('"') + '"'
+        return FileResponse(
+            variant_path,
+            stat_result=variant_stat,
+            media_type=response.media_type,
+            method=method,
+            headers={
+                "ETag": variant_etag(etag, encoding),
+                "Content-Encoding": encoding,
+                "Vary": "Accept-Encoding",
+                "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+                "Last-Modified": response.headers["last-modified"],
+            },
+        )
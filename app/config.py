@@ -0,0 +1,126 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """Читает целое число из переменной окружения"""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Читает дробное число из переменной окружения"""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+# Запуск внутри Docker-контейнера
+IS_DOCKER = os.environ.get('RUNNING_IN_DOCKER', 'false').lower() == 'true'
+
+# Бюджет памяти для кэша отрендеренных страниц (в байтах)
+RENDER_CACHE_MAX_BYTES = _env_int("RENDER_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+# Markdown-документы от этого размера (в байтах) отдаются потоком по разделам, без кэша страниц (0 - выключено)
+STREAM_MIN_BYTES = _env_int("STREAM_MIN_BYTES", 1024 * 1024)
+# Примерный размер раздела исходного текста, который конвертируется и отправляется за раз
+STREAM_SECTION_SIZE = _env_int("STREAM_SECTION_SIZE", 64 * 1024)
+
+# Отслеживание изменений в библиотеке через watchfiles
+LIBRARY_WATCH = os.environ.get('LIBRARY_WATCH', 'true').lower() == 'true'
+
+# Интервал полного пересканирования библиотеки (в секундах)
+LIBRARY_RESCAN_INTERVAL = _env_int("LIBRARY_RESCAN_INTERVAL", 300)
+
+# Каталог для служебных данных (индексы, кэши на диске)
+DATA_DIR = os.environ.get("LIBRARY_DATA_DIR", ".library_cache")
+
+# Как часто изменённый поисковый индекс сохраняется на диск (в секундах)
+SEARCH_INDEX_SAVE_INTERVAL = _env_int("SEARCH_INDEX_SAVE_INTERVAL", 30)
+
+# Число процессов для извлечения текста из PDF (0 - по числу ядер)
+PDF_EXTRACT_WORKERS = _env_int("PDF_EXTRACT_WORKERS", 0)
+
+# Бюджет памяти для сжатых (gzip/brotli) вариантов ответов (в байтах)
+COMPRESSION_CACHE_MAX_BYTES = _env_int("COMPRESSION_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+
+# Каталог для собранных статических файлов (vendor и dist). В Docker-образе он лежит вне app,
+# чтобы монтирование app с хоста в docker-compose не скрывало результат сборки
+STATIC_BUILD_DIR = os.environ.get("STATIC_BUILD_DIR", "app/static")
+
+# Явно заданный корень библиотеки (по умолчанию ищется pdf_uploads / app/pdfs)
+LIBRARY_ROOT = os.environ.get("LIBRARY_ROOT", "")
+
+# Потоки для файлового ввода-вывода
+IO_THREADS = _env_int("IO_THREADS", 16)
+
+# Пул для конвертации Markdown: thread или process
+RENDER_EXECUTOR = os.environ.get("RENDER_EXECUTOR", "thread").lower()
+RENDER_WORKERS = _env_int("RENDER_WORKERS", os.cpu_count() or 1)
+
+# Ограничение одновременных рендеров и очереди ожидания; сверх очереди - 503
+RENDER_MAX_INFLIGHT = _env_int("RENDER_MAX_INFLIGHT", RENDER_WORKERS * 2)
+RENDER_QUEUE_SIZE = _env_int("RENDER_QUEUE_SIZE", 64)
+RENDER_RETRY_AFTER = _env_int("RENDER_RETRY_AFTER", 2)
+
+# Метрики: middleware и эндпоинт /metrics
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+# Подсчёт файловых операций запроса через аудит-хук
+METRICS_FS_AUDIT = os.environ.get("METRICS_FS_AUDIT", "true").lower() == "true"
+# Доля запросов, для которых пишется структурированный лог (0 - выключено)
+METRICS_LOG_SAMPLE = _env_float("METRICS_LOG_SAMPLE", 0.0)
+# Профилирование запроса по заголовку X-Profile: 1 (только для отладки)
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+
+# Кэш миниатюр и превью первых страниц PDF на диске (в байтах)
+THUMBNAIL_CACHE_MAX_BYTES = _env_int("THUMBNAIL_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+# Число процессов для рендеринга миниатюр (0 - по числу ядер)
+THUMBNAIL_WORKERS = _env_int("THUMBNAIL_WORKERS", 0)
+
+# Число процессов для линеаризации PDF (0 - по числу ядер)
+PDF_OPTIMIZE_WORKERS = _env_int("PDF_OPTIMIZE_WORKERS", 0)
+
+# Размер страницы JSON API листингов и бесконечной прокрутки (и верхняя граница limit)
+LISTING_PAGE_SIZE = _env_int("LISTING_PAGE_SIZE", 100)
+LISTING_MAX_PAGE_SIZE = _env_int("LISTING_MAX_PAGE_SIZE", 500)
+
+# Загрузка документов через POST /pdf/api/upload: токен (пустой - загрузка выключена)
+# и предельный размер тела запроса (в байтах)
+UPLOAD_TOKEN = os.environ.get("UPLOAD_TOKEN", "")
+UPLOAD_MAX_BYTES = _env_int("UPLOAD_MAX_BYTES", 1024 * 1024 * 1024)
+
+# Отдача файлов при скачивании: app - сами (FileResponse с Range), accel - заголовок
+# X-Accel-Redirect для nginx, sendfile - X-Sendfile (Apache mod_xsendfile, lighttpd)
+FILE_DELIVERY = os.environ.get("FILE_DELIVERY", "app").lower()
+# Внутренние location прокси для корня библиотеки и линеаризованных копий PDF (режим accel)
+FILE_DELIVERY_PREFIX = os.environ.get("FILE_DELIVERY_PREFIX", "/_protected/library")
+FILE_DELIVERY_LINEARIZED_PREFIX = os.environ.get("FILE_DELIVERY_LINEARIZED_PREFIX", "/_protected/linearized")
+
+# Статистика обращений к документам и листингам: период полураспада счётчиков (в часах),
+# интервал сохранения на диск (в секундах) и число хранимых записей
+ACCESS_STATS_HALF_LIFE_HOURS = _env_float("ACCESS_STATS_HALF_LIFE_HOURS", 72.0)
+ACCESS_STATS_SAVE_INTERVAL = _env_int("ACCESS_STATS_SAVE_INTERVAL", 60)
+ACCESS_STATS_MAX_ENTRIES = _env_int("ACCESS_STATS_MAX_ENTRIES", 10000)
+
+# Прогрев после старта: сколько самых посещаемых страниц открыть (0 - выключено),
+# бюджет по времени и по процессорному времени (в секундах) и число одновременных запросов
+WARMUP_TOP_N = _env_int("WARMUP_TOP_N", 50)
+WARMUP_TIME_BUDGET = _env_float("WARMUP_TIME_BUDGET", 30.0)
+WARMUP_CPU_BUDGET = _env_float("WARMUP_CPU_BUDGET", 20.0)
+WARMUP_CONCURRENCY = _env_int("WARMUP_CONCURRENCY", 2)
+# true - приложение начинает принимать запросы только после прогрева
+WARMUP_BEFORE_TRAFFIC = os.environ.get("WARMUP_BEFORE_TRAFFIC", "false").lower() == "true"
+
+# Кэш скомпилированных шаблонов Jinja2 на диске (в DATA_DIR/jinja)
+TEMPLATE_BYTECODE_CACHE = os.environ.get("TEMPLATE_BYTECODE_CACHE", "true").lower() == "true"
+
+# Кэш HTML блоков Markdown-документов для инкрементального рендеринга (в байтах, 0 - выключен)
+MARKDOWN_BLOCK_CACHE_MAX_BYTES = _env_int("MARKDOWN_BLOCK_CACHE_MAX_BYTES", 32 * 1024 * 1024)
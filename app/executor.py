@@ -0,0 +1,166 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Hashable, Optional, TypeVar
+
+from fastapi import HTTPException
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Пул для файлового ввода-вывода (open/read/stat/resolve)
+io_executor = ThreadPoolExecutor(max_workers=config.IO_THREADS, thread_name_prefix="library-io")
+
+_render_executor: Optional[Executor] = None
+
+
+def get_render_executor() -> Executor:
+    """
+    Пул для конвертации Markdown: потоки или процессы (RENDER_EXECUTOR=thread|process).
+    В режиме процессов передаваемые функции и аргументы должны сериализоваться через pickle.
+    """
+    global _render_executor
+    if _render_executor is None:
+        if config.RENDER_EXECUTOR == "process":
+            _render_executor = ProcessPoolExecutor(max_workers=config.RENDER_WORKERS)
+        else:
+            _render_executor = ThreadPoolExecutor(max_workers=config.RENDER_WORKERS,
+                                                  thread_name_prefix="library-render")
+    return _render_executor
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Выполняет блокирующую файловую операцию вне цикла событий.
+    Контекст запроса передаётся в поток, чтобы метрики относили операции к нему.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(io_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+async def run_render(func: Callable[..., T], *args: Any) -> T:
+    """Выполняет CPU-тяжёлую конвертацию в пуле рендеринга"""
+    loop = asyncio.get_running_loop()
+    executor = get_render_executor()
+    if isinstance(executor, ThreadPoolExecutor):
+        return await loop.run_in_executor(executor, functools.partial(contextvars.copy_context().run, func, *args))
+    return await loop.run_in_executor(executor, func, *args)
+
+
+class RenderLimiter:
+    """
+    Ограничивает число одновременных рендеров.
+    Запросы сверх лимита ждут в очереди; когда и очередь заполнена, отвечаем 503 с Retry-After.
+    С reject=False слот ожидается без отказа: так продолжается уже начатый потоковый ответ.
+    """
+
+    def __init__(self, max_inflight: int, max_queue: int, retry_after: int):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.inflight = 0
+        self.queued = 0
+        self.rejected = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+        return self._semaphore
+
+    def check(self) -> None:
+        """Отвечает 503, если свободных слотов нет и очередь заполнена"""
+        if self._get_semaphore().locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+    @asynccontextmanager
+    async def slot(self, reject: bool = True):
+        if reject:
+            self.check()
+        semaphore = self._get_semaphore()
+        self.queued += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+        }
+
+
+class _Flight:
+    """Общее вычисление и число запросов, которые ждут его результат"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Схлопывает одновременные одинаковые вычисления в одно: остальные ждут его результат.
+    Вычисление идёт в отдельной задаче, а не в запросе, который его начал: если этот запрос
+    отменён (клиент отключился), остальные получают результат как обычно. Задача отменяется,
+    только когда результат не ждёт никто.
+    """
+
+    def __init__(self):
+        self._pending: dict[Hashable, _Flight] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        flight = self._pending.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._pending[key] = flight
+            flight.task.add_done_callback(functools.partial(self._finished, key, flight))
+        else:
+            self.shared += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Результат больше никому не нужен; новые запросы начнут вычисление заново
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._pending.get(key) is flight:
+            del self._pending[key]
+
+    def _finished(self, key: Hashable, flight: _Flight, task: asyncio.Task) -> None:
+        self._forget(key, flight)
+        if not task.cancelled():
+            # Исключение уже передано ожидающим, чтобы не было предупреждения "never retrieved"
+            task.exception()
+
+
+render_limiter = RenderLimiter(config.RENDER_MAX_INFLIGHT, config.RENDER_QUEUE_SIZE, config.RENDER_RETRY_AFTER)
+render_flight = SingleFlight()
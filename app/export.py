@@ -0,0 +1,359 @@
+"""
+Статический экспорт библиотеки для раздачи через nginx без Python.
+
+    python -m app.export OUTPUT_DIR [--workers N] [--force]
+
+Структура выходного каталога повторяет URL приложения:
+
+    pdf/index.html                  /pdf/
+    pdf/_folder/<folder>.html       /pdf/?folder=<folder>
+    pdf/view/<path>                 /pdf/view/<path> (HTML)
+    pdf/download/<path>             /pdf/download/<path> (жёсткая ссылка на исходный или линеаризованный файл)
+    pdf/thumb/<path>, pdf/preview/<path>  изображения первой страницы PDF, если они уже сгенерированы
+    markdown/index.html             /markdown/
+    markdown/_folder/<folder>.html  /markdown/?folder=<folder>
+    markdown/view/<path>            /markdown/view/<path> (HTML)
+    markdown/download/<path>        /markdown/download/<path>
+    static/...                      /static/...
+
+Имена файлов папок закодированы так же, как браузер кодирует строку запроса,
+поэтому nginx находит листинг через try_files /pdf/_folder/$arg_folder.html.
+
+Пересборка инкрементальная: для каждой страницы хранится отпечаток входных данных
+(хэш содержимого исходника, контекст шаблона и хэш шаблона вместе с базовыми),
+и перерисовываются только страницы с изменившимся отпечатком.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+import jinja2
+from jinja2 import meta
+
+from app import config
+from app.assets import asset_manifest, static_files
+from app.background import content_hashes
+from app.library import FolderEntry, LibraryIndex, library_index
+from app.pdf_optimize import pdf_optimize_store
+from app.rendering import RENDERER_VERSION, read_document, render_markdown
+from app.routers import markdown as markdown_router
+from app.routers import pdfs as pdfs_router
+from app.templating import templates
+from app.thumbnails import VARIANTS as THUMBNAIL_VARIANTS, thumbnail_store
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".export-manifest.json"
+MANIFEST_VERSION = 1
+
+# Символы, которые браузер не кодирует в строке запроса
+QUERY_SAFE = "/!$&'()*+,;=:@"
+
+
+def get_environment() -> jinja2.Environment:
+    """Общее окружение шаблонов приложения (с кэшем байткода); своё в каждом процессе пула"""
+    return templates.env
+
+
+def template_fingerprint(name: str) -> str:
+    """Хэш шаблона и всех шаблонов, от которых он зависит (extends/include/import)"""
+    environment = get_environment()
+    digest = hashlib.sha256()
+    seen: set[str] = set()
+    pending = [name]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        source, _, _ = environment.loader.get_source(environment, current)
+        digest.update(current.encode())
+        digest.update(source.encode())
+        pending.extend(ref for ref in meta.find_referenced_templates(environment.parse(source)) if ref)
+    return digest.hexdigest()
+
+
+def folder_page(section: str, folder: str) -> str:
+    """Путь HTML-файла листинга папки относительно выходного каталога"""
+    if not folder:
+        return f"{section}/index.html"
+    return f"{section}/_folder/{quote(folder, safe=QUERY_SAFE)}.html"
+
+
+def render_job(job: tuple[Optional[str], list[tuple[str, str, dict]]]) -> int:
+    """
+    Рендерит страницы одного задания и атомарно записывает их.
+    Задание - исходный Markdown (или None) и список страниц (выходной путь, шаблон, контекст);
+    Markdown читается и конвертируется один раз для всех страниц задания.
+    Выполняется в пуле процессов, поэтому функция на уровне модуля.
+    """
+    source, pages = job
+    content = render_markdown(read_document(Path(source))) if source else None
+    environment = get_environment()
+    for out_path, template_name, context in pages:
+        if content is not None:
+            context = dict(context, content=content)
+        html = environment.get_template(template_name).render(context)
+        target = Path(out_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + ".tmp")
+        tmp_path.write_text(html, encoding="utf-8")
+        os.replace(tmp_path, target)
+    return len(pages)
+
+
+def link_file(source: Path, target: Path) -> bool:
+    """Жёсткая ссылка на исходный файл (копия, если ссылка невозможна). True, если файл обновлён"""
+    source_stat = source.stat()
+    try:
+        target_stat = target.stat()
+        if (target_stat.st_dev, target_stat.st_ino) == (source_stat.st_dev, source_stat.st_ino):
+            return False
+        if (target_stat.st_size, target_stat.st_mtime_ns) == (source_stat.st_size, source_stat.st_mtime_ns):
+            return False
+    except FileNotFoundError:
+        pass
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(target.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        # Другая файловая система или ссылки не поддерживаются
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, target)
+    return True
+
+
+class LibraryExporter:
+    """Собирает статическую копию библиотеки и поддерживает её в актуальном состоянии"""
+
+    def __init__(self, output_dir: Path, library: LibraryIndex, workers: int = 0):
+        self.output_dir = output_dir
+        self.library = library
+        self.root = library.root
+        self.workers = workers or os.cpu_count() or 1
+        self.sources: dict[str, dict] = {}
+        self.pages: dict[str, str] = {}
+        self.files: set[str] = set()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.output_dir / MANIFEST_NAME
+
+    def load_manifest(self) -> None:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                return
+            self.sources = data["sources"]
+            self.pages = data["pages"]
+            self.files = set(data["files"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error loading export manifest: {str(e)}")
+
+    def save_manifest(self) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "sources": self.sources,
+                "pages": self.pages,
+                "files": sorted(self.files),
+            }, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def content_hash(self, file) -> str:
+        """Хэш содержимого; для файлов с прежними mtime и размером берётся из манифеста"""
+        record = self.sources.get(file.path)
+        if record and record["mtime_ns"] == file.mtime_ns and record["size"] == file.size:
+            return record["sha256"]
+        sha256 = content_hashes.get(self.root, file)
+        self.sources[file.path] = {"mtime_ns": file.mtime_ns, "size": file.size, "sha256": sha256}
+        return sha256
+
+    # --- Контекст страниц ---
+
+    @staticmethod
+    def _listing_pages(entry: FolderEntry) -> list[tuple[str, str, dict]]:
+        folder = entry.path
+        directories, markdown_files = markdown_router.get_folder_contents(entry)
+        return [
+            (folder_page("pdf", folder), "pdf_list.html", {
+                "files": pdfs_router.get_pdf_files(folder),
+                "directories": pdfs_router.get_directories(folder),
+                "breadcrumbs": pdfs_router.generate_breadcrumbs(folder),
+                "current_folder": folder,
+            }),
+            (folder_page("markdown", folder), "markdown_list.html", {
+                "markdown_files": markdown_files,
+                "directories": directories,
+                "current_folder": folder,
+                "breadcrumbs": markdown_router.create_breadcrumbs(folder),
+            }),
+        ]
+
+    @staticmethod
+    def _view_pages(file) -> list[tuple[str, str, dict]]:
+        path = Path(file.path)
+        folder = path.parent.as_posix() if path.parent.as_posix() != "." else ""
+        back_url = f"/pdf/?folder={folder}" if folder else "/pdf/"
+        title = path.stem.replace("_", " ").title()
+        if file.name.lower().endswith(".pdf"):
+            return [(f"pdf/view/{file.path}", "pdf_viewer.html", {
+                "pdf_name": title,
+                "pdf_url": f"/pdf/download/{quote(file.path)}",
+                "preview_url": f"/pdf/preview/{quote(file.path)}",
+                "back_url": back_url,
+            })]
+        return [
+            (f"pdf/view/{file.path}", "markdown_viewer.html", {
+                "title": title,
+                "back_url": back_url,
+                "file_path": file.path,
+            }),
+            (f"markdown/view/{file.path}", "markdown_viewer.html", {
+                "title": file.name,
+                "file_path": file.path,
+                "back_url": back_url,
+            }),
+        ]
+
+    # --- Сборка ---
+
+    def plan(self, force: bool = False) -> tuple[list, dict[str, str], set[str]]:
+        """
+        Сопоставляет библиотеку с манифестом.
+        Возвращает задания на рендеринг, новые отпечатки страниц и набор файлов для ссылок.
+        """
+        # Адреса статических файлов в страницах зависят от манифеста сборки app.assets
+        templates = {name: f"{template_fingerprint(name)}:{asset_manifest.digest}" for name in
+                     ("pdf_list.html", "markdown_list.html", "pdf_viewer.html", "markdown_viewer.html")}
+        jobs = []
+        pages: dict[str, str] = {}
+        files: set[str] = set()
+
+        def schedule(source: Optional[str], source_hash: str, page_list: list[tuple[str, str, dict]]) -> None:
+            stale = []
+            for out_rel, template_name, context in page_list:
+                fingerprint = hashlib.sha256(json.dumps(
+                    [templates[template_name], source_hash, context], sort_keys=True, ensure_ascii=False
+                ).encode()).hexdigest()
+                pages[out_rel] = fingerprint
+                if force or self.pages.get(out_rel) != fingerprint or not (self.output_dir / out_rel).exists():
+                    stale.append((str(self.output_dir / out_rel), template_name, context))
+            if stale:
+                jobs.append((source, stale))
+
+        for entry in self.library.iter_folders():
+            schedule(None, "", self._listing_pages(entry))
+
+        for file in self.library.iter_files((".pdf", ".md")):
+            is_markdown = file.name.lower().endswith(".md")
+            # Страницы Markdown зависят и от версии конвейера рендеринга
+            source_hash = f"{self.content_hash(file)}:{RENDERER_VERSION}" if is_markdown else ""
+            schedule(str(self.root / file.path) if is_markdown else None, source_hash, self._view_pages(file))
+            files.add(f"pdf/download/{file.path}")
+            if is_markdown:
+                files.add(f"markdown/download/{file.path}")
+
+        return jobs, pages, files
+
+    def export(self, force: bool = False) -> dict:
+        start = time.perf_counter()
+        self.load_manifest()
+        self.library.build()
+        asset_manifest.reload()
+        thumbnail_store.load()
+        pdf_optimize_store.load_manifest()
+
+        jobs, pages, files = self.plan(force)
+        live_sources = {file.path for file in self.library.iter_files((".md",))}
+        self.sources = {path: record for path, record in self.sources.items() if path in live_sources}
+
+        rendered = 0
+        if jobs:
+            if self.workers > 1 and len(jobs) > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    chunksize = max(1, len(jobs) // (self.workers * 8))
+                    rendered = sum(pool.map(render_job, jobs, chunksize=chunksize))
+            else:
+                rendered = sum(render_job(job) for job in jobs)
+
+        linked = 0
+        for out_rel in files:
+            rel_path = out_rel.split("/", 2)[2]
+            source = self.root / rel_path
+            if rel_path.lower().endswith(".pdf"):
+                # Линеаризованная копия, если она построена для текущей версии файла
+                source = pdf_optimize_store.serving_path(rel_path, source)
+            if link_file(source, self.output_dir / out_rel):
+                linked += 1
+        for file in self.library.iter_files((".pdf",)):
+            record = thumbnail_store.records.get(file.path)
+            if record is None or not thumbnail_store.has_images(record.sha256):
+                continue
+            for variant in THUMBNAIL_VARIANTS:
+                out_rel = f"pdf/{variant}/{file.path}"
+                files.add(out_rel)
+                if link_file(thumbnail_store.image_path(record.sha256, variant), self.output_dir / out_rel):
+                    linked += 1
+        for rel_path, path in static_files().items():
+            out_rel = f"static/{rel_path}"
+            files.add(out_rel)
+            if link_file(path, self.output_dir / out_rel):
+                linked += 1
+
+        # Удаляем страницы и файлы, исчезнувшие из библиотеки
+        removed = 0
+        for out_rel in (set(self.pages) - set(pages)) | (self.files - files):
+            try:
+                (self.output_dir / out_rel).unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+        self.pages = pages
+        self.files = files
+        self.save_manifest()
+        return {
+            "pages": len(pages),
+            "rendered": rendered,
+            "files": len(files),
+            "linked": linked,
+            "removed": removed,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Статический экспорт библиотеки")
+    parser.add_argument("output", type=Path, help="Каталог для HTML-страниц и файлов")
+    parser.add_argument("--root", type=Path, default=None, help="Корень библиотеки (по умолчанию как у приложения)")
+    parser.add_argument("--workers", type=int, default=0, help="Число процессов рендеринга (0 - по числу ядер)")
+    parser.add_argument("--force", action="store_true", help="Перерисовать все страницы")
+    args = parser.parse_args()
+
+    if args.root:
+        config.LIBRARY_ROOT = str(args.root)
+    logging.basicConfig(level=logging.INFO)
+    exporter = LibraryExporter(args.output, library_index, args.workers)
+    print(json.dumps(exporter.export(force=args.force), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
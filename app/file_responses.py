@@ -0,0 +1,255 @@
+import hashlib
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from app import config
+from app.compression import compressed_response, is_compressible, negotiate
+from app.library import get_library_root
+from app.pdf_optimize import pdf_optimize_store
+from app.render_cache import is_not_modified
+
+# Больше диапазонов в одном запросе не обслуживаем - отдаём файл целиком
+MAX_RANGES = 16
+CHUNK_SIZE = 64 * 1024
+
+# Заголовок, которым отдача файла передаётся прокси, для каждого режима FILE_DELIVERY
+DELIVERY_HEADERS = {
+    "accel": "X-Accel-Redirect",
+    "sendfile": "X-Sendfile",
+}
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """Сильный валидатор: меняется при любом изменении mtime, размера или inode файла"""
+    base = f"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+    return '"' + hashlib.blake2b(base.encode(), digest_size=12).hexdigest() + '"'
+
+
+def _parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_range_header(header: str, size: int) -> Optional[list[tuple[int, int]]]:
+    """
+    Разбирает заголовок Range.
+    Возвращает список включительных диапазонов (start, end), пустой список,
+    если ни один диапазон не удовлетворим, или None, если заголовок нужно проигнорировать.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, sep, end_str = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_str == "":
+                # Суффиксный диапазон: последние N байт
+                length = int(end_str)
+                if length <= 0 or size == 0:
+                    # У пустого файла нет ни одного байта - диапазон неудовлетворим
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(start_str)
+                end = int(end_str) if end_str else size - 1
+                if end_str and end < start:
+                    return None
+                if start >= size:
+                    continue
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        ranges.append((start, end))
+
+    if not ranges:
+        return []
+
+    # Объединяем пересекающиеся и соседние диапазоны
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+class RangeFileResponse(Response):
+    """Ответ 206: один диапазон или multipart/byteranges для нескольких"""
+
+    def __init__(self, path: Path, ranges: list[tuple[int, int]], size: int,
+                 media_type: str, headers: dict, method: str = "GET"):
+        self.path = path
+        self.ranges = ranges
+        self.send_header_only = method.upper() == "HEAD"
+        self.parts: list[tuple[bytes, int, int]] = []
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            self.parts.append((b"", start, end))
+            content_length = end - start + 1
+            tail = b""
+            response_media_type = media_type
+        else:
+            boundary = secrets.token_hex(16)
+            content_length = 0
+            for start, end in ranges:
+                part_header = (
+                    f"\r\n--{boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                self.parts.append((part_header, start, end))
+                content_length += len(part_header) + end - start + 1
+            tail = f"\r\n--{boundary}--\r\n".encode("latin-1")
+            content_length += len(tail)
+            response_media_type = f"multipart/byteranges; boundary={boundary}"
+
+        self.tail = tail
+        self.status_code = 206
+        self.media_type = response_media_type
+        self.background = None
+        headers["Content-Length"] = str(content_length)
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for part_header, start, end in self.parts:
+                if part_header:
+                    await send({"type": "http.response.body", "body": part_header, "more_body": True})
+                await file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": self.tail, "more_body": False})
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def delivery_target(path: Path) -> Optional[str]:
+    """
+    Значение заголовка для прокси: внутренний адрес nginx (accel) или абсолютный путь (sendfile).
+    None - файл отдаётся приложением (режим app или файл вне известных прокси каталогов).
+    """
+    mode = config.FILE_DELIVERY
+    if mode not in DELIVERY_HEADERS:
+        return None
+    resolved = path.resolve()
+    if mode == "sendfile":
+        # X-Sendfile содержит путь как есть, без кодирования: пути не в ASCII отдаём сами
+        return str(resolved) if str(resolved).isascii() else None
+    for root, prefix in ((get_library_root(), config.FILE_DELIVERY_PREFIX),
+                         (pdf_optimize_store.storage_dir.resolve(), config.FILE_DELIVERY_LINEARIZED_PREFIX)):
+        if resolved.is_relative_to(root):
+            return prefix.rstrip("/") + "/" + quote(resolved.relative_to(root).as_posix())
+    return None
+
+
+def file_download_response(request: Request, path: Path, media_type: str,
+                           filename: Optional[str] = None) -> Response:
+    """
+    Отдаёт файл с поддержкой условных запросов (If-None-Match, If-Modified-Since),
+    Range / If-Range и multipart/byteranges.
+    В режимах accel/sendfile приложение только проверяет путь, а файл (вместе с Range,
+    условными запросами и сжатием) отдаёт прокси через sendfile.
+    """
+    target = delivery_target(path)
+    if target is not None:
+        headers = {DELIVERY_HEADERS[config.FILE_DELIVERY]: target}
+        if filename:
+            headers["Content-Disposition"] = content_disposition(filename)
+        return Response(media_type=media_type, headers=headers)
+
+    stat_result = path.stat()
+    etag = file_etag(stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+    }
+    if filename:
+        headers["Content-Disposition"] = content_disposition(filename)
+    if is_compressible(media_type):
+        headers["Vary"] = "Accept-Encoding"
+
+    # Условные запросы: If-None-Match имеет приоритет над If-Modified-Since
+    if is_not_modified(request, etag, stat_result.st_mtime_ns):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if not range_header:
+        # Текстовые документы отдаём сжатыми; диапазоны всегда считаются по исходным байтам
+        encoding = negotiate(request.headers, stat_result.st_size, media_type)
+        if encoding is not None:
+            return compressed_response(
+                key=f"file:{path}:{etag}",
+                etag=etag,
+                encoding=encoding,
+                load=path.read_bytes,
+                media_type=media_type,
+                headers=headers,
+                method=request.method,
+            )
+    else:
+        # If-Range: диапазон отдаётся только если у клиента та же версия файла
+        if_range = request.headers.get("if-range")
+        range_valid = True
+        if if_range:
+            if_range = if_range.strip()
+            if if_range.startswith('"') or if_range.startswith("W/"):
+                range_valid = if_range == etag
+            else:
+                range_valid = _parse_http_date(if_range) == int(stat_result.st_mtime)
+
+        if range_valid:
+            ranges = parse_range_header(range_header, stat_result.st_size)
+            if ranges == []:
+                return Response(
+                    status_code=416,
+                    headers={**headers, "Content-Range": f"bytes */{stat_result.st_size}"}
+                )
+            if ranges:
+                return RangeFileResponse(path, ranges, stat_result.st_size, media_type, headers,
+                                         method=request.method)
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result,
+                        method=request.method)
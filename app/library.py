@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import os
+import posixpath
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_library_root() -> Path:
+    """
+    Возвращает корень библиотеки документов.
+    Кандидаты проверяются один раз, результат запоминается на всё время работы процесса.
+    """
+    if config.LIBRARY_ROOT:
+        root = Path(config.LIBRARY_ROOT)
+        root.mkdir(parents=True, exist_ok=True)
+        return root.resolve()
+
+    base_dir = Path.cwd()
+
+    # Проверяем несколько вариантов расположения
+    possible_paths = [
+        base_dir / "pdf_uploads",
+        base_dir / "app" / "pdfs",
+        Path("pdf_uploads").resolve(),
+        Path("app/pdfs").resolve()
+    ]
+
+    for path in possible_paths:
+        if path.exists() and path.is_dir():
+            return path.resolve()
+
+    # Если директория не найдена, используем путь по умолчанию
+    default_path = base_dir / "pdf_uploads"
+    default_path.mkdir(parents=True, exist_ok=True)
+    return default_path.resolve()
+
+
+def normalize_folder(folder: Optional[str]) -> Optional[str]:
+    """
+    Приводит путь папки к виду 'a/b' относительно корня библиотеки.
+    Возвращает None, если путь выходит за пределы корня.
+    """
+    if not folder:
+        return ""
+    folder = folder.replace("\\", "/").strip("/")
+    if not folder:
+        return ""
+    normalized = posixpath.normpath(folder)
+    if normalized == ".":
+        return ""
+    if normalized == ".." or normalized.startswith("../") or normalized.startswith("/"):
+        return None
+    return normalized
+
+
+@dataclass(frozen=True)
+class FileEntry:
+    name: str
+    path: str
+    size: int
+    mtime_ns: int
+
+
+@dataclass
+class FolderEntry:
+    path: str
+    directories: list[str] = field(default_factory=list)
+    files: list[FileEntry] = field(default_factory=list)
+
+
+class LibraryIndex:
+    """
+    Индекс дерева библиотеки в памяти.
+    Строится один раз при старте и обновляется по событиям файловой системы;
+    списки папок отдаются без системных вызовов.
+    Номер поколения (generation) увеличивается при каждом изменении.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self._root = root
+        self._folders: dict[str, FolderEntry] = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.generation = 0
+        self.ready = False
+        self._listeners: list[Callable[[Optional[list[str]]], None]] = []
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            self._root = get_library_root()
+        return self._root
+
+    # --- Подписчики на изменения ---
+
+    def add_listener(self, callback: Callable[[Optional[list[str]]], None]) -> None:
+        """
+        Регистрирует обработчик изменений индекса.
+        Обработчик получает список изменённых абсолютных путей
+        или None после полного пересканирования.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, paths: Optional[list[str]]) -> None:
+        for callback in self._listeners:
+            try:
+                callback(paths)
+            except Exception as e:
+                logger.error(f"Library index listener failed: {str(e)}")
+
+    # --- Построение индекса ---
+
+    def _scan_folder(self, rel: str) -> Optional[tuple[FolderEntry, list[str]]]:
+        """Сканирует одну папку, возвращает её запись и список подпапок"""
+        abs_path = os.path.join(str(self.root), rel) if rel else str(self.root)
+        entry = FolderEntry(path=rel)
+        try:
+            with os.scandir(abs_path) as it:
+                for item in it:
+                    try:
+                        if item.is_dir():
+                            entry.directories.append(item.name)
+                        elif item.is_file():
+                            stat = item.stat()
+                            entry.files.append(FileEntry(
+                                name=item.name,
+                                path=f"{rel}/{item.name}" if rel else item.name,
+                                size=stat.st_size,
+                                mtime_ns=stat.st_mtime_ns,
+                            ))
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        entry.directories.sort(key=str.lower)
+        entry.files.sort(key=lambda f: f.name.lower())
+        return entry, [f"{rel}/{name}" if rel else name for name in entry.directories]
+
+    def _scan_tree(self, rel: str) -> dict[str, FolderEntry]:
+        """Рекурсивно сканирует поддерево, защищаясь от циклов по символическим ссылкам"""
+        folders: dict[str, FolderEntry] = {}
+        seen: set[tuple[int, int]] = set()
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            try:
+                stat = os.stat(os.path.join(str(self.root), current) if current else str(self.root))
+            except OSError:
+                continue
+            inode = (stat.st_dev, stat.st_ino)
+            if inode in seen:
+                continue
+            seen.add(inode)
+            scanned = self._scan_folder(current)
+            if scanned is None:
+                continue
+            entry, children = scanned
+            folders[current] = entry
+            stack.extend(children)
+        return folders
+
+    def build(self) -> None:
+        """Полностью перестраивает индекс"""
+        folders = self._scan_tree("")
+        with self._lock:
+            changed = folders != self._folders
+            self._folders = folders
+            if changed or not self.ready:
+                self.generation += 1
+            self.ready = True
+        self._notify(None)
+
+    def apply_changes(self, paths: Iterable[str]) -> None:
+        """
+        Точечно обновляет индекс по списку изменённых путей:
+        пересканируется только родительская папка каждого пути
+        и поддерево, если изменилась сама папка.
+        """
+        root = str(self.root)
+        paths = list(paths)
+        affected: set[str] = set()
+        for path in paths:
+            if not Path(os.path.abspath(path)).is_relative_to(self.root):
+                affected.add("")
+                continue
+            rel = os.path.relpath(path, root).replace("\\", "/")
+            if rel == ".":
+                affected.add("")
+                continue
+            affected.add(rel)
+            parent = posixpath.dirname(rel)
+            affected.add(parent)
+
+        updates: dict[str, Optional[dict[str, FolderEntry]]] = {}
+        for rel in sorted(affected, key=len):
+            abs_path = os.path.join(root, rel) if rel else root
+            if os.path.isdir(abs_path):
+                if rel in self._folders:
+                    scanned = self._scan_folder(rel)
+                    updates[rel] = {rel: scanned[0]} if scanned else None
+                else:
+                    updates[rel] = self._scan_tree(rel)
+            elif rel in self._folders:
+                updates[rel] = None
+
+        if not updates:
+            return
+
+        changed = False
+        with self._lock:
+            for rel, folders in updates.items():
+                if folders is None:
+                    # Папка удалена - убираем всё поддерево
+                    prefix = rel + "/"
+                    for key in [k for k in self._folders if k == rel or k.startswith(prefix)]:
+                        del self._folders[key]
+                        changed = True
+                else:
+                    for key, entry in folders.items():
+                        if self._folders.get(key) != entry:
+                            self._folders[key] = entry
+                            changed = True
+            if changed:
+                self.generation += 1
+        # Пакет без изменений (например, повторное событие о том же файле) не сбрасывает
+        # листинги и не будит подписчиков
+        if changed:
+            self._notify(paths)
+
+    # --- Чтение ---
+
+    def ensure_ready(self) -> None:
+        """Строит индекс при первом обращении, если он ещё не построен при старте"""
+        if not self.ready:
+            with self._build_lock:
+                if not self.ready:
+                    self.build()
+
+    def get_folder(self, folder: Optional[str]) -> Optional[FolderEntry]:
+        self.ensure_ready()
+        rel = normalize_folder(folder)
+        if rel is None:
+            return None
+        return self._folders.get(rel)
+
+    def has_folder(self, folder: Optional[str]) -> bool:
+        return self.get_folder(folder) is not None
+
+    def _subtree(self, folder: str) -> list[FolderEntry]:
+        """Записи папки folder и всех вложенных в неё папок"""
+        entries = []
+        stack = [folder]
+        while stack:
+            entry = self._folders.get(stack.pop())
+            if entry is None:
+                continue
+            entries.append(entry)
+            stack.extend(f"{entry.path}/{name}" if entry.path else name for name in entry.directories)
+        return entries
+
+    def iter_files(self, suffixes: tuple[str, ...] = (), folder: str = "") -> Iterable[FileEntry]:
+        """Файлы всей библиотеки или только поддерева папки folder"""
+        self.ensure_ready()
+        for entry in (self._subtree(folder) if folder else list(self._folders.values())):
+            for file in entry.files:
+                if not suffixes or file.name.lower().endswith(suffixes):
+                    yield file
+
+    def iter_folders(self) -> Iterable[FolderEntry]:
+        self.ensure_ready()
+        return list(self._folders.values())
+
+    def stats(self) -> dict:
+        return {
+            "generation": self.generation,
+            "folders": len(self._folders),
+            "files": sum(len(entry.files) for entry in self._folders.values()),
+        }
+
+
+library_index = LibraryIndex()
+
+
+async def watch_library(stop_event: asyncio.Event) -> None:
+    """
+    Поддерживает индекс в актуальном состоянии:
+    события watchfiles + периодическое полное пересканирование как запасной вариант
+    """
+    async def rescan_periodically():
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=config.LIBRARY_RESCAN_INTERVAL)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(library_index.build)
+
+    rescan_task = asyncio.create_task(rescan_periodically())
+    try:
+        if not config.LIBRARY_WATCH:
+            await stop_event.wait()
+            return
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            logger.warning("watchfiles is not installed, falling back to periodic rescans")
+            await stop_event.wait()
+            return
+
+        async for changes in awatch(str(library_index.root), stop_event=stop_event):
+            try:
+                await asyncio.to_thread(library_index.apply_changes, [path for _, path in changes])
+            except Exception as e:
+                logger.error(f"Error updating library index: {str(e)}")
+                await asyncio.to_thread(library_index.build)
+    finally:
+        rescan_task.cancel()
@@ -0,0 +1,206 @@
+"""
+Постраничная выдача содержимого папки для JSON API листингов.
+
+Отсортированные списки папки кэшируются до изменения индекса библиотеки (generation),
+поэтому запрос страницы не сортирует папку заново. Курсор хранит ключ сортировки
+последнего отданного элемента (а не смещение), так что добавление и удаление файлов
+между запросами не приводит к пропускам и повторам.
+"""
+import base64
+import binascii
+import bisect
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from app import config
+from app.library import FolderEntry, LibraryIndex, library_index
+
+SORT_FIELDS = ("name", "mtime", "size")
+ORDERS = ("asc", "desc")
+
+# Группы элементов: папки всегда идут перед файлами
+KIND_DIRECTORY = 0
+KIND_FILE = 1
+
+SORTED_CACHE_SIZE = 256
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или выдан для другого порядка сортировки"""
+
+
+@dataclass(frozen=True)
+class ListingItem:
+    kind: int
+    name: str
+    path: str
+    size: int = 0
+    mtime_ns: int = 0
+
+    @property
+    def is_directory(self) -> bool:
+        return self.kind == KIND_DIRECTORY
+
+
+def sort_key(item: ListingItem, sort: str) -> tuple:
+    """Ключ сортировки внутри группы; путь в конце делает порядок строгим и стабильным"""
+    if sort == "mtime":
+        return item.mtime_ns, item.name.lower(), item.path
+    if sort == "size":
+        return item.size, item.name.lower(), item.path
+    return item.name.lower(), item.path
+
+
+# Типы элементов ключа сортировки (см. sort_key) для проверки курсора
+SORT_KEY_TYPES = {
+    "name": (str, str),
+    "mtime": (int, str, str),
+    "size": (int, str, str),
+}
+
+
+def encode_cursor(sort: str, order: str, item: ListingItem) -> str:
+    payload = json.dumps([sort, order, item.kind, list(sort_key(item, sort))], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> tuple[int, tuple]:
+    """Возвращает (группа, ключ) последнего отданного элемента"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_order, kind, key = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if (cursor_sort, cursor_order) != (sort, order) or type(kind) is not int or kind not in (KIND_DIRECTORY, KIND_FILE):
+        raise InvalidCursor("Cursor does not match sort order")
+    # Ключ сравнивается с ключами папки в bisect: другой длины или с другими типами
+    # (null, bool вместо числа) он дал бы TypeError и ответ 500
+    types = SORT_KEY_TYPES[sort]
+    if not isinstance(key, list) or len(key) != len(types):
+        raise InvalidCursor("Malformed cursor")
+    if any(type(value) is not expected for value, expected in zip(key, types)):
+        raise InvalidCursor("Malformed cursor")
+    return kind, tuple(key)
+
+
+class SortedFolder:
+    """Элементы папки по группам, каждая отсортирована по возрастанию ключа"""
+
+    def __init__(self, entry: FolderEntry, suffixes: tuple[str, ...], sort: str):
+        directories = [
+            ListingItem(KIND_DIRECTORY, name, f"{entry.path}/{name}" if entry.path else name)
+            for name in entry.directories
+        ]
+        files = [
+            ListingItem(KIND_FILE, file.name, file.path, file.size, file.mtime_ns)
+            for file in entry.files
+            if file.name.lower().endswith(suffixes)
+        ]
+        self.groups: list[tuple[list[tuple], list[ListingItem]]] = []
+        for items in (directories, files):
+            items.sort(key=lambda item: sort_key(item, sort))
+            self.groups.append(([sort_key(item, sort) for item in items], items))
+
+    def count(self, kinds: tuple[int, ...], query: str = "") -> int:
+        """Число элементов выбранных групп, имя которых содержит query"""
+        if not query:
+            return sum(len(self.groups[kind][1]) for kind in kinds)
+        return sum(query in item.name.lower() for kind in kinds for item in self.groups[kind][1])
+
+
+@dataclass
+class ListingPage:
+    items: list[ListingItem]
+    next_cursor: Optional[str]
+    # Число элементов, подходящих под фильтры q и kind, во всех страницах
+    total: int
+
+
+class FolderLister:
+    """
+    Страницы содержимого папок из индекса библиотеки с сортировкой и фильтрацией.
+    Сортировка выполняется один раз на (папку, набор расширений, поле) и поколение индекса.
+    """
+
+    def __init__(self, library: LibraryIndex, cache_size: int = SORTED_CACHE_SIZE):
+        self.library = library
+        self.cache_size = cache_size
+        self._sorted: "OrderedDict[tuple, tuple[int, SortedFolder]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _sorted_folder(self, entry: FolderEntry, suffixes: tuple[str, ...], sort: str) -> SortedFolder:
+        key = (entry.path, suffixes, sort)
+        generation = self.library.generation
+        with self._lock:
+            cached = self._sorted.get(key)
+            if cached is not None and cached[0] == generation:
+                self._sorted.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        result = SortedFolder(entry, suffixes, sort)
+        with self._lock:
+            self._sorted[key] = (generation, result)
+            self._sorted.move_to_end(key)
+            while len(self._sorted) > self.cache_size:
+                self._sorted.popitem(last=False)
+        return result
+
+    def page(
+        self,
+        entry: FolderEntry,
+        suffixes: tuple[str, ...],
+        sort: str = "name",
+        order: str = "asc",
+        query: str = "",
+        kinds: tuple[int, ...] = (KIND_DIRECTORY, KIND_FILE),
+        cursor: Optional[str] = None,
+        limit: int = config.LISTING_PAGE_SIZE,
+    ) -> ListingPage:
+        if sort not in SORT_FIELDS or order not in ORDERS:
+            raise ValueError("Unsupported sort order")
+        folder = self._sorted_folder(entry, suffixes, sort)
+        descending = order == "desc"
+        query = query.strip().lower()
+
+        start_kind, start_key = decode_cursor(cursor, sort, order) if cursor else (KIND_DIRECTORY, None)
+        items: list[ListingItem] = []
+        last: Optional[ListingItem] = None
+        has_more = False
+        for kind in range(start_kind, len(folder.groups)):
+            if kind not in kinds:
+                continue
+            keys, group = folder.groups[kind]
+            # Позиция сразу после элемента курсора (только в его группе)
+            if kind == start_kind and start_key is not None:
+                index = bisect.bisect_left(keys, start_key) - 1 if descending else bisect.bisect_right(keys, start_key)
+            else:
+                index = len(group) - 1 if descending else 0
+            step = -1 if descending else 1
+            while 0 <= index < len(group):
+                item = group[index]
+                index += step
+                if query and query not in item.name.lower():
+                    continue
+                if len(items) == limit:
+                    has_more = True
+                    break
+                items.append(item)
+                last = item
+            if has_more:
+                break
+
+        next_cursor = encode_cursor(sort, order, last) if has_more and last is not None else None
+        return ListingPage(items=items, next_cursor=next_cursor, total=folder.count(kinds, query))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"folders": len(self._sorted), "hits": self.hits, "misses": self.misses}
+
+
+folder_lister = FolderLister(library_index)
@@ -1,51 +1,117 @@
+import asyncio
 import os
-import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from pathlib import Path
 
-from app.routers import pdfs, markdown
+from app import config
+from app.assets import DIST_DIR, VENDOR_DIR
+from app.compression import CompressedStaticFiles, variant_cache
+from app.executor import render_limiter, run_render
+from app.library import library_index, watch_library
+from app.listing import folder_lister
+from app.metrics import MetricsMiddleware, registry
+from app.render_cache import render_cache
+from app.rendering import block_cache, preload_renderer
+from app.routers import pdfs, markdown, search
+from app.pdf_optimize import pdf_optimizer
+from app.pdf_text import pdf_ingestor
+from app.search import search_index, start_search_index
+from app.templating import precompile_templates, template_stats, templates
+from app.thumbnails import thumbnail_generator
+from app.warmup import access_stats, hotset_warmer
+
+is_docker = config.IS_DOCKER
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Все шаблоны компилируются до первого запроса (из кэша байткода - без разбора исходников)
+    await asyncio.to_thread(precompile_templates)
+    # Строим индекс библиотеки один раз и дальше следим за изменениями
+    await asyncio.to_thread(library_index.build)
+    stop_event = asyncio.Event()
+
+    async def start_indexing():
+        # Поисковый индекс догружается в фоне, не задерживая старт,
+        # затем запускается извлечение текста из PDF
+        await asyncio.to_thread(start_search_index)
+        await pdf_ingestor.run(stop_event)
+
+    indexer = asyncio.create_task(start_indexing())
+    index_saver = asyncio.create_task(search_index.run(stop_event))
+    thumbnails = asyncio.create_task(thumbnail_generator.run(stop_event))
+    optimizer = asyncio.create_task(pdf_optimizer.run(stop_event))
+    watcher = asyncio.create_task(watch_library(stop_event))
+    # Markdown и Pygments не импортируются при старте; загружаем их в фоне до первого просмотра
+    preload = asyncio.create_task(run_render(preload_renderer))
+
+    # Прогрев самых посещаемых страниц: до приёма запросов или параллельно с ним
+    await asyncio.to_thread(access_stats.load)
+    stats_saver = asyncio.create_task(access_stats.run(stop_event))
+    warmup = asyncio.create_task(hotset_warmer.run(app, stop_event))
+    if config.WARMUP_BEFORE_TRAFFIC:
+        await warmup
+    try:
+        yield
+    finally:
+        stop_event.set()
+        watcher.cancel()
+        await asyncio.gather(indexer, index_saver, thumbnails, optimizer, warmup, stats_saver, preload,
+                             return_exceptions=True)
+        search_index.save()
 
-is_docker = os.environ.get('RUNNING_IN_DOCKER', 'false').lower() == 'true'
 
 if is_docker:
     app = FastAPI(
         title="Knowledge Library",
         description="Библиотека знаний - Просмотр документов в разных форматах",
         docs_url=None,
-        redoc_url=None
+        redoc_url=None,
+        lifespan=lifespan
     )
 else:
     app = FastAPI(
         title="Knowledge Library",
-        description="Библиотека знаний - Просмотр документов в разных форматах"
+        description="Библиотека знаний - Просмотр документов в разных форматах",
+        lifespan=lifespan
     )
 
-app.mount("/static", StaticFiles(directory="app/static", html=True), name="static")
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
-templates = Jinja2Templates(directory="app/templates")
+# Собранные файлы (python -m app.assets) могут лежать вне app/static - см. STATIC_BUILD_DIR
+app.mount("/static/dist", CompressedStaticFiles(directory=DIST_DIR, check_dir=False), name="static-dist")
+app.mount("/static/vendor", CompressedStaticFiles(directory=VENDOR_DIR, check_dir=False), name="static-vendor")
+app.mount("/static", CompressedStaticFiles(directory="app/static", html=True), name="static")
 
 # Обработчики ошибок
 @app.exception_handler(404)
 @app.exception_handler(StarletteHTTPException)
 async def custom_http_exception_handler(request: Request, exc: HTTPException):
+    if "/api/" in request.url.path:
+        # Клиентам API (загрузка, листинги) нужна причина ошибки, а не HTML-страница
+        return JSONResponse({"detail": exc.detail}, status_code=exc.status_code,
+                            headers=getattr(exc, "headers", None))
     if exc.status_code == 404:
         return templates.TemplateResponse(
             "404.html",
             {"request": request},
             status_code=404
         )
+    # Сохраняем заголовки исключения (например, Retry-After для 503)
     return templates.TemplateResponse(
         "404.html",
         {"request": request, "detail": str(exc.detail)},
-        status_code=exc.status_code
+        status_code=exc.status_code,
+        headers=getattr(exc, "headers", None)
     )
 
 app.include_router(pdfs.router)
 app.include_router(markdown.router)
+app.include_router(search.router)
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -55,6 +121,33 @@ async def home(request: Request):
 async def about(request: Request):
     return templates.TemplateResponse("about.html", {"request": request})
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Счётчики кэша отрендеренных страниц"""
+    return {"render": render_cache.stats(), "compression": variant_cache.stats(), "library": library_index.stats(),
+            "search": search_index.stats(),
+            "render_queue": render_limiter.stats(),
+            "thumbnails": thumbnail_generator.status(),
+            "pdf_optimize": pdf_optimizer.status(),
+            "listing": folder_lister.stats(),
+            "warmup": hotset_warmer.status(),
+            "templates": template_stats,
+            "markdown_blocks": block_cache.stats()}
+
+@app.get("/ready")
+async def ready():
+    """Готовность к трафику: 503, пока идёт прогрев после старта"""
+    status = hotset_warmer.status()
+    return JSONResponse({"ready": hotset_warmer.ready, "warmup": status},
+                        status_code=200 if hotset_warmer.ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.expose(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
 
@@ -0,0 +1,340 @@
+"""
+Метрики приложения в формате Prometheus и инструментирование горячего пути.
+
+Middleware измеряет задержку и объём ответа по маршрутам; внутри запроса
+фазы (чтение файла, конвертация Markdown, рендеринг шаблона) замеряются через phase().
+Файловые операции считаются аудит-хуком CPython (open, scandir, listdir и т.п.;
+stat аудитом не покрывается), поэтому run_io передаёт контекст запроса в пул потоков.
+"""
+import bisect
+import contextvars
+import io
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import config
+from app.warmup import WARMUP_HEADER
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Аудит-события, относящиеся к файловой системе
+FS_AUDIT_EVENTS = frozenset({
+    "open", "os.listdir", "os.scandir", "os.mkdir", "os.remove", "os.rename",
+    "os.rmdir", "os.link", "os.symlink", "os.truncate", "os.utime", "os.chmod", "os.chown",
+})
+
+PROFILE_HEADER = "x-profile"
+PROFILE_LINES = 40
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # Для каждого набора меток: счётчики по корзинам (последняя - +Inf), сумма
+        self._values: dict[tuple[tuple[str, str], ...], tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    """Набор метрик и функций, собирающих значения в момент запроса /metrics"""
+
+    def __init__(self):
+        self.metrics: list = []
+        self.collectors: list[Callable[[], Iterable[str]]] = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        self.collectors.append(collector)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        for collector in self.collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_latency = registry.histogram("library_request_duration_seconds", "Время обработки запроса")
+request_bytes = registry.counter("library_response_bytes_total", "Объём тела ответов")
+requests_total = registry.counter("library_requests_total", "Число запросов")
+phase_latency = registry.histogram("library_phase_duration_seconds", "Время фаз обработки запроса")
+fs_calls_total = registry.counter("library_fs_calls_total", "Файловые операции, выполненные при обработке запросов")
+
+
+class RequestMetrics:
+    """Счётчики одного запроса; общий объект для всех потоков, выполняющих его работу"""
+
+    __slots__ = ("phases", "fs_calls")
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.fs_calls = 0
+
+
+current_request: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar(
+    "current_request", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Замеряет фазу обработки запроса (file_read, markdown, template и т.д.)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        phase_latency.observe(elapsed, phase=name)
+        request = current_request.get()
+        if request is not None:
+            request.phases[name] = request.phases.get(name, 0.0) + elapsed
+
+
+def _audit_hook(event: str, args: tuple) -> None:
+    if event in FS_AUDIT_EVENTS:
+        request = current_request.get()
+        if request is not None:
+            request.fs_calls += 1
+
+
+_audit_installed = False
+
+
+def install_fs_audit() -> None:
+    """Аудит-хук нельзя снять, поэтому он ставится один раз"""
+    global _audit_installed
+    if not _audit_installed:
+        sys.addaudithook(_audit_hook)
+        _audit_installed = True
+
+
+def cache_collector() -> Iterable[str]:
+    """Счётчики кэшей и очереди рендеринга из их stats()"""
+    from app.compression import variant_cache
+    from app.executor import render_limiter
+    from app.library import library_index
+    from app.render_cache import render_cache
+    from app.thumbnails import thumbnail_store
+
+    render = render_cache.stats()
+    compression = variant_cache.stats()
+    queue = render_limiter.stats()
+    library = library_index.stats()
+    thumbnails = thumbnail_store.stats()
+    values = [
+        ("library_render_cache_hits_total", "counter", render["hits"]),
+        ("library_render_cache_misses_total", "counter", render["misses"]),
+        ("library_render_cache_evictions_total", "counter", render["evictions"]),
+        ("library_render_cache_hit_ratio", "gauge", render["hit_ratio"]),
+        ("library_render_cache_bytes", "gauge", render["size_bytes"]),
+        ("library_compression_cache_hits_total", "counter", compression["hits"]),
+        ("library_compression_cache_misses_total", "counter", compression["misses"]),
+        ("library_compression_cache_bytes", "gauge", compression["size_bytes"]),
+        ("library_render_inflight", "gauge", queue["inflight"]),
+        ("library_render_queued", "gauge", queue["queued"]),
+        ("library_render_rejected_total", "counter", queue["rejected"]),
+        ("library_thumbnail_cache_hits_total", "counter", thumbnails["hits"]),
+        ("library_thumbnail_cache_misses_total", "counter", thumbnails["misses"]),
+        ("library_thumbnail_cache_bytes", "gauge", thumbnails["size_bytes"]),
+        ("library_index_files", "gauge", library["files"]),
+        ("library_index_generation", "gauge", library["generation"]),
+    ]
+    for name, kind, value in values:
+        yield f"# TYPE {name} {kind}"
+        yield f"{name} {value}"
+
+
+registry.add_collector(cache_collector)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: задержка, объём ответа и файловые операции по маршрутам,
+    выборочные структурированные логи и профилирование по заголовку X-Profile
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_paths: dict = {}
+        if config.METRICS_FS_AUDIT:
+            install_fs_audit()
+
+    def _route_label(self, scope: Scope) -> str:
+        """Шаблон пути маршрута, чтобы число меток не зависело от числа файлов"""
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        label = self._route_paths.get(endpoint)
+        if label is None:
+            label = "unmatched"
+            for route in getattr(scope.get("app"), "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint:
+                    label = route.path
+                    break
+            self._route_paths[endpoint] = label
+        return label
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Запросы прогрева (warmup) не учитываются, как и в статистике посещений
+        if scope["type"] != "http" or any(name == WARMUP_HEADER for name, _ in scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        if config.PROFILING_ENABLED:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode() and value == b"1":
+                    await self._profile(scope, receive, send)
+                    return
+
+        request = RequestMetrics()
+        token = current_request.set(request)
+        status = 500
+        sent = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            route = self._route_label(scope)
+            request_latency.observe(elapsed, route=route)
+            requests_total.inc(route=route, status=str(status))
+            request_bytes.inc(sent, route=route)
+            if request.fs_calls:
+                fs_calls_total.inc(request.fs_calls, route=route)
+            if config.METRICS_LOG_SAMPLE > 0 and random.random() < config.METRICS_LOG_SAMPLE:
+                logger.info(json.dumps({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "bytes": sent,
+                    "fs_calls": request.fs_calls,
+                    "phases_ms": {name: round(value * 1000, 3) for name, value in request.phases.items()},
+                }, ensure_ascii=False))
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Выполняет запрос под cProfile и вместо тела ответа отдаёт сводку профиля"""
+        # Профилировщик нужен только при отладке - не импортируется при старте
+        import cProfile
+        import pstats
+
+        status = 500
+
+        async def discard(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.disable()
+
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        body = output.getvalue().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profiled-status", str(status).encode()),
+                (b"cache-control", b"no-store"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,235 @@
+import asyncio
+import bisect
+import importlib.util
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from app import config
+from app.background import BackgroundStage
+from app.library import FileEntry, library_index
+
+logger = logging.getLogger(__name__)
+
+# Словарь линеаризации находится в первом килобайте файла
+LINEARIZATION_RE = re.compile(rb"/Linearized\s.*?/E\s+(\d+)", re.DOTALL)
+LINEARIZATION_PROBE = 1024
+
+
+def first_page_end(path: str) -> Optional[int]:
+    """Конец секции первой страницы (/E) линеаризованного PDF или None"""
+    with open(path, "rb") as f:
+        match = LINEARIZATION_RE.search(f.read(LINEARIZATION_PROBE))
+    return int(match.group(1)) if match else None
+
+
+def _reference_ids(value) -> list[int]:
+    """Номера косвенных объектов в значении (ссылка или массив ссылок)"""
+    from pypdf.generic import ArrayObject, IndirectObject
+
+    if isinstance(value, IndirectObject):
+        return [value.idnum]
+    if isinstance(value, ArrayObject):
+        return [item.idnum for item in value if isinstance(item, IndirectObject)]
+    return []
+
+
+def page_byte_ranges(path: str) -> list[tuple[int, int]]:
+    """
+    Диапазон байт [start, end) каждой страницы: объект страницы, потоки содержимого
+    и изображения. Объекты из потоков объектов считаются по смещению самого потока.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    size = os.path.getsize(path)
+    offsets = {idnum: offset for table in reader.xref.values() for idnum, offset in table.items()}
+    for idnum, (stream_id, _) in getattr(reader, "xref_objStm", {}).items():
+        if stream_id in offsets:
+            offsets.setdefault(idnum, offsets[stream_id])
+    starts = sorted(set(offsets.values()))
+
+    def object_range(idnum: int) -> Optional[tuple[int, int]]:
+        start = offsets.get(idnum)
+        if start is None:
+            return None
+        index = bisect.bisect_right(starts, start)
+        return start, starts[index] if index < len(starts) else size
+
+    ranges = []
+    for page in reader.pages:
+        ids = [page.indirect_reference.idnum] if page.indirect_reference else []
+        ids += _reference_ids(page.raw_get("/Contents"))
+        resources = page.get("/Resources")
+        if resources is not None and "/XObject" in resources:
+            xobjects = resources["/XObject"]
+            ids += [idnum for name in xobjects for idnum in _reference_ids(xobjects.raw_get(name))]
+        spans = [span for span in map(object_range, ids) if span is not None]
+        ranges.append((min(s for s, _ in spans), max(e for _, e in spans)) if spans else (0, size))
+    return ranges
+
+
+def optimize_pdf(source: str, target: str) -> dict:
+    """
+    Сохраняет линеаризованную копию PDF (если исходник не линеаризован) и строит индекс страниц.
+    Выполняется в отдельном процессе пула, поэтому функция должна быть на уровне модуля.
+    """
+    import pikepdf
+
+    with pikepdf.open(source) as pdf:
+        linearized = pdf.is_linearized
+        if not linearized:
+            tmp_path = target + ".tmp"
+            pdf.save(tmp_path, linearize=True)
+            os.replace(tmp_path, target)
+
+    indexed = source if linearized else target
+    return {
+        "copy": not linearized,
+        "optimized_size": os.path.getsize(indexed),
+        "first_page_end": first_page_end(indexed),
+        "pages": page_byte_ranges(indexed),
+    }
+
+
+@dataclass
+class OptimizedRecord:
+    sha256: str
+    mtime_ns: int
+    size: int
+    copy: bool
+    optimized_size: int
+    first_page_end: Optional[int]
+    pages: list[list[int]] = field(default_factory=list)
+
+
+class PdfOptimizeStore:
+    """
+    Линеаризованные копии PDF (ключ - хэш содержимого) и постраничный индекс смещений.
+    Уже линеаризованные файлы не копируются, для них хранится только индекс.
+    """
+
+    def __init__(self, storage_dir: Path):
+        self.storage_dir = storage_dir
+        self.records: dict[str, OptimizedRecord] = {}
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.storage_dir / "manifest.json"
+
+    def copy_path(self, sha256: str) -> Path:
+        return self.storage_dir / f"{sha256}.pdf"
+
+    def load_manifest(self) -> None:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.records = {path: OptimizedRecord(**record) for path, record in data.items()}
+        except FileNotFoundError:
+            self.records = {}
+        except Exception as e:
+            logger.error(f"Error loading PDF optimization manifest: {str(e)}")
+            self.records = {}
+
+    def save_manifest(self) -> None:
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({path: asdict(record) for path, record in self.records.items()}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def remove_unused(self) -> None:
+        """Удаляет копии, на которые больше не ссылается ни один файл библиотеки"""
+        used = {record.sha256 for record in self.records.values() if record.copy}
+        if not self.storage_dir.exists():
+            return
+        for path in self.storage_dir.glob("*.pdf"):
+            if path.stem not in used:
+                path.unlink(missing_ok=True)
+
+    def current_record(self, rel_path: str, source: Path) -> Optional[OptimizedRecord]:
+        """Запись манифеста, если она построена для текущей версии исходника (по mtime и размеру)"""
+        record = self.records.get(rel_path)
+        if record is None:
+            return None
+        try:
+            stat = source.stat()
+        except FileNotFoundError:
+            return None
+        if record.mtime_ns != stat.st_mtime_ns or record.size != stat.st_size:
+            return None
+        return record
+
+    def serving_path(self, rel_path: str, source: Path) -> Path:
+        """Файл, который отдаётся вместо исходного: линеаризованная копия, если она готова, иначе исходник"""
+        record = self.current_record(rel_path, source)
+        if record is None or not record.copy:
+            return source
+        copy_path = self.copy_path(record.sha256)
+        return copy_path if copy_path.exists() else source
+
+    def page_index(self, rel_path: str, source: Path) -> Optional[dict]:
+        """Постраничный индекс смещений в отдаваемом файле"""
+        record = self.current_record(rel_path, source)
+        if record is None:
+            return None
+        return {
+            "size": record.optimized_size,
+            "first_page_end": record.first_page_end,
+            "pages": record.pages,
+        }
+
+
+class PdfOptimizer(BackgroundStage):
+    """
+    Фоновая стадия линеаризации PDF ("fast web view").
+    Копии строятся в пуле процессов и перестраиваются при изменении mtime/размера исходника;
+    при неизменном хэше содержимого готовая копия переиспользуется.
+    """
+
+    unavailable_message = "pikepdf is not installed, PDFs are served without linearization"
+    error_message = "Error linearizing"
+
+    @staticmethod
+    def available() -> bool:
+        return all(importlib.util.find_spec(name) is not None for name in ("pikepdf", "pypdf"))
+
+    def load(self) -> None:
+        self.store.load_manifest()
+
+    async def reconcile(self, pool: ProcessPoolExecutor) -> None:
+        """Сверяет PDF-файлы библиотеки с манифестом и обрабатывает только изменившиеся"""
+        _, removed, pending = self.scan()
+        await self.process(pool, pending)
+        if pending or removed:
+            await asyncio.to_thread(self.store.save_manifest)
+            await asyncio.to_thread(self.store.remove_unused)
+
+    async def process_file(self, pool: ProcessPoolExecutor, file: FileEntry) -> None:
+        full_path = self.library.root / file.path
+        sha256 = await self.content_hash(file)
+        previous = next((r for r in self.store.records.values() if r.sha256 == sha256), None)
+        if previous is not None and (not previous.copy or self.store.copy_path(sha256).exists()):
+            # То же содержимое уже обработано (например, файл переименован или скопирован)
+            result = {key: getattr(previous, key) for key in ("copy", "optimized_size", "first_page_end", "pages")}
+        else:
+            self.store.storage_dir.mkdir(parents=True, exist_ok=True)
+            result = await self.in_pool(pool, optimize_pdf, str(full_path), str(self.store.copy_path(sha256)))
+        self.store.records[file.path] = OptimizedRecord(
+            sha256=sha256, mtime_ns=file.mtime_ns, size=file.size,
+            copy=result["copy"], optimized_size=result["optimized_size"],
+            first_page_end=result["first_page_end"], pages=[list(span) for span in result["pages"]],
+        )
+
+    def status(self) -> dict:
+        copies = sum(1 for record in self.store.records.values() if record.copy)
+        return dict(super().status(), files=len(self.store.records), copies=copies)
+
+
+pdf_optimize_store = PdfOptimizeStore(Path(config.DATA_DIR) / "linearized")
+pdf_optimizer = PdfOptimizer(library_index, pdf_optimize_store, config.PDF_OPTIMIZE_WORKERS)
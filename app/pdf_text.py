@@ -0,0 +1,207 @@
+import asyncio
+import importlib.metadata
+import importlib.util
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from app import config
+from app.background import BackgroundStage
+from app.library import FileEntry, LibraryIndex, library_index
+from app.search import SearchIndex, search_index
+
+logger = logging.getLogger(__name__)
+
+# Версия извлечения текста: увеличивается при изменении extract_pdf_pages. Вместе с версией
+# pypdf определяет, нужно ли повторять извлечение для файлов, на которых оно упало
+EXTRACTOR_REVISION = 1
+
+
+def extractor_version() -> str:
+    try:
+        pypdf_version = importlib.metadata.version("pypdf")
+    except importlib.metadata.PackageNotFoundError:
+        pypdf_version = ""
+    return f"{EXTRACTOR_REVISION}:pypdf-{pypdf_version}"
+
+
+def extract_pdf_pages(path: str) -> list[str]:
+    """
+    Извлекает текст каждой страницы PDF.
+    Выполняется в отдельном процессе пула, поэтому функция должна быть на уровне модуля.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    pages = []
+    for page in reader.pages:
+        try:
+            pages.append(page.extract_text() or "")
+        except Exception:
+            pages.append("")
+    return pages
+
+
+@dataclass
+class PdfRecord:
+    sha256: str
+    mtime_ns: int
+    size: int
+    pages: int
+
+
+class PdfTextStore:
+    """
+    Постраничный текст PDF на диске, ключ - хэш содержимого.
+    Манифест связывает путь файла с хэшем, mtime и размером,
+    чтобы не пересчитывать хэш неизменённых файлов. Неудачные извлечения
+    запоминаются по хэшу содержимого (хэш -> версия извлечения).
+    """
+
+    def __init__(self, storage_dir: Path):
+        self.storage_dir = storage_dir
+        self.records: dict[str, PdfRecord] = {}
+        self.failures: dict[str, str] = {}
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.storage_dir / "manifest.json"
+
+    @property
+    def failures_path(self) -> Path:
+        return self.storage_dir / "failures.json"
+
+    def _content_path(self, sha256: str) -> Path:
+        return self.storage_dir / f"{sha256}.json"
+
+    def load_manifest(self) -> None:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.records = {path: PdfRecord(**record) for path, record in data.items()}
+        except FileNotFoundError:
+            self.records = {}
+        except Exception as e:
+            logger.error(f"Error loading PDF text manifest: {str(e)}")
+            self.records = {}
+        try:
+            with open(self.failures_path, "r", encoding="utf-8") as f:
+                self.failures = json.load(f)
+        except FileNotFoundError:
+            self.failures = {}
+        except Exception as e:
+            logger.error(f"Error loading PDF text failures: {str(e)}")
+            self.failures = {}
+
+    def save_manifest(self) -> None:
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        for path, data in ((self.manifest_path, {path: asdict(record) for path, record in self.records.items()}),
+                           (self.failures_path, self.failures)):
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+
+    def load_pages(self, sha256: str) -> Optional[list[str]]:
+        try:
+            with open(self._content_path(sha256), "r", encoding="utf-8") as f:
+                return json.load(f)["pages"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def save_pages(self, sha256: str, pages: list[str]) -> None:
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        path = self._content_path(sha256)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": pages}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class PdfIngestor(BackgroundStage):
+    """
+    Фоновая стадия извлечения текста из PDF.
+    Извлечение идёт в пуле процессов, цикл событий только ждёт результатов;
+    неизменённые файлы (по mtime/размеру, затем по хэшу) не обрабатываются повторно.
+    Файл, на котором извлечение упало, пропускается, пока не изменится его содержимое
+    или версия извлечения.
+    """
+
+    unavailable_message = "pypdf is not installed, PDF text extraction is disabled"
+    error_message = "Error extracting text from"
+
+    def __init__(self, library: LibraryIndex, search: SearchIndex, store: PdfTextStore, workers: int = 0):
+        super().__init__(library, store, workers)
+        self.search = search
+        self.extractor_version = ""
+
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec("pypdf") is not None
+
+    def load(self) -> None:
+        self.extractor_version = extractor_version()
+        self.store.load_manifest()
+
+    async def reconcile(self, pool: ProcessPoolExecutor) -> None:
+        """Сверяет PDF-файлы библиотеки с манифестом и обрабатывает только изменившиеся"""
+        current, removed, pending = self.scan()
+        for rel_path in removed:
+            self.search.remove_pdf(rel_path)
+
+        indexed = await asyncio.to_thread(self.search.pdf_paths)
+        changed = {file.path for file in pending}
+        for rel_path, file in current.items():
+            record = self.store.records.get(rel_path)
+            if rel_path in changed:
+                continue
+            failed_version = self.store.failures.get(record.sha256)
+            if failed_version is not None and failed_version != self.extractor_version:
+                # Извлечение упало в прошлой версии - пробуем новой
+                pending.append(file)
+            elif record.pages and rel_path not in indexed:
+                # Текст уже извлечён, но поисковый индекс потерян - восстанавливаем без извлечения
+                pending.append(file)
+
+        await self.process(pool, pending)
+        if pending:
+            # Неудачи храним только для содержимого, которое ещё есть в библиотеке
+            hashes = {record.sha256 for record in self.store.records.values()}
+            self.store.failures = {sha256: version for sha256, version in self.store.failures.items()
+                                   if sha256 in hashes}
+            await asyncio.to_thread(self.store.save_manifest)
+
+    async def process_file(self, pool: ProcessPoolExecutor, file: FileEntry) -> None:
+        sha256 = await self.content_hash(file)
+        pages = await asyncio.to_thread(self.store.load_pages, sha256)
+        if pages is None:
+            if self.store.failures.get(sha256) == self.extractor_version:
+                # Это содержимое уже не удалось разобрать - не повторяем до его изменения
+                self._record_failure(file, sha256)
+                return
+            try:
+                pages = await self.in_pool(pool, extract_pdf_pages, str(self.library.root / file.path))
+            except Exception:
+                self.store.failures[sha256] = self.extractor_version
+                self._record_failure(file, sha256)
+                raise
+            await asyncio.to_thread(self.store.save_pages, sha256, pages)
+        self.store.failures.pop(sha256, None)
+        await asyncio.to_thread(self.search.set_pdf_pages, file.path, pages, file.mtime_ns, file.size)
+        self.store.records[file.path] = PdfRecord(sha256, file.mtime_ns, file.size, len(pages))
+
+    def _record_failure(self, file: FileEntry, sha256: str) -> None:
+        """Запись без страниц: файл не попадёт в очередь, пока не изменятся его mtime или размер"""
+        self.search.remove_pdf(file.path)
+        self.store.records[file.path] = PdfRecord(sha256, file.mtime_ns, file.size, 0)
+
+    def status(self) -> dict:
+        return dict(super().status(), files=len(self.store.records), unreadable=len(self.store.failures))
+
+
+pdf_text_store = PdfTextStore(Path(config.DATA_DIR) / "pdf_text")
+pdf_ingestor = PdfIngestor(library_index, search_index, pdf_text_store, config.PDF_EXTRACT_WORKERS)
@@ -0,0 +1,212 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+
+from app import config
+from app.compression import compressed_response, etag_matches, negotiate
+from app.executor import render_flight, render_limiter, run_io
+from app.templating import build_fingerprint
+
+
+class PageKey(NamedTuple):
+    """
+    Ключ кэша: вариант рендера + путь к файлу + mtime и размер + версия сборки
+    (шаблоны, конвейер рендеринга, адреса статических файлов - см. build_fingerprint),
+    чтобы после обновления приложения браузеры не получали 304 на устаревший HTML
+    """
+    variant: str
+    path: str
+    mtime_ns: int
+    size: int
+    build: str = ""
+    build_mtime_ns: int = 0
+
+    @property
+    def etag(self) -> str:
+        digest = hashlib.blake2b(repr(tuple(self)).encode("utf-8"), digest_size=12).hexdigest()
+        return f'"{digest}"'
+
+    @property
+    def modified_ns(self) -> int:
+        """Страница меняется вместе с документом и вместе со сборкой"""
+        return max(self.mtime_ns, self.build_mtime_ns)
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.modified_ns / 1_000_000_000, usegmt=True)
+
+
+@dataclass
+class CachedPage:
+    body: bytes
+    etag: str
+    last_modified: str
+
+
+def page_key(variant: str, path: Path) -> PageKey:
+    """Строит ключ кэша по результату stat() файла"""
+    resolved = path.resolve()
+    stat = resolved.stat()
+    build, build_mtime_ns = build_fingerprint()
+    return PageKey(variant, str(resolved), stat.st_mtime_ns, stat.st_size, build, build_mtime_ns)
+
+
+class RenderCache:
+    """
+    LRU-кэш отрендеренных HTML-страниц с ограничением по памяти.
+    Для каждого (variant, path) хранится только последняя версия файла.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[PageKey, CachedPage]" = OrderedDict()
+        self._latest: dict[tuple[str, str], PageKey] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    def get(self, key: PageKey) -> Optional[CachedPage]:
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key: PageKey, body: bytes) -> CachedPage:
+        page = CachedPage(body=body, etag=key.etag, last_modified=key.last_modified)
+        if len(body) > self.max_bytes:
+            # Страница больше всего бюджета - не кэшируем
+            return page
+        with self._lock:
+            previous = self._latest.get((key.variant, key.path))
+            if previous is not None:
+                self._remove(previous)
+            self._entries[key] = page
+            self._latest[(key.variant, key.path)] = key
+            self._size += len(body)
+            while self._size > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return page
+
+    def record_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def _remove(self, key: PageKey) -> None:
+        page = self._entries.pop(key, None)
+        if page is None:
+            return
+        self._size -= len(page.body)
+        if self._latest.get((key.variant, key.path)) == key:
+            del self._latest[(key.variant, key.path)]
+
+    def invalidate(self, path: Path) -> None:
+        """Удаляет все варианты страницы для указанного файла"""
+        resolved = str(path.resolve())
+        with self._lock:
+            for key in [k for k in self._entries if k.path == resolved]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "not_modified": self.not_modified,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+render_cache = RenderCache(config.RENDER_CACHE_MAX_BYTES)
+
+
+def is_not_modified(request: Request, etag: str, mtime_ns: int) -> bool:
+    """Проверяет условные заголовки If-None-Match / If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime_ns / 1_000_000_000) <= since
+    return False
+
+
+def page_headers(key: PageKey) -> dict:
+    """Заголовки HTML-страницы документа: валидаторы версии и обязательная перепроверка"""
+    return {
+        "ETag": key.etag,
+        "Last-Modified": key.last_modified,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+
+async def cached_page_response(request: Request, variant: str, path: Path,
+                               render: Callable[[], Awaitable[str]]) -> Response:
+    """
+    Отдаёт HTML-страницу из кэша, рендерит её при промахе
+    или отвечает 304, если у клиента актуальная версия.
+    Одновременные промахи по одной версии страницы рендерятся один раз.
+    """
+    key = await run_io(page_key, variant, path)
+    headers = page_headers(key)
+
+    if is_not_modified(request, key.etag, key.modified_ns):
+        render_cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+
+    page = render_cache.get(key)
+    if page is None:
+        async def render_page() -> CachedPage:
+            async with render_limiter.slot():
+                html = await render()
+            return render_cache.put(key, html.encode("utf-8"))
+
+        page = await render_flight.do(key, render_page)
+
+    # Сжатые варианты страницы строятся один раз на версию документа
+    encoding = negotiate(request.headers, len(page.body), "text/html")
+    if encoding is not None:
+        return await run_io(
+            compressed_response,
+            key=f"page:{page.etag}",
+            etag=page.etag,
+            encoding=encoding,
+            load=lambda: page.body,
+            media_type="text/html",
+            headers=headers,
+            method=request.method,
+        )
+
+    return HTMLResponse(content=page.body, headers=headers)
@@ -0,0 +1,494 @@
+import codecs
+import hashlib
+import html
+import importlib.util
+import itertools
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from app import config
+
+# Markdown и Pygments импортируются при первом рендеринге или в фоне после старта
+# (preload_renderer): вместе это десятки миллисекунд импорта при запуске приложения
+MARKDOWN_AVAILABLE = importlib.util.find_spec("markdown") is not None
+PYGMENTS_AVAILABLE = importlib.util.find_spec("pygments") is not None
+
+# Порядок перебора кодировок; latin-1 декодирует любые байты и служит последним вариантом
+ENCODINGS = ("utf-8", "cp1251", "latin-1")
+
+# Блоки кода с указанным языком после fenced_code (содержимое уже экранировано)
+CODE_BLOCK_RE = re.compile(r'<pre><code class="language-([^"]+)">(.*?)</code></pre>', re.DOTALL)
+
+# Названия языков из заметок, которых нет среди псевдонимов Pygments
+LANGUAGE_ALIASES = {
+    "plaintext": "text",
+    "gitignore": "text",
+    "dockerignore": "text",
+    "cil": "text",
+    "env": "bash",
+    "dotenv": "bash",
+    "ps": "powershell",
+    "cmd": "batch",
+}
+
+# Тема Pygments, близкая к прежней atom-one-dark из highlight.js
+HIGHLIGHT_STYLE = "one-dark"
+
+# Версия конвейера рендеринга: меняется вместе с форматом HTML, чтобы статический экспорт перестроил страницы
+RENDERER_VERSION = 3
+
+# Границы разделов при потоковом рендеринге: заголовок ATX, ограждение блока кода
+# (как в fenced_code: с начала строки, закрывается той же последовательностью),
+# определение ссылки и начало элемента списка
+HEADING_LINE_RE = re.compile(r"#{1,6}(?:[ \t]|$)")
+FENCE_RE = re.compile(r"(?:~{3,}|`{3,})")
+REFERENCE_RE = re.compile(r" {0,3}\[[^\[\]]+\]:[ ]*\S")
+LIST_ITEM_RE = re.compile(r"(?:[*+-]|\d+[.)])[ \t]")
+
+# Идентификаторы заголовков, которые расставляет toc
+HEADING_ID_RE = re.compile(r'(<h[1-6] id=")([^"]*)(")')
+# Идентификатор с суффиксом, который toc добавляет повторяющимся заголовкам
+SUFFIXED_ID_RE = re.compile(r".*_[0-9]+")
+
+# Блочный HTML в начале строки разбирается препроцессором по всему документу
+# (блок может тянуться через пустые строки), такие документы конвертируются целиком
+RAW_HTML_LINE_RE = re.compile(r" {0,3}<[A-Za-z!?/]")
+# Открывающее ограждение в том виде, в каком его принимает fenced_code; другие строки
+# с ``` или ~~~ и незакрытые блоки кода fenced_code понимает иначе, чем _update_fence
+FENCE_OPENER_RE = re.compile(r"(?:~{3,}|`{3,})[ ]*(?:\{[^}\n]*\}|\.?[\w#.+-]*[ ]*)\r?\n?")
+# Строка, похожая на определение ссылки (в том числе внутри цитаты или с отступом)
+LOOSE_REFERENCE_RE = re.compile(r"[ \t>]*\[[^\[\]]*\]:")
+TOC_MARKER = "[TOC]"
+
+# Инкрементальный рендеринг: документ режется на блоки верхнего уровня, HTML каждого
+# блока запоминается по хэшу его текста. Граница блока зависит только от соседнего
+# текста (заголовок или хэш первой строки), поэтому правка сдвигает не больше
+# одной-двух границ и перерисовываются только изменённый блок и его соседи
+INCREMENTAL_MIN_SIZE = 4 * 1024
+BLOCK_MIN_SIZE = 1024
+BLOCK_MAX_SIZE = 64 * 1024
+BLOCK_BOUNDARY_MODULUS = 4
+
+# Документ без заголовков режется по пустым строкам, когда раздел вырос в несколько раз
+OVERSIZED_SECTION_FACTOR = 4
+
+DETECT_CHUNK_SIZE = 1024 * 1024
+
+# Определённая кодировка запоминается для каждого файла
+_detected_encodings: dict[str, str] = {}
+
+_local = threading.local()
+
+
+def decode_document(data: bytes, preferred: str = "utf-8") -> tuple[str, str]:
+    """Декодирует содержимое файла, начиная с предпочтительной кодировки"""
+    if data.startswith(codecs.BOM_UTF8):
+        return data[len(codecs.BOM_UTF8):].decode("utf-8"), "utf-8"
+    candidates = (preferred,) + tuple(e for e in ENCODINGS if e != preferred)
+    for encoding in candidates:
+        try:
+            return data.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Не удалось прочитать файл ни с одной из кодировок: {ENCODINGS}")
+
+
+def read_document(path: Path) -> str:
+    """Читает файл один раз в байтах и декодирует его, запоминая найденную кодировку"""
+    data = path.read_bytes()
+    key = str(path)
+    text, encoding = decode_document(data, _detected_encodings.get(key, "utf-8"))
+    _detected_encodings[key] = encoding
+    return text
+
+
+def detect_encoding(path: Path) -> str:
+    """
+    Кодировка файла без чтения его целиком в память: файл прогоняется
+    через инкрементальный декодер каждой кандидатной кодировки
+    """
+    key = str(path)
+    with open(path, "rb") as f:
+        if f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+            _detected_encodings[key] = "utf-8"
+            return "utf-8-sig"
+        preferred = _detected_encodings.get(key, "utf-8")
+        for encoding in (preferred,) + tuple(e for e in ENCODINGS if e != preferred):
+            f.seek(0)
+            decoder = codecs.getincrementaldecoder(encoding)()
+            try:
+                for chunk in iter(lambda: f.read(DETECT_CHUNK_SIZE), b""):
+                    decoder.decode(chunk)
+                decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                continue
+            _detected_encodings[key] = encoding
+            return encoding
+    raise ValueError(f"Не удалось прочитать файл ни с одной из кодировок: {ENCODINGS}")
+
+
+def _update_fence(line: str, fence: Optional[str]) -> Optional[str]:
+    """Открытое ограждение блока кода после строки line (None - вне блока)"""
+    match = FENCE_RE.match(line)
+    if match is None:
+        return fence
+    if fence is None:
+        return match.group(0)
+    if line.rstrip("\r\n").rstrip(" ") == fence:
+        return None
+    return fence
+
+
+def _starts_block(line: str) -> bool:
+    """
+    Строка после пустой строки начинает независимый блок верхнего уровня: не отступ
+    (код, продолжение списка), не таблица, цитата, HTML или элемент списка
+    (соседние цитаты и списки через пустую строку сливаются в один элемент) и не
+    определение ссылки (оно не даёт HTML, и следующий блок может продолжить предыдущий)
+    """
+    return (line[:1] not in ("", " ", "\t", "\r", "\n", "|", ">", "<")
+            and not LIST_ITEM_RE.match(line) and not LOOSE_REFERENCE_RE.match(line))
+
+
+def _reference_definitions(path: Path, encoding: str) -> list[str]:
+    """Определения ссылок [id]: url вне блоков кода - они нужны каждому разделу"""
+    definitions = []
+    fence = None
+    with open(path, encoding=encoding) as f:
+        for line in f:
+            if fence is None and REFERENCE_RE.match(line):
+                definitions.append(line.rstrip("\n"))
+            fence = _update_fence(line, fence)
+    return definitions
+
+
+def iter_markdown_sections(path: Path, section_size: int) -> Iterator[str]:
+    """
+    Исходный текст документа по разделам примерно по section_size символов.
+    Раздел заканчивается перед заголовком вне блока кода (а в документе без заголовков -
+    перед абзацем после пустой строки), так что разделы конвертируются независимо.
+    В памяти одновременно находится только один раздел.
+    """
+    encoding = detect_encoding(path)
+    definitions = _reference_definitions(path, encoding)
+    suffix = "\n\n" + "\n".join(definitions) + "\n" if definitions else ""
+
+    lines: list[str] = []
+    size = 0
+    fence = None
+    previous_blank = False
+    with open(path, encoding=encoding) as f:
+        for line in f:
+            if fence is None and size >= section_size and (
+                HEADING_LINE_RE.match(line)
+                or (size >= section_size * OVERSIZED_SECTION_FACTOR and previous_blank
+                    and _starts_block(line))
+            ):
+                yield "".join(lines) + suffix
+                lines, size = [], 0
+            fence = _update_fence(line, fence)
+            previous_blank = not line.strip()
+            lines.append(line)
+            size += len(line)
+    if lines:
+        yield "".join(lines) + suffix
+
+
+def unique_heading_ids(html_content: str, used_ids: set[str]) -> str:
+    """
+    Делает идентификаторы заголовков уникальными в пределах всего документа,
+    когда разделы конвертируются по отдельности (так же, как toc для целого документа)
+    """
+    if not MARKDOWN_AVAILABLE:
+        return html_content
+    from markdown.extensions.toc import unique as unique_id
+
+    return HEADING_ID_RE.sub(lambda m: m.group(1) + unique_id(m.group(2), used_ids) + m.group(3), html_content)
+
+
+def _get_converter():
+    """Экземпляр Markdown, переиспользуемый в пределах потока (или процесса пула)"""
+    converter = getattr(_local, "converter", None)
+    if converter is None:
+        import markdown
+        from markdown.extensions import fenced_code, tables
+
+        converter = markdown.Markdown(extensions=[
+            # Префикс языка нужен для поиска блоков кода при подсветке
+            fenced_code.FencedCodeExtension(lang_prefix='language-'),
+            tables.TableExtension(),
+            'toc',
+            'nl2br',
+        ])
+        _local.converter = converter
+    return converter
+
+
+def _get_code_formatter():
+    formatter = getattr(_local, "code_formatter", None)
+    if formatter is None:
+        from pygments.formatters import HtmlFormatter
+
+        formatter = HtmlFormatter(nowrap=True)
+        _local.code_formatter = formatter
+    return formatter
+
+
+def _highlight_block(match: re.Match) -> str:
+    """Подсвечивает один блок кода; неизвестный язык выводится как обычный текст"""
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+
+    # Атрибут и код уже экранированы Markdown: снимаем экранирование и экранируем ровно один раз при выводе
+    language, code = html.unescape(match.group(1)), match.group(2)
+    try:
+        lexer = get_lexer_by_name(LANGUAGE_ALIASES.get(language.lower(), language))
+    except ClassNotFound:
+        lexer = get_lexer_by_name("text")
+    highlighted = highlight(html.unescape(code), lexer, _get_code_formatter())
+    # Метка языка, которую раньше добавлял скрипт на странице
+    label = html.escape(language[:1].upper() + language[1:])
+    return (f'<pre class="highlight"><code class="language-{html.escape(language)}">{highlighted}</code>'
+            f'<div class="code-language-label">{label}</div></pre>')
+
+
+def highlight_code_blocks(html_content: str) -> str:
+    """Подсветка блоков кода на сервере (Pygments); без Pygments HTML возвращается как есть"""
+    if not PYGMENTS_AVAILABLE:
+        return html_content
+    return CODE_BLOCK_RE.sub(_highlight_block, html_content)
+
+
+def highlight_stylesheet() -> str:
+    """CSS темы подсветки (app/static/css/highlight.css генерируется этой функцией)"""
+    from pygments.formatters import HtmlFormatter
+
+    return "\n".join(HtmlFormatter(style=HIGHLIGHT_STYLE).get_token_style_defs(".highlight")) + "\n"
+
+
+def convert_markdown(content: str) -> str:
+    """Конвертация документа целиком: Markdown и подсветка кода"""
+    converter = _get_converter()
+    try:
+        html_content = converter.convert(content)
+    finally:
+        converter.reset()
+    return highlight_code_blocks(html_content)
+
+
+class BlockCache:
+    """HTML блоков документа по хэшу их исходного текста (LRU с бюджетом по размеру)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._blocks: OrderedDict[bytes, str] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text: str) -> str:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            cached = self._blocks.get(key)
+            if cached is not None:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        html_content = convert_markdown(text)
+        size = len(html_content) * 2 + len(key)
+        if size > self.max_bytes:
+            return html_content
+        with self._lock:
+            if key not in self._blocks:
+                self._blocks[key] = html_content
+                self._size += size
+            while self._size > self.max_bytes:
+                evicted_key, evicted = self._blocks.popitem(last=False)
+                self._size -= len(evicted) * 2 + len(evicted_key)
+        return html_content
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._blocks),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+block_cache = BlockCache(config.MARKDOWN_BLOCK_CACHE_MAX_BYTES)
+
+
+def _lines(content: str) -> Iterator[str]:
+    """Строки документа с переводами строк; делятся только по переводу строки, как у Python-Markdown"""
+    start = 0
+    while start < len(content):
+        end = content.find("\n", start)
+        end = len(content) if end < 0 else end + 1
+        yield content[start:end]
+        start = end
+
+
+def _breaks_split(line: str) -> bool:
+    """Строка вне блока кода, из-за которой документ нельзя конвертировать по частям"""
+    return bool(RAW_HTML_LINE_RE.match(line) or (FENCE_RE.match(line) and not FENCE_OPENER_RE.fullmatch(line)))
+
+
+def split_markdown_blocks(content: str) -> Optional[list[str]]:
+    """
+    Блоки документа, которые конвертируются независимо и в сумме дают тот же HTML,
+    что и документ целиком. Блок начинается после пустой строки вне блока кода перед
+    заголовком или строкой, хэш которой делится на BLOCK_BOUNDARY_MODULUS (не раньше
+    BLOCK_MIN_SIZE символов), либо когда блок вырос до BLOCK_MAX_SIZE.
+    None - документ нельзя резать (блочный HTML или маркер [TOC]).
+    """
+    if TOC_MARKER in content:
+        return None
+    blocks: list[str] = []
+    lines: list[str] = []
+    size = 0
+    fence = None
+    previous_blank = False
+    for line in _lines(content):
+        if fence is None:
+            if _breaks_split(line):
+                return None
+            if size >= BLOCK_MIN_SIZE and previous_blank and _starts_block(line) and (
+                HEADING_LINE_RE.match(line)
+                or zlib.crc32(line.encode("utf-8")) % BLOCK_BOUNDARY_MODULUS == 0
+                or size >= BLOCK_MAX_SIZE
+            ):
+                blocks.append("".join(lines))
+                lines, size = [], 0
+        fence = _update_fence(line, fence)
+        previous_blank = not line.strip()
+        lines.append(line)
+        size += len(line)
+    if fence is not None:
+        return None
+    if lines:
+        blocks.append("".join(lines))
+    return blocks
+
+
+def _block_references(lines: Iterable[str]) -> Optional[list[str]]:
+    """
+    Определения ссылок, которые добавляются к каждому блоку. None - определение нельзя
+    перенести одной строкой (вложено в цитату или список, продолжается на следующей
+    строке, не отделено пустыми строками или переопределяет ссылку иначе),
+    такой документ конвертируется целиком. Строки читаются по одной (с соседними)
+    """
+    from markdown.blockprocessors import ReferenceProcessor
+
+    definitions: dict[str, str] = {}
+    fence = None
+    previous, line = "", None
+    for following in itertools.chain(lines, ("",)):
+        if line is None:
+            line = following
+            continue
+        if fence is None and LOOSE_REFERENCE_RE.match(line):
+            text = line.rstrip("\r\n")
+            next_text = following.rstrip("\r\n")
+            match = ReferenceProcessor.RE.match(text + "\n" + next_text)
+            if not REFERENCE_RE.match(line) or match is None or match.end() != len(text):
+                return None
+            # Только отдельный абзац из определений: строку рядом с таблицей или списком
+            # Python-Markdown может не считать определением
+            if previous.strip() and not LOOSE_REFERENCE_RE.match(previous):
+                return None
+            if next_text.strip() and not LOOSE_REFERENCE_RE.match(next_text):
+                return None
+            if definitions.setdefault(match.group(1).lower(), text) != text:
+                return None
+        fence = _update_fence(line, fence)
+        previous, line = line, following
+    return list(definitions.values())
+
+
+def sections_are_safe(path: Path) -> bool:
+    """
+    Документ можно конвертировать по разделам (iter_markdown_sections) с тем же HTML,
+    что и целиком: те же условия, что у split_markdown_blocks и _block_references
+    (нет блочного HTML, маркера [TOC], нестандартных или незакрытых блоков кода
+    и сложных определений ссылок). Файл читается построчно
+    """
+    unsafe = False
+
+    def checked(f) -> Iterator[str]:
+        nonlocal unsafe
+        fence = None
+        for line in f:
+            if TOC_MARKER in line or (fence is None and _breaks_split(line)):
+                unsafe = True
+                return
+            fence = _update_fence(line, fence)
+            yield line
+        unsafe = fence is not None
+
+    with open(path, encoding=detect_encoding(path)) as f:
+        definitions = _block_references(checked(f))
+    return definitions is not None and not unsafe
+
+
+def render_markdown_blocks(content: str) -> str:
+    """
+    Инкрементальный рендеринг: блоки берутся из кэша, конвертируются только новые.
+    Идентификаторы заголовков (оглавление toc) пересчитываются по всему документу
+    из HTML блоков. Результат совпадает с конвертацией документа целиком.
+    """
+    blocks = split_markdown_blocks(content)
+    if blocks is None or len(blocks) < 2:
+        return convert_markdown(content)
+    # Определения ссылок нужны каждому блоку и входят в его ключ
+    definitions = _block_references(_lines(content))
+    if definitions is None:
+        return convert_markdown(content)
+    suffix = "\n\n" + "\n".join(definitions) + "\n" if definitions else ""
+
+    parts = []
+    for block in blocks:
+        html_block = block_cache.render(block + suffix)
+        ids = HEADING_ID_RE.findall(html_block)
+        if len(ids) > 1 and any(SUFFIXED_ID_RE.fullmatch(heading_id) for _, heading_id, _ in ids):
+            # toc уже сделал идентификаторы уникальными внутри блока - пересчёт по документу
+            # мог бы дать другие суффиксы, чем у целого документа
+            return convert_markdown(content)
+        if html_block:
+            parts.append(html_block)
+    return unique_heading_ids("\n".join(parts), set())
+
+
+def render_markdown(content: str) -> str:
+    """
+    Преобразует Markdown в HTML.
+    Общий конвейер для /pdf/view и /markdown/view; выполняется в пуле рендеринга.
+    Большие документы рендерятся по блокам с кэшем (см. render_markdown_blocks).
+    """
+    if not MARKDOWN_AVAILABLE:
+        # Если модуль не установлен, используем простой текстовый вывод
+        return f"<pre>{html.escape(content)}</pre>"
+    if block_cache.max_bytes > 0 and len(content) >= INCREMENTAL_MIN_SIZE:
+        return render_markdown_blocks(content)
+    return convert_markdown(content)
+
+
+def preload_renderer() -> None:
+    """Импортирует Markdown и Pygments и готовит конвертер, чтобы первый просмотр не ждал импорта"""
+    render_markdown("# preload\n\n```python\npass\n```\n")
@@ -1,42 +1,34 @@
 import os
-import markdown
 from fastapi import APIRouter, Request, HTTPException, Query
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, FileResponse, Response
 from pathlib import Path
 from typing import List, Optional
 
+from app.executor import run_io, run_render
+from app.file_responses import file_download_response
+from app import config
+from app.library import FolderEntry, get_library_root, library_index, normalize_folder
+from app.listing import KIND_DIRECTORY, KIND_FILE, ListingItem, ListingPage, folder_lister
+from app.metrics import phase
+from app.render_cache import cached_page_response
+from app.rendering import read_document, render_markdown
+from app.streaming import should_stream, streamed_page_response
+from app.templating import templates
+from app.warmup import record_access
+
 router = APIRouter(
     prefix="/markdown",
     tags=["markdown"],
     responses={404: {"description": "Not found"}},
 )
 
-templates = Jinja2Templates(directory="app/templates")
+
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
 
 # Используем ту же директорию, что и для PDF-файлов
 def get_markdown_dir():
     """Возвращает базовую директорию для Markdown-файлов"""
-    # Используем только директорию pdf_uploads и преобразуем в абсолютный путь
-    base_dir = Path.cwd()
-    
-    # Проверяем несколько вариантов расположения
-    possible_paths = [
-        base_dir / "pdf_uploads",
-        base_dir / "app" / "pdfs",
-        Path("pdf_uploads").resolve(),
-        Path("app/pdfs").resolve()
-    ]
-    
-    # Проверяем, что директория существует
-    for path in possible_paths:
-        if path.exists() and path.is_dir():
-            return path.resolve()  # Возвращаем абсолютный путь
-    
-    # Если директория не найдена, используем путь по умолчанию
-    default_path = base_dir / "pdf_uploads"
-    default_path.mkdir(parents=True, exist_ok=True)
-    return default_path.resolve()  # Возвращаем абсолютный путь
+    return get_library_root()
 
 
 def get_subfolder_path(subfolder: Optional[str] = None) -> Path:
@@ -85,95 +77,179 @@ def create_breadcrumbs(folder: Optional[str] = None):
     return breadcrumbs
 
 
+def resolve_library_file(file_path: str) -> Optional[Path]:
+    """
+    Возвращает абсолютный путь к файлу внутри базовой директории
+    или None, если файла нет или путь выходит за её пределы
+    """
+    base_dir = get_markdown_dir()
+    # Преобразуем путь к файлу в объект Path и убедимся, что он находится внутри базовой директории
+    full_path = (base_dir / file_path).resolve()
+    if not str(full_path).startswith(str(base_dir)) or not full_path.is_file():
+        return None
+    return full_path
+
+
+def get_folder_contents(entry: FolderEntry) -> tuple[list[dict], list[dict]]:
+    """Подпапки и Markdown файлы папки из индекса, уже отсортированные по имени"""
+    directories = [
+        {
+            "name": name,
+            "path": f"{entry.path}/{name}" if entry.path else name
+        }
+        for name in entry.directories
+    ]
+    markdown_files = [
+        {
+            "name": file.name,
+            "path": file.path
+        }
+        for file in entry.files
+        if file.name.lower().endswith(MARKDOWN_SUFFIXES)
+    ]
+    return directories, markdown_files
+
+
+def listing_item(item: ListingItem) -> dict:
+    """Элемент JSON API листинга"""
+    if item.is_directory:
+        return {"kind": "directory", "name": item.name, "path": item.path}
+    return {
+        "kind": "file",
+        "name": item.name,
+        "path": item.path,
+        "size": item.size,
+        "mtime": item.mtime_ns / 1_000_000_000
+    }
+
+
+def get_listing_folder(folder: Optional[str]) -> FolderEntry:
+    """Запись папки из индекса или HTTP-ошибка"""
+    current_folder = normalize_folder(folder)
+    if current_folder is None:
+        raise HTTPException(status_code=400, detail="Invalid folder path")
+    
+    entry = library_index.get_folder(current_folder)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    return entry
+
+
+def listing_page(entry: FolderEntry, sort: str, order: str, q: str, kind: str,
+                 cursor: Optional[str], limit: int) -> ListingPage:
+    """Страница содержимого папки; ошибки параметров превращаются в 400"""
+    kinds = {"all": (KIND_DIRECTORY, KIND_FILE), "dirs": (KIND_DIRECTORY,), "files": (KIND_FILE,)}
+    if kind not in kinds:
+        raise HTTPException(status_code=400, detail="Unsupported filter")
+    try:
+        return folder_lister.page(entry, MARKDOWN_SUFFIXES, sort=sort, order=order, query=q,
+                                  kinds=kinds[kind], cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/", response_class=HTMLResponse)
 async def list_markdown_files(
     request: Request, 
-    folder: Optional[str] = Query(None, description="Путь к папке для просмотра")
+    folder: Optional[str] = Query(None, description="Путь к папке для просмотра"),
+    sort: str = "name",
+    order: str = "asc",
+    q: str = ""
 ):
-    """Отображает список Markdown файлов в директории"""
-    current_dir = get_subfolder_path(folder)
-    breadcrumbs = create_breadcrumbs(folder)
+    """Отображает первую страницу списка Markdown файлов, остальные подгружаются через /markdown/api/list"""
+    entry = get_listing_folder(folder)
+    record_access(request, entry.path)
     
-    directories = []
-    markdown_files = []
-    
-    # Получаем содержимое директории
-    for file_path in current_dir.iterdir():
-        if file_path.is_dir():
-            rel_path = str(file_path.relative_to(get_markdown_dir())).replace("\\", "/")
-            directories.append({
-                "name": file_path.name,
-                "path": rel_path
-            })
-        elif file_path.suffix.lower() in ['.md', '.markdown']:
-            rel_path = str(file_path.relative_to(get_markdown_dir())).replace("\\", "/")
-            markdown_files.append({
-                "name": file_path.name,
-                "path": rel_path
-            })
-    
-    # Сортируем директории и файлы по имени
-    directories.sort(key=lambda x: x["name"].lower())
-    markdown_files.sort(key=lambda x: x["name"].lower())
+    breadcrumbs = create_breadcrumbs(folder)
+    page = listing_page(entry, sort, order, q, "all", None, config.LISTING_PAGE_SIZE)
+    items = [listing_item(item) for item in page.items]
     
     # Передаем данные в шаблон
     return templates.TemplateResponse(
         "markdown_list.html", 
         {
             "request": request, 
-            "markdown_files": markdown_files,
-            "directories": directories,
+            "markdown_files": [item for item in items if item["kind"] == "file"],
+            "directories": [item for item in items if item["kind"] == "directory"],
             "current_folder": folder or "",
-            "breadcrumbs": breadcrumbs
+            "breadcrumbs": breadcrumbs,
+            "listing": {
+                "api": "/markdown/api/list",
+                "next_cursor": page.next_cursor,
+                "total": page.total,
+                "sort": sort,
+                "order": order,
+                "q": q,
+            }
         }
     )
 
 
+@router.get("/api/list")
+async def list_markdown_api(
+    folder: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(config.LISTING_PAGE_SIZE, ge=1, le=config.LISTING_MAX_PAGE_SIZE),
+    sort: str = Query("name", description="name, mtime или size"),
+    order: str = Query("asc", description="asc или desc"),
+    q: str = Query("", description="Подстрока в имени"),
+    kind: str = Query("all", description="all, dirs или files")
+):
+    """Постраничный листинг Markdown файлов и подпапок в JSON (формат как у /pdf/api/list)"""
+    entry = get_listing_folder(folder)
+    page = listing_page(entry, sort, order, q, kind, cursor, limit)
+    return {
+        "folder": entry.path,
+        "items": [listing_item(item) for item in page.items],
+        "next_cursor": page.next_cursor,
+        "total": page.total,
+    }
+
+
 @router.get("/view/{file_path:path}", response_class=HTMLResponse)
 async def view_markdown(request: Request, file_path: str):
     """Просмотр Markdown файлов"""
-    print(f"MARKDOWN DEBUG: Accessing file_path = {file_path}")
-    
     try:
         # Базовая директория для PDF файлов
-        base_dir = Path("pdf_uploads")
-        full_path = base_dir / file_path
-        
-        print(f"MARKDOWN DEBUG: full_path = {full_path}")
-        print(f"MARKDOWN DEBUG: full_path.parent = {full_path.parent}")
+        base_dir = get_markdown_dir()
+        full_path = await run_io(resolve_library_file, file_path)
         
         # Проверяем, что файл существует и имеет расширение .md
-        if not full_path.exists() or not full_path.suffix.lower() == '.md':
+        if full_path is None or not full_path.suffix.lower() == '.md':
             raise HTTPException(status_code=404, detail="Markdown файл не найден")
-        
-        # Читаем содержимое файла
-        with open(full_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Преобразуем Markdown в HTML
-        html_content = markdown.markdown(
-            content, 
-            extensions=['extra', 'codehilite', 'tables']
-        )
+        record_access(request)
         
         # Получаем относительный путь к директории для кнопки "Назад"
         parent_folder = str(full_path.parent.relative_to(base_dir)).replace("\\", "/")
-        print(f"MARKDOWN DEBUG: parent_folder = '{parent_folder}'")
         
         # Формируем URL для кнопки "Назад"
         back_url = f"/pdf/?folder={parent_folder}" if parent_folder and parent_folder != "." else "/pdf/"
-        print(f"MARKDOWN DEBUG: back_url = '{back_url}'")
         
-        return templates.TemplateResponse(
-            "markdown_viewer.html", 
-            {
-                "request": request, 
-                "content": html_content,
-                "title": full_path.name,
-                "file_path": file_path,
-                "back_url": back_url
-            }
-        )
+        context = {
+            "request": request,
+            "title": full_path.name,
+            "file_path": file_path,
+            "back_url": back_url
+        }
+        template = templates.get_template("markdown_viewer.html")
+
+        # Большие документы отдаются по разделам, не собирая страницу в памяти
+        if await run_io(should_stream, full_path):
+            return await streamed_page_response(request, "markdown", full_path, template, context)
+
+        async def render_page() -> str:
+            # Читаем содержимое файла
+            with phase("file_read"):
+                content = await run_io(read_document, full_path)
+            
+            # Преобразуем Markdown в HTML в пуле рендеринга
+            with phase("markdown"):
+                html_content = await run_render(render_markdown, content)
+            
+            with phase("template"):
+                return await run_io(template.render, dict(context, content=html_content))
+        
+        return await cached_page_response(request, "markdown", full_path, render_page)
     except HTTPException:
         raise
     except Exception as e:
@@ -181,20 +257,20 @@ async def view_markdown(request: Request, file_path: str):
 
 
 @router.get("/download/{file_path:path}")
-async def download_markdown(file_path: str):
+async def download_markdown(request: Request, file_path: str):
     """Скачивание Markdown файла"""
-    base_dir = get_markdown_dir()
-    
     try:
-        # Преобразуем путь к файлу в объект Path и убедимся, что он находится внутри базовой директории
-        full_path = (base_dir / file_path).resolve()
+        # Путь проверяется и разрешается вне цикла событий
+        full_path = await run_io(resolve_library_file, file_path)
         
-        # Проверяем, что файл существует и находится внутри базовой директории
-        if not full_path.exists() or not str(full_path).startswith(str(base_dir)):
+        if full_path is None:
             raise HTTPException(status_code=404, detail="File not found")
         
+        # Этот маршрут отдаёт только Markdown: PDF и прочие файлы скачиваются через /pdf/download
         file_name = full_path.name
-        return FileResponse(full_path, filename=file_name)
+        if not file_name.lower().endswith(MARKDOWN_SUFFIXES):
+            raise HTTPException(status_code=400, detail="Unsupported file format")
+        return await run_io(file_download_response, request, full_path, "text/markdown", filename=file_name)
     except HTTPException:
         raise
     except Exception as e:
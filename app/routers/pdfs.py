@@ -1,42 +1,40 @@
 import os
-from fastapi import APIRouter, Request, HTTPException, Query
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
+from fastapi import APIRouter, Header, Request, HTTPException, Query
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from pathlib import Path
 from typing import List, Optional
+from urllib.parse import quote
 import logging
 
+from app import config
+from app.compression import etag_matches
+from app.executor import run_io, run_render
+from app.file_responses import content_disposition, file_download_response
+from app.library import FolderEntry, get_library_root, library_index, normalize_folder
+from app.listing import KIND_DIRECTORY, KIND_FILE, ListingItem, ListingPage, folder_lister
+from app.metrics import phase
+from app.pdf_optimize import pdf_optimize_store
+from app.render_cache import cached_page_response
+from app.rendering import read_document, render_markdown
+from app.streaming import should_stream, streamed_page_response
+from app.templating import templates
+from app.thumbnails import MEDIA_TYPE as THUMBNAIL_MEDIA_TYPE, thumbnail_generator, thumbnail_store
+from app.uploads import UploadReceiver, check_token, commit_files, multipart_boundary, prepare_folder
+from app.warmup import record_access
+from app.zip_stream import build_zip_stream, folder_archive_name
+
 router = APIRouter(
     prefix="/pdf",
     tags=["documents"]
 )
 
-# Templates
-templates = Jinja2Templates(directory="app/templates")
+# Документы, которые показываются в листинге
+DOCUMENT_SUFFIXES = ('.pdf', '.md')
 
-# Path to PDF files - проверяем несколько путей для совместимости
+# Path to PDF files - корень библиотеки определяется один раз при старте
 def get_pdf_dir():
     """Возвращает базовую директорию для PDF-файлов"""
-    # Используем только директорию pdf_uploads и преобразуем в абсолютный путь
-    base_dir = Path.cwd()
-    
-    # Проверяем несколько вариантов расположения
-    possible_paths = [
-        base_dir / "pdf_uploads",
-        base_dir / "app" / "pdfs",
-        Path("pdf_uploads").resolve(),
-        Path("app/pdfs").resolve()
-    ]
-    
-    # Проверяем, что директория существует
-    for path in possible_paths:
-        if path.exists() and path.is_dir():
-            return path.resolve()  # Возвращаем абсолютный путь
-    
-    # Если директория не найдена, используем путь по умолчанию
-    default_path = base_dir / "pdf_uploads"
-    default_path.mkdir(parents=True, exist_ok=True)
-    return default_path.resolve()  # Возвращаем абсолютный путь
+    return get_library_root()
 
 
 def get_subfolder_path(subfolder: Optional[str] = None) -> Path:
@@ -79,46 +77,72 @@ def create_breadcrumbs(subfolder: Optional[str] = None) -> List[dict]:
     return breadcrumbs
 
 
-def get_pdf_files(directory: str) -> list[dict]:
+def file_item(name: str, path: str) -> dict:
+    """Карточка PDF или Markdown файла для листинга"""
+    # Определяем тип файла для иконки
+    file_type = 'pdf' if name.lower().endswith('.pdf') else 'markdown'
+    return {
+        'kind': 'file',
+        'name': name,
+        'path': path,
+        'encoded_path': path,  # Добавляем полный путь для URL
+        'type': file_type,
+        # Миниатюра первой страницы, если фоновая генерация уже её подготовила
+        'thumb_url': thumbnail_store.url_for(path) if file_type == 'pdf' else None
+    }
+
+
+def directory_item(name: str, rel_path: str) -> dict:
+    """Карточка подпапки для листинга"""
+    return {
+        "kind": "directory",
+        "name": name,
+        "path": f"/pdf/?folder={rel_path}",
+        "folder": rel_path,
+        "icon": "fas fa-folder"
+    }
+
+
+def get_pdf_files(folder: str) -> list[dict]:
     """
-    Получает список PDF и Markdown файлов в указанной директории
+    Получает список PDF и Markdown файлов в указанной папке из индекса библиотеки
     """
-    files = []
-    base_dir = str(get_pdf_dir())  # Преобразуем Path в строку
-    
-    for file in os.listdir(directory):
-        file_path = os.path.join(directory, file)
-        if os.path.isfile(file_path) and (file.lower().endswith('.pdf') or file.lower().endswith('.md')):
-            # Определяем тип файла для иконки
-            file_type = 'pdf' if file.lower().endswith('.pdf') else 'markdown'
-            # Используем полный путь для корректного URL-кодирования
-            rel_path = os.path.relpath(file_path, base_dir).replace('\\', '/')
-            files.append({
-                'name': file,
-                'path': rel_path,
-                'encoded_path': rel_path,  # Добавляем полный путь для URL
-                'type': file_type
-            })
-    return sorted(files, key=lambda x: x['name'].lower())
-
-
-def get_directories(directory: str) -> list[dict]:
+    entry = library_index.get_folder(folder)
+    if entry is None:
+        return []
+    return [file_item(file.name, file.path) for file in entry.files
+            if file.name.lower().endswith(DOCUMENT_SUFFIXES)]
+
+
+def get_directories(folder: str) -> list[dict]:
     """
-    Получает список подпапок в указанной директории
+    Получает список подпапок в указанной папке из индекса библиотеки
     """
-    directories = []
-    base_dir = get_pdf_dir()  # Получаем базовую директорию
-    
-    for dir_path in Path(directory).iterdir():
-        if dir_path.is_dir():
-            # Используем str() для обоих путей перед relative_to
-            rel_path = os.path.relpath(str(dir_path), str(base_dir)).replace("\\", "/")
-            directories.append({
-                "name": dir_path.name,
-                "path": f"/pdf/?folder={rel_path}",
-                "icon": "fas fa-folder"
-            })
-    return sorted(directories, key=lambda x: x["name"])
+    entry = library_index.get_folder(folder)
+    if entry is None:
+        return []
+    return [directory_item(name, f"{entry.path}/{name}" if entry.path else name) for name in entry.directories]
+
+
+def listing_item(item: ListingItem) -> dict:
+    """Элемент JSON API листинга: карточка плюс размер и время изменения"""
+    if item.is_directory:
+        return directory_item(item.name, item.path)
+    return dict(file_item(item.name, item.path), size=item.size, mtime=item.mtime_ns / 1_000_000_000)
+
+
+def listing_page(entry: FolderEntry, sort: str, order: str, q: str, kind: str, file_type: str,
+                 cursor: Optional[str], limit: int) -> ListingPage:
+    """Страница содержимого папки; ошибки параметров превращаются в 400"""
+    kinds = {"all": (KIND_DIRECTORY, KIND_FILE), "dirs": (KIND_DIRECTORY,), "files": (KIND_FILE,)}
+    suffixes = {"all": DOCUMENT_SUFFIXES, "pdf": ('.pdf',), "markdown": ('.md',)}
+    if kind not in kinds or file_type not in suffixes:
+        raise HTTPException(status_code=400, detail="Unsupported filter")
+    try:
+        return folder_lister.page(entry, suffixes[file_type], sort=sort, order=order, query=q,
+                                  kinds=kinds[kind], cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 def generate_breadcrumbs(folder: str) -> List[dict]:
@@ -143,25 +167,39 @@ def generate_breadcrumbs(folder: str) -> List[dict]:
     return breadcrumbs
 
 
+def get_listing_folder(folder: str) -> FolderEntry:
+    """Запись папки из индекса или HTTP-ошибка"""
+    current_folder = normalize_folder(folder)
+    
+    # Проверка на выход за пределы корневой директории
+    if current_folder is None:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    entry = library_index.get_folder(current_folder)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Directory not found")
+    return entry
+
+
 @router.get("/", response_class=HTMLResponse)
-async def list_pdfs(request: Request, folder: str = ""):
+async def list_pdfs(
+    request: Request,
+    folder: str = "",
+    sort: str = "name",
+    order: str = "asc",
+    q: str = ""
+):
     """
-    Выводит список PDF и Markdown файлов и подпапок в директории
+    Выводит список PDF и Markdown файлов и подпапок в директории.
+    В HTML попадает только первая страница, остальные подгружаются через /pdf/api/list
     """
     try:
-        base_dir = str(get_pdf_dir())  # Преобразуем Path в строку
-        current_dir = os.path.normpath(os.path.join(base_dir, folder))
-        
-        # Проверка на выход за пределы корневой директории
-        if not current_dir.startswith(base_dir):
-            raise HTTPException(status_code=403, detail="Access denied")
-            
-        if not os.path.exists(current_dir) or not os.path.isdir(current_dir):
-            raise HTTPException(status_code=404, detail="Directory not found")
+        entry = get_listing_folder(folder)
+        record_access(request, entry.path)
         
-        # Получаем списки директорий и файлов
-        directories = get_directories(current_dir)
-        files = get_pdf_files(current_dir)
+        # Первая страница из индекса, без обращения к диску
+        page = listing_page(entry, sort, order, q, "all", "all", None, config.LISTING_PAGE_SIZE)
+        items = [listing_item(item) for item in page.items]
         
         # Генерируем хлебные крошки
         breadcrumbs = generate_breadcrumbs(folder)
@@ -170,10 +208,18 @@ async def list_pdfs(request: Request, folder: str = ""):
             "pdf_list.html",
             {
                 "request": request,
-                "files": files,
-                "directories": directories,
+                "files": [item for item in items if item["kind"] == "file"],
+                "directories": [item for item in items if item["kind"] == "directory"],
                 "breadcrumbs": breadcrumbs,
-                "current_folder": folder
+                "current_folder": folder,
+                "listing": {
+                    "api": "/pdf/api/list",
+                    "next_cursor": page.next_cursor,
+                    "total": page.total,
+                    "sort": sort,
+                    "order": order,
+                    "q": q,
+                }
             }
         )
     except HTTPException as e:
@@ -183,6 +229,80 @@ async def list_pdfs(request: Request, folder: str = ""):
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@router.get("/api/list")
+async def list_pdfs_api(
+    folder: str = "",
+    cursor: Optional[str] = None,
+    limit: int = Query(config.LISTING_PAGE_SIZE, ge=1, le=config.LISTING_MAX_PAGE_SIZE),
+    sort: str = Query("name", description="name, mtime или size"),
+    order: str = Query("asc", description="asc или desc"),
+    q: str = Query("", description="Подстрока в имени"),
+    kind: str = Query("all", description="all, dirs или files"),
+    file_type: str = Query("all", alias="type", description="all, pdf или markdown")
+):
+    """
+    Постраничный листинг папки в JSON.
+    Порядок стабилен: папки, затем файлы, при равных ключах - по пути;
+    next_cursor передаётся в следующий запрос, пока не станет null
+    """
+    entry = get_listing_folder(folder)
+    page = listing_page(entry, sort, order, q, kind, file_type, cursor, limit)
+    return {
+        "folder": entry.path,
+        "items": [listing_item(item) for item in page.items],
+        "next_cursor": page.next_cursor,
+        "total": page.total,
+    }
+
+
+@router.post("/api/upload")
+async def upload_documents(
+    request: Request,
+    folder: str = "",
+    overwrite: bool = False,
+    authorization: Optional[str] = Header(None),
+    x_upload_token: Optional[str] = Header(None)
+):
+    """
+    Загрузка PDF и Markdown в папку библиотеки (multipart/form-data, один или несколько файлов).
+    Тело пишется на диск по мере приёма; файл с уже имеющимся в библиотеке содержимым
+    повторно не сохраняется (duplicate: true и путь существующего файла)
+    """
+    check_token(authorization, x_upload_token)
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > config.UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Upload is too large")
+    boundary = multipart_boundary(request.headers.get("content-type"))
+    rel_folder, directory, staging = await run_io(prepare_folder, folder)
+
+    receiver = UploadReceiver(staging, boundary, config.UPLOAD_MAX_BYTES)
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await run_io(receiver.feed, chunk)
+        files = await run_io(receiver.finish)
+    except BaseException:
+        # Ошибка, обрыв соединения или отмена: недописанные файлы удаляются
+        receiver.abort()
+        raise
+
+    results = await run_io(commit_files, rel_folder, directory, files, overwrite)
+    return JSONResponse(
+        status_code=201 if any(not result.duplicate for result in results) else 200,
+        content={"files": [
+            {
+                "name": result.name,
+                "path": result.path,
+                "url": f"/pdf/view/{result.path}",
+                "size": result.size,
+                "sha256": result.sha256,
+                "duplicate": result.duplicate,
+            }
+            for result in results
+        ]},
+    )
+
+
 @router.get("/view/{file_path:path}")
 async def view_pdf(request: Request, file_path: str):
     """View a PDF or Markdown file"""
@@ -196,91 +316,61 @@ async def view_pdf(request: Request, file_path: str):
         if folder:
             folder = folder.replace("\\", "/")
         
-        print(f"PDF DEBUG: file_path = {file_path}")
-        print(f"PDF DEBUG: file_parts.parent = {file_parts.parent}")
-        print(f"PDF DEBUG: folder = '{folder}'")
-        
-        # Получаем полный путь к файлу
-        base_dir = get_subfolder_path(folder)
+        # Получаем полный путь к файлу (resolve и stat выполняются вне цикла событий)
+        base_dir = await run_io(get_subfolder_path, folder)
         file_path_full = base_dir / file_name
         
-        if not file_path_full.exists():
+        if not await run_io(file_path_full.exists):
             raise HTTPException(status_code=404, detail="File not found")
+        record_access(request)
         
         # Формируем URL для загрузки
-        download_url = f"/pdf/download/{file_path}"
+        download_url = f"/pdf/download/{quote(file_path)}"
         back_url = f"/pdf/?folder={folder}" if folder else "/pdf/"
         
-        print(f"PDF DEBUG: back_url = '{back_url}'")
-        
         # В зависимости от типа файла выбираем шаблон
         if file_name.lower().endswith('.md'):
-            # Читаем содержимое Markdown файла
+            context = {
+                "request": request, 
+                "title": file_path_full.stem.replace("_", " ").title(), 
+                "back_url": back_url,
+                "file_path": file_path  # Добавляем путь к файлу для скачивания
+            }
+            template = templates.get_template("markdown_viewer.html")
+
+            # Большие документы отдаются по разделам, не собирая страницу в памяти
+            if await run_io(should_stream, file_path_full):
+                return await streamed_page_response(request, "pdf-markdown", file_path_full, template, context)
+
+            async def render_page() -> str:
+                with phase("file_read"):
+                    content = await run_io(read_document, file_path_full)
+                with phase("markdown"):
+                    html_content = await run_render(render_markdown, content)
+                with phase("template"):
+                    return await run_io(template.render, dict(context, content=html_content))
+
+            # Читаем и рендерим Markdown только при промахе кэша
             try:
-                # Пробуем разные кодировки для чтения файла
-                encodings = ['utf-8', 'cp1251', 'latin-1']
-                content = None
-                
-                for encoding in encodings:
-                    try:
-                        with open(file_path_full, 'r', encoding=encoding) as file:
-                            content = file.read()
-                        break  # Если успешно прочитали, выходим из цикла
-                    except UnicodeDecodeError:
-                        continue
-                
-                if content is None:
-                    raise ValueError(f"Не удалось прочитать файл ни с одной из кодировок: {encodings}")
-                
-                # Импортируем markdown при необходимости
-                try:
-                    import markdown
-                    from markdown.extensions import codehilite, fenced_code, tables
-                    
-                    # Конфигурируем расширения без проблемных параметров
-                    # Используем только префикс языка, остальные параметры не применяем
-                    fenced_code_ext = fenced_code.FencedCodeExtension(lang_prefix='language-')
-                    tables_ext = tables.TableExtension()
-                    
-                    # Преобразуем Markdown в HTML с сохранением информации о языке программирования
-                    # Заменяем форматирование блоков кода для лучшей интеграции с highlight.js
-                    html_content = markdown.markdown(
-                        content, 
-                        extensions=[fenced_code_ext, tables_ext, 'toc', 'nl2br']
-                    )
-                    
-                    # Дополнительная обработка для Dockerfile и других специальных языков
-                    import re
-                    # Заменить dockerfile на language-dockerfile для корректной подсветки
-                    html_content = re.sub(r'<code class=[\'"]dockerfile[\'"]>', '<code class="language-dockerfile">', html_content)
-                except ImportError:
-                    # Если модуль не установлен, используем простой текстовый вывод
-                    html_content = f"<pre>{content}</pre>"
-                
-                return templates.TemplateResponse(
-                    "markdown_viewer.html", 
-                    {
-                        "request": request, 
-                        "title": file_path_full.stem.replace("_", " ").title(), 
-                        "content": html_content,
-                        "back_url": back_url,
-                        "file_path": file_path  # Добавляем путь к файлу для скачивания
-                    }
-                )
+                return await cached_page_response(request, "pdf-markdown", file_path_full, render_page)
+            except HTTPException:
+                raise
             except Exception as e:
                 logging.error(f"Error reading markdown file: {str(e)}")
                 raise HTTPException(status_code=500, detail="Error reading markdown file")
         elif file_name.lower().endswith('.pdf'):
             # Отображение PDF-файла
-            return templates.TemplateResponse(
-                "pdf_viewer.html", 
-                {
-                    "request": request, 
-                    "pdf_name": file_path_full.stem.replace("_", " ").title(), 
-                    "pdf_url": download_url,
-                    "back_url": back_url
-                }
-            )
+            async def render_viewer() -> str:
+                with phase("template"):
+                    return await run_io(templates.get_template("pdf_viewer.html").render, {
+                        "request": request, 
+                        "pdf_name": file_path_full.stem.replace("_", " ").title(), 
+                        "pdf_url": download_url,
+                        "preview_url": f"/pdf/preview/{quote(file_path)}",
+                        "back_url": back_url
+                    })
+
+            return await cached_page_response(request, "pdf-viewer", file_path_full, render_viewer)
         else:
             raise HTTPException(status_code=400, detail="Unsupported file format")
     except HTTPException as e:
@@ -290,8 +380,95 @@ async def view_pdf(request: Request, file_path: str):
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+async def thumbnail_response(request: Request, file_path: str, variant: str) -> Response:
+    """Изображение первой страницы PDF из дискового кэша"""
+    found = await run_io(thumbnail_store.lookup, file_path, variant)
+    if found is None:
+        # Изображение могло быть вытеснено из кэша - рендерим заново к следующему запросу
+        thumbnail_generator.request(file_path)
+        raise HTTPException(status_code=404, detail="Preview not ready")
+    image_path, record = found
+    etag = f'"{record.sha256[:32]}-{variant}"'
+    # Версионированный адрес (?v=хэш) не меняется, пока не изменится содержимое PDF
+    if request.query_params.get("v") == record.sha256[:16]:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=0, must-revalidate"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(image_path, media_type=THUMBNAIL_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/thumb/{file_path:path}")
+async def pdf_thumbnail(request: Request, file_path: str):
+    """Миниатюра первой страницы для листинга"""
+    return await thumbnail_response(request, file_path, "thumb")
+
+
+@router.get("/preview/{file_path:path}")
+async def pdf_preview(request: Request, file_path: str):
+    """Превью первой страницы, которое просмотрщик показывает до загрузки pdf.js"""
+    return await thumbnail_response(request, file_path, "preview")
+
+
+def collect_folder_files(folder: str) -> list[tuple[str, Path]]:
+    """PDF и Markdown файлы папки и всех подпапок: (имя в архиве, полный путь)"""
+    base_dir = get_pdf_dir()
+    files = []
+    pending = [folder]
+    while pending:
+        entry = library_index.get_folder(pending.pop())
+        if entry is None:
+            continue
+        for file in entry.files:
+            if file.name.lower().endswith(('.pdf', '.md')):
+                name = file.path[len(folder):].lstrip("/") if folder else file.path
+                files.append((name, base_dir / file.path))
+        pending.extend(f"{entry.path}/{name}" if entry.path else name for name in reversed(entry.directories))
+    return files
+
+
+@router.get("/download-folder")
+async def download_folder(folder: str = ""):
+    """Скачивание папки целиком одним ZIP-архивом, собираемым на лету"""
+    current_folder = normalize_folder(folder)
+    if current_folder is None:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if not library_index.has_folder(current_folder):
+        raise HTTPException(status_code=404, detail="Directory not found")
+    
+    files = collect_folder_files(current_folder)
+    # stat и предварительный проход сжатия Markdown выполняются вне цикла событий
+    archive = await run_io(build_zip_stream, files)
+    if archive is None:
+        raise HTTPException(status_code=404, detail="No documents in this directory")
+    
+    filename = folder_archive_name(current_folder)
+    return StreamingResponse(
+        archive.iter_bytes(),
+        media_type="application/zip",
+        headers={
+            "Content-Length": str(archive.content_length),
+            "Content-Disposition": content_disposition(filename),
+        }
+    )
+
+
+@router.get("/pages/{file_path:path}")
+async def pdf_page_index(file_path: str):
+    """Постраничный индекс смещений в отдаваемом (линеаризованном) PDF"""
+    rel_path = normalize_folder(file_path)
+    if rel_path is None or not rel_path.lower().endswith('.pdf'):
+        raise HTTPException(status_code=404, detail="File not found")
+    index = await run_io(pdf_optimize_store.page_index, rel_path, get_pdf_dir() / rel_path)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Page index not ready")
+    return index
+
+
 @router.get("/download/{file_path:path}")
-async def download_file(file_path: str):
+async def download_file(request: Request, file_path: str):
     """Download a document file (PDF or Markdown)"""
     try:
         # Разбиваем путь на директорию и имя файла
@@ -300,10 +477,10 @@ async def download_file(file_path: str):
         folder = str(file_parts.parent) if str(file_parts.parent) != "." else None
         
         # Получаем полный путь к файлу
-        file_dir = get_subfolder_path(folder)
+        file_dir = await run_io(get_subfolder_path, folder)
         file_path_full = file_dir / file_name
         
-        if not file_path_full.exists():
+        if not await run_io(file_path_full.exists):
             raise HTTPException(status_code=404, detail="File not found")
         
         # Определяем media_type на основе расширения файла
@@ -314,11 +491,12 @@ async def download_file(file_path: str):
         else:
             raise HTTPException(status_code=400, detail="Unsupported file format")
         
-        return FileResponse(
-            path=str(file_path_full), 
-            media_type=media_type, 
-            filename=file_name
-        )
+        # PDF отдаётся линеаризованной копией, если она уже построена для текущей версии файла
+        if media_type == "application/pdf":
+            file_path_full = await run_io(pdf_optimize_store.serving_path, normalize_folder(file_path), file_path_full)
+        
+        # Поддерживаются Range-запросы и условные заголовки
+        return await run_io(file_download_response, request, file_path_full, media_type, filename=file_name)
     except HTTPException as e:
         raise e
     except Exception as e:
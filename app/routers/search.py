@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Request, Query
+from fastapi.responses import HTMLResponse
+
+from app.executor import run_io
+from app.pdf_text import pdf_ingestor
+from app.search import search_index
+from app.templating import templates
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"]
+)
+
+
+MAX_RESULTS = 50
+
+
+@router.get("", response_class=HTMLResponse)
+async def search_page(
+    request: Request,
+    q: str = Query("", description="Поисковый запрос"),
+    limit: int = Query(20, ge=1, le=MAX_RESULTS)
+):
+    """Страница полнотекстового поиска по библиотеке"""
+    results = await run_io(search_index.search, q, limit=limit) if q.strip() else []
+    return templates.TemplateResponse(
+        "search.html",
+        {
+            "request": request,
+            "query": q,
+            "results": results,
+            "pdf_status": pdf_ingestor.status()
+        }
+    )
+
+
+@router.get("/api")
+async def search_api(
+    q: str = Query(..., min_length=1, description="Поисковый запрос"),
+    limit: int = Query(20, ge=1, le=MAX_RESULTS)
+):
+    """Результаты поиска в формате JSON"""
+    return {"query": q, "results": await run_io(search_index.search, q, limit=limit)}
+
+
+@router.get("/status")
+async def search_status():
+    """Состояние поискового индекса и фонового извлечения текста из PDF"""
+    return {"index": search_index.stats(), "pdf": pdf_ingestor.status()}
@@ -0,0 +1,466 @@
+import asyncio
+import heapq
+import html
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from operator import itemgetter
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from app import config
+from app.library import LibraryIndex, library_index
+
+logger = logging.getLogger(__name__)
+
+# 2: в документах хранится текст для сниппетов
+INDEX_VERSION = 2
+
+# Параметры ранжирования BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Слова с кириллицей и латиницей; '#' и '+' сохраняем ради "C#" и "C++"
+TOKEN_RE = re.compile(r"[0-9a-zа-яё]+[#+]*", re.IGNORECASE)
+
+# Окончания для лёгкого стемминга
+RU_SUFFIXES = {
+    "иями", "ями", "ами", "ией", "иях", "ях", "ах", "ов", "ев", "ей", "ий", "ый", "ой", "ая", "яя",
+    "ое", "ее", "ие", "ые", "ого", "его", "ому", "ему", "ыми", "ими", "ую", "юю", "ом", "ем", "ам",
+    "ям", "ия", "ию", "ии", "ть", "ться", "ет", "ут", "ют", "ит", "ат", "ят", "ешь", "ишь",
+    "ется", "ются", "ание", "ения", "ение", "ости", "ость",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь",
+}
+EN_SUFFIXES = {"ations", "ation", "ings", "ing", "ies", "es", "ed", "s"}
+
+# Длины окончаний от длинных к коротким: проверяем срез нужной длины по множеству
+RU_SUFFIX_LENGTHS = sorted({len(suffix) for suffix in RU_SUFFIXES}, reverse=True)
+EN_SUFFIX_LENGTHS = sorted({len(suffix) for suffix in EN_SUFFIXES}, reverse=True)
+
+CYRILLIC_RE = re.compile("[а-я]")
+
+MIN_STEM_LENGTH = 3
+
+# Символы термов: граница слова для поиска совпадений в сниппетах
+TERM_CHARS = "0-9a-zа-яё"
+
+# Сниппет: окно вокруг найденных термов (в символах) и контекст перед первым совпадением
+SNIPPET_WIDTH = 240
+SNIPPET_CONTEXT = 40
+# Сколько совпадений (и кандидатов на совпадение) просматривается в документе
+SNIPPET_MAX_HITS = 32
+SNIPPET_MAX_CANDIDATES = 128
+
+
+@lru_cache(maxsize=65536)
+def stem(token: str) -> str:
+    """Лёгкий стемминг: отрезает типичные окончания русских и английских слов"""
+    if token[-1] in "#+" or token.isdigit():
+        return token
+    if CYRILLIC_RE.search(token):
+        suffixes, lengths = RU_SUFFIXES, RU_SUFFIX_LENGTHS
+    else:
+        suffixes, lengths = EN_SUFFIXES, EN_SUFFIX_LENGTHS
+    for length in lengths:
+        if len(token) - length >= MIN_STEM_LENGTH and token[-length:] in suffixes:
+            return token[:-length]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Разбивает текст на нормализованные термы"""
+    return [stem(match.group(0).lower().replace("ё", "е")) for match in TOKEN_RE.finditer(text)]
+
+
+@lru_cache(maxsize=1024)
+def hit_pattern(terms: frozenset[str]) -> Optional[re.Pattern]:
+    """
+    Регулярное выражение для начал слов, которые могут дать один из термов:
+    стемминг только отрезает окончание, поэтому терм - префикс исходного слова
+    """
+    prefixes = sorted({term.rstrip("#+") or term for term in terms}, key=len, reverse=True)
+    if not prefixes:
+        return None
+    # 'ё' при нормализации заменяется на 'е' - в тексте допускаем обе буквы
+    alternatives = "|".join(re.escape(prefix).replace("е", "[её]") for prefix in prefixes)
+    return re.compile(f"(?<![{TERM_CHARS}])(?:{alternatives})", re.IGNORECASE)
+
+
+def read_text(path: Path) -> str:
+    """Читает текстовый файл, не падая на неожиданной кодировке"""
+    data = path.read_bytes()
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("cp1251", errors="replace")
+
+
+def extract_title(text: str, path: Path) -> str:
+    for line in text.splitlines():
+        if line.startswith("#"):
+            title = line.lstrip("#").strip()
+            if title:
+                return title
+    return path.stem
+
+
+@dataclass
+class Document:
+    path: str
+    title: str
+    length: int
+    mtime_ns: int
+    size: int
+    terms: dict[str, int]
+    # Номер страницы для документов, извлечённых из PDF (0 - Markdown-файл целиком)
+    page: int = 0
+    # Текст документа: сниппеты строятся без чтения файлов с диска
+    text: str = ""
+
+    @property
+    def key(self) -> str:
+        return f"{self.path}#page={self.page}" if self.page else self.path
+
+    @property
+    def url(self) -> str:
+        return f"/pdf/view/{quote(self.path)}" + (f"#page={self.page}" if self.page else "")
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс по Markdown-файлам библиотеки и страницам PDF.
+    Документы добавляются и удаляются по одному, индекс сохраняется на диск
+    и при старте сверяется с деревом библиотеки по mtime и размеру файлов.
+    Страницы PDF добавляет фоновая стадия извлечения текста (app.pdf_text).
+    Изменения сохраняются на диск не чаще раза в SEARCH_INDEX_SAVE_INTERVAL секунд (run).
+    """
+
+    suffixes: tuple[str, ...] = (".md", ".markdown")
+
+    def __init__(self, library: LibraryIndex, storage_path: Optional[Path] = None):
+        self.library = library
+        self.storage_path = storage_path
+        self._docs: dict[str, Document] = {}
+        self._postings: dict[str, dict[str, int]] = {}
+        self._total_length = 0
+        # Нормировка BM25 по длине каждого документа; пересчитывается после изменений индекса
+        self._norms: Optional[dict[str, float]] = None
+        self._lock = threading.RLock()
+        self._dirty = False
+
+    # --- Изменение индекса ---
+
+    def _add(self, doc: Document) -> None:
+        key = doc.key
+        self._docs[key] = doc
+        self._total_length += doc.length
+        self._norms = None
+        for term, tf in doc.terms.items():
+            self._postings.setdefault(term, {})[key] = tf
+
+    def _remove(self, key: str) -> None:
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        self._total_length -= doc.length
+        self._norms = None
+        for term in doc.terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+
+    def _make_document(self, rel_path: str, text: str, mtime_ns: int, size: int,
+                       title: Optional[str] = None, page: int = 0) -> Document:
+        tokens = tokenize(text)
+        terms: dict[str, int] = {}
+        for token in tokens:
+            terms[token] = terms.get(token, 0) + 1
+        return Document(
+            path=rel_path,
+            title=title or extract_title(text, Path(rel_path)),
+            length=len(tokens),
+            mtime_ns=mtime_ns,
+            size=size,
+            terms=terms,
+            page=page,
+            text=text,
+        )
+
+    def update_document(self, rel_path: str) -> None:
+        """Переиндексирует один файл (или удаляет его из индекса, если файла больше нет)"""
+        full_path = self.library.root / rel_path
+        try:
+            stat = full_path.stat()
+            text = read_text(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            self.remove_document(rel_path)
+            return
+        doc = self._make_document(rel_path, text, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            self._remove(rel_path)
+            self._add(doc)
+            self._dirty = True
+
+    def remove_document(self, rel_path: str) -> None:
+        with self._lock:
+            if rel_path in self._docs:
+                self._remove(rel_path)
+                self._dirty = True
+
+    def set_pdf_pages(self, rel_path: str, pages: list[str], mtime_ns: int, size: int) -> None:
+        """Заменяет в индексе все страницы PDF-файла"""
+        stem = Path(rel_path).stem
+        docs = [
+            self._make_document(rel_path, text, mtime_ns, size, title=f"{stem}, стр. {number}", page=number)
+            for number, text in enumerate(pages, start=1)
+            if text.strip()
+        ]
+        with self._lock:
+            self._remove_pdf(rel_path)
+            for doc in docs:
+                self._add(doc)
+            self._dirty = True
+
+    def remove_pdf(self, rel_path: str) -> None:
+        with self._lock:
+            if self._remove_pdf(rel_path):
+                self._dirty = True
+
+    def _remove_pdf(self, rel_path: str) -> bool:
+        prefix = rel_path + "#page="
+        keys = [key for key in self._docs if key.startswith(prefix)]
+        for key in keys:
+            self._remove(key)
+        return bool(keys)
+
+    def pdf_paths(self) -> set[str]:
+        """Пути PDF-файлов, страницы которых уже есть в индексе"""
+        with self._lock:
+            return {doc.path for doc in self._docs.values() if doc.page}
+
+    def sync(self, prefix: str = "") -> None:
+        """
+        Сверяет индекс с деревом библиотеки (или с его частью по префиксу пути)
+        и обновляет только изменившиеся файлы
+        """
+        current = {
+            file.path: file
+            for file in self.library.iter_files(self.suffixes, folder=prefix.rstrip("/"))
+        }
+        with self._lock:
+            stale = [
+                key for key, doc in self._docs.items()
+                if not doc.page and key.startswith(prefix) and key not in current
+            ]
+            for path in stale:
+                self._remove(path)
+            if stale:
+                self._dirty = True
+        for path, file in current.items():
+            doc = self._docs.get(path)
+            if doc is None or doc.mtime_ns != file.mtime_ns or doc.size != file.size:
+                self.update_document(path)
+
+    def on_library_change(self, paths: Optional[list[str]]) -> None:
+        """Обработчик изменений индекса библиотеки"""
+        if paths is None:
+            self.sync()
+        else:
+            root = str(self.library.root)
+            for path in paths:
+                rel_path = os.path.relpath(path, root).replace("\\", "/")
+                if rel_path.startswith(".."):
+                    continue
+                if rel_path == ".":
+                    self.sync()
+                elif rel_path.lower().endswith(self.suffixes):
+                    self.update_document(rel_path)
+                elif os.path.isdir(path) or self._has_prefix(rel_path + "/"):
+                    # Добавлена, удалена или переименована целая папка
+                    self.sync(prefix=rel_path + "/")
+
+    def _has_prefix(self, prefix: str) -> bool:
+        """Есть ли в индексе Markdown-файлы внутри папки (удалённой папки уже нет на диске)"""
+        with self._lock:
+            return any(not doc.page and key.startswith(prefix) for key, doc in self._docs.items())
+
+    # --- Хранение на диске ---
+
+    def load(self) -> bool:
+        if self.storage_path is None or not self.storage_path.exists():
+            return False
+        try:
+            with open(self.storage_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return False
+            with self._lock:
+                self._docs.clear()
+                self._postings.clear()
+                self._total_length = 0
+                self._norms = None
+                for item in data["docs"]:
+                    self._add(Document(**item))
+                self._dirty = False
+            return True
+        except Exception as e:
+            logger.error(f"Error loading search index: {str(e)}")
+            return False
+
+    def save(self) -> None:
+        if self.storage_path is None or not self._dirty:
+            return
+        with self._lock:
+            data = {
+                "version": INDEX_VERSION,
+                "docs": [doc.__dict__ for doc in self._docs.values()],
+            }
+            self._dirty = False
+        self.storage_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.storage_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.storage_path)
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """
+        Отложенное сохранение: индекс целиком переписывается не на каждое изменение файла,
+        а периодически, если с прошлого сохранения что-то изменилось
+        """
+        interval = max(config.SEARCH_INDEX_SAVE_INTERVAL, 1)
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception as e:
+                logger.error(f"Error saving search index: {str(e)}")
+
+    # --- Поиск ---
+
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        """Возвращает документы, отсортированные по BM25, со сниппетами"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self._docs)
+            if doc_count == 0:
+                return []
+            norms = self._length_norms()
+            # Самый длинный список вхождений обрабатывается первым одним генератором словаря,
+            # остальные добавляются к нему
+            postings_lists = sorted((self._postings[term] for term in terms if term in self._postings),
+                                    key=len, reverse=True)
+            scores: dict[str, float] = {}
+            for postings in postings_lists:
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = idf * (BM25_K1 + 1)
+                if not scores:
+                    scores = {path: weight * tf / (tf + norms[path]) for path, tf in postings.items()}
+                    continue
+                get = scores.get
+                for path, tf in postings.items():
+                    scores[path] = get(path, 0.0) + weight * tf / (tf + norms[path])
+            top = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+            docs = [(self._docs[key], score) for key, score in top]
+
+        results = []
+        for doc, score in docs:
+            results.append({
+                "path": doc.path,
+                "page": doc.page,
+                "url": doc.url,
+                "kind": "pdf" if doc.page else "markdown",
+                "title": doc.title,
+                "score": round(score, 4),
+                "snippet": self.snippet(doc, set(terms)),
+            })
+        return results
+
+    def _length_norms(self) -> dict[str, float]:
+        """K1 * (1 - B + B * длина / средняя длина) для всех документов (под блокировкой)"""
+        if self._norms is None:
+            avg_length = self._total_length / len(self._docs) or 1.0
+            self._norms = {
+                key: BM25_K1 * (1 - BM25_B + BM25_B * doc.length / avg_length)
+                for key, doc in self._docs.items()
+            }
+        return self._norms
+
+    def snippet(self, doc: Document, terms: set[str]) -> str:
+        """
+        Фрагмент сохранённого текста вокруг самого плотного скопления найденных термов,
+        с подсветкой. Текст не токенизируется целиком: совпадения ищутся регулярным
+        выражением по началам слов и проверяются стеммингом.
+        """
+        text = doc.text
+        pattern = hit_pattern(frozenset(terms))
+        hits: list[tuple[int, int]] = []
+        if pattern is not None:
+            # В длинных документах с частыми термами хватает начала текста
+            for candidate in itertools.islice(pattern.finditer(text), SNIPPET_MAX_CANDIDATES):
+                match = TOKEN_RE.match(text, candidate.start())
+                if match and stem(match.group(0).lower().replace("ё", "е")) in terms:
+                    hits.append(match.span())
+                    if len(hits) >= SNIPPET_MAX_HITS:
+                        break
+        if not hits:
+            return html.escape(text[:200])
+
+        # Окно из SNIPPET_WIDTH символов с наибольшим числом совпадений
+        best_start, best_count, j = hits[0][0], 0, 0
+        for i, (hit_start, _) in enumerate(hits):
+            while hits[j][0] < hit_start - SNIPPET_WIDTH:
+                j += 1
+            if i - j + 1 > best_count:
+                best_count, best_start = i - j + 1, hits[j][0]
+
+        # Границы фрагмента сдвигаются к границам слов
+        first = max(0, best_start - SNIPPET_CONTEXT)
+        while first > 0 and text[first - 1].isalnum():
+            first -= 1
+        last = min(len(text), first + SNIPPET_WIDTH)
+        while last < len(text) and text[last].isalnum():
+            last += 1
+
+        parts = []
+        position = first
+        for start, end in hits:
+            if start < first or end > last:
+                continue
+            parts.append(html.escape(text[position:start]))
+            parts.append(f"<mark>{html.escape(text[start:end])}</mark>")
+            position = end
+        parts.append(html.escape(text[position:last]))
+        snippet = " ".join("".join(parts).split())
+        prefix = "… " if first > 0 else ""
+        suffix = " …" if last < len(text) else ""
+        return prefix + snippet + suffix
+
+    def stats(self) -> dict:
+        return {"documents": len(self._docs), "terms": len(self._postings)}
+
+
+search_index = SearchIndex(library_index, Path(config.DATA_DIR) / "search_index.json")
+
+
+def start_search_index() -> None:
+    """Подписывается на изменения библиотеки, загружает сохранённый индекс и досинхронизирует его"""
+    library_index.add_listener(search_index.on_library_change)
+    search_index.load()
+    search_index.sync()
+    search_index.save()
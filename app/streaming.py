@@ -0,0 +1,148 @@
+"""
+Потоковая отдача больших Markdown-документов.
+
+Страница строится генератором шаблона (Template.generate): всё, что стоит в шаблоне
+до содержимого документа (шапка, навигация, панель инструментов), отправляется сразу,
+затем документ читается, конвертируется и отправляется по разделам, и в конце - остаток
+шаблона. Одновременно в памяти находится только один раздел, поэтому расход памяти
+на запрос не зависит от размера файла. Документы, которые по разделам дали бы другой
+HTML (блочный HTML, [TOC] - см. sections_are_safe), конвертируются целиком и
+отправляются одним куском.
+
+Такие страницы не попадают в кэш отрендеренных страниц: несколько мегабайт HTML
+вытеснили бы из него десятки обычных страниц. Условные запросы (304) работают как обычно.
+"""
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from jinja2 import Template
+from markupsafe import Markup
+
+from app import config
+from app.compression import StreamCompressor, negotiate, variant_etag
+from app.executor import render_limiter, run_io, run_render
+from app.metrics import phase
+from app.render_cache import is_not_modified, page_headers, page_key, render_cache
+from app.rendering import (iter_markdown_sections, read_document, render_markdown, sections_are_safe,
+                           unique_heading_ids)
+
+logger = logging.getLogger(__name__)
+
+# Подставляется в шаблон вместо содержимого и отмечает место, где начинаются разделы документа
+CONTENT_MARKER = "\x00library-stream-content\x00"
+
+
+def should_stream(path: Path) -> bool:
+    """Документ достаточно большой, чтобы отдавать его потоком"""
+    return config.STREAM_MIN_BYTES > 0 and path.stat().st_size >= config.STREAM_MIN_BYTES
+
+
+class TemplateStream:
+    """Части страницы до и после содержимого документа из генератора шаблона"""
+
+    def __init__(self, template: Template, context: dict):
+        self._pieces = template.generate(dict(context, content=Markup(CONTENT_MARKER)))
+        self._tail = ""
+
+    def head(self) -> str:
+        parts = []
+        for piece in self._pieces:
+            if CONTENT_MARKER in piece:
+                # Часть может быть Markup: склейка Markup со строками экранировала бы остаток шаблона
+                before, self._tail = str(piece).split(CONTENT_MARKER, 1)
+                parts.append(before)
+                return "".join(parts)
+            parts.append(piece)
+        raise ValueError("Template does not output content")
+
+    def tail(self) -> str:
+        return self._tail + "".join(self._pieces)
+
+
+async def stream_document(path: Path, template: Template, context: dict,
+                          encoding: Optional[str]) -> AsyncIterator[bytes]:
+    compressor = StreamCompressor(encoding) if encoding else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    parts = TemplateStream(template, context)
+    with phase("template"):
+        head = await run_io(parts.head)
+    yield encode(head)
+
+    with phase("file_read"):
+        safe = await run_io(sections_are_safe, path)
+    if not safe:
+        # Блочный HTML, [TOC] и подобное по разделам дали бы другой HTML - документ целиком
+        with phase("file_read"):
+            content = await run_io(read_document, path)
+        async with render_limiter.slot(reject=False):
+            with phase("markdown"):
+                html_content = await run_render(render_markdown, content)
+        yield encode(html_content)
+    else:
+        async for html_content in _render_sections(path):
+            yield encode(html_content)
+
+    with phase("template"):
+        tail = await run_io(parts.tail)
+    yield encode(tail)
+    if compressor:
+        yield compressor.finish()
+
+
+async def _render_sections(path: Path) -> AsyncIterator[str]:
+    """HTML документа по разделам; в памяти одновременно только один раздел"""
+    sections = iter_markdown_sections(path, config.STREAM_SECTION_SIZE)
+    used_ids: set[str] = set()
+    separator = ""
+    try:
+        while True:
+            with phase("file_read"):
+                section = await run_io(next, sections, None)
+            if section is None:
+                break
+            # Запрос уже принят: следующие разделы ждут слот, а не получают отказ посреди ответа
+            async with render_limiter.slot(reject=False):
+                with phase("markdown"):
+                    html_content = await run_render(render_markdown, section)
+            yield separator + unique_heading_ids(html_content, used_ids)
+            # Разделы соединяются так же, как блоки верхнего уровня при конвертации целого документа
+            separator = "\n"
+    except Exception as e:
+        logger.error(f"Error streaming {path}: {str(e)}")
+        raise
+    finally:
+        await run_io(sections.close)
+
+
+async def streamed_page_response(request: Request, variant: str, path: Path,
+                                 template: Template, context: dict) -> Response:
+    """
+    Страница документа, которая отправляется по мере рендеринга.
+    context - контекст шаблона без content: его место занимают разделы документа.
+    """
+    key = await run_io(page_key, variant, path)
+    headers = page_headers(key)
+
+    if is_not_modified(request, key.etag, key.modified_ns):
+        render_cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+
+    # При перегрузке отказываем до начала ответа, пока ещё можно вернуть 503
+    render_limiter.check()
+
+    encoding = negotiate(request.headers, key.size, "text/html")
+    if encoding is not None:
+        headers["ETag"] = variant_etag(key.etag, encoding)
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(
+        stream_document(path, template, context, encoding),
+        media_type="text/html",
+        headers=headers,
+    )
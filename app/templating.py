@@ -0,0 +1,88 @@
+"""
+Общее окружение шаблонов Jinja2 для всех страниц приложения и статического экспорта.
+
+Все шаблоны компилируются при старте (precompile_templates), а не при первом запросе
+к каждой странице. Байткод скомпилированных шаблонов сохраняется в DATA_DIR/jinja:
+при следующих запусках шаблоны загружаются из него без разбора исходников. Изменённый
+шаблон перекомпилируется (кэш сверяет контрольную сумму исходника).
+"""
+import hashlib
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import jinja2
+from fastapi.templating import Jinja2Templates
+
+from app import config
+from app.assets import asset_manifest, static_url
+from app.rendering import RENDERER_VERSION
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+
+def bytecode_cache() -> Optional[jinja2.BytecodeCache]:
+    if not config.TEMPLATE_BYTECODE_CACHE:
+        return None
+    directory = Path(config.DATA_DIR) / "jinja"
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Template bytecode cache is disabled: {str(e)}")
+        return None
+    return jinja2.FileSystemBytecodeCache(str(directory))
+
+
+templates = Jinja2Templates(directory=str(TEMPLATES_DIR), bytecode_cache=bytecode_cache())
+templates.env.globals["static_url"] = static_url
+
+_build_lock = threading.Lock()
+_build: dict = {"signature": None, "fingerprint": "", "mtime_ns": 0}
+
+template_stats = {"compiled": 0, "seconds": 0.0, "bytecode_cache": templates.env.bytecode_cache is not None}
+
+
+def precompile_templates() -> int:
+    """Загружает (компилирует или берёт из кэша байткода) все шаблоны; возвращает их число"""
+    started = time.perf_counter()
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    template_stats.update(compiled=len(names), seconds=round(time.perf_counter() - started, 4))
+    return len(names)
+
+
+def build_fingerprint() -> tuple[str, int]:
+    """
+    Версия всего, от чего кроме самого документа зависит HTML страниц: исходники шаблонов,
+    версия конвейера рендеринга и манифест собранных статических файлов (адреса ассетов).
+    Возвращает хэш и время последнего изменения шаблонов или манифеста. Файлы шаблонов
+    перечитываются, только когда меняются их mtime или размер
+    """
+    if asset_manifest.assets is None:
+        asset_manifest.reload()
+    files = []
+    for path in sorted(TEMPLATES_DIR.rglob("*.html")):
+        stat = path.stat()
+        files.append((path, stat.st_mtime_ns, stat.st_size))
+    try:
+        manifest_mtime_ns = (asset_manifest.dist_dir / "manifest.json").stat().st_mtime_ns
+    except FileNotFoundError:
+        manifest_mtime_ns = 0
+    signature = (tuple(files), asset_manifest.digest, RENDERER_VERSION)
+    with _build_lock:
+        if _build["signature"] != signature:
+            digest = hashlib.sha256(f"{RENDERER_VERSION}:{asset_manifest.digest}".encode())
+            for path, _, _ in files:
+                digest.update(path.relative_to(TEMPLATES_DIR).as_posix().encode())
+                digest.update(path.read_bytes())
+            _build.update(
+                signature=signature,
+                fingerprint=digest.hexdigest()[:16],
+                mtime_ns=max([manifest_mtime_ns] + [mtime_ns for _, mtime_ns, _ in files]),
+            )
+        return _build["fingerprint"], _build["mtime_ns"]
@@ -0,0 +1,262 @@
+import asyncio
+import importlib.util
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from app import config
+from app.background import BackgroundStage
+from app.library import FileEntry, LibraryIndex, library_index
+
+logger = logging.getLogger(__name__)
+
+THUMB_WIDTH = 240
+PREVIEW_WIDTH = 1024
+IMAGE_QUALITY = 80
+MEDIA_TYPE = "image/webp"
+
+# Варианты изображения первой страницы: миниатюра для листинга и превью для просмотрщика
+VARIANTS = ("thumb", "preview")
+
+# mtime изображения (порядок LRU после перезапуска) обновляется не чаще раза в этот интервал
+TOUCH_INTERVAL = 3600
+
+
+def render_pdf_previews(path: str) -> dict[str, bytes]:
+    """
+    Рендерит первую страницу PDF в миниатюру и превью (WebP).
+    Выполняется в отдельном процессе пула, поэтому функция должна быть на уровне модуля.
+    """
+    import pypdfium2 as pdfium
+
+    document = pdfium.PdfDocument(path)
+    try:
+        page = document[0]
+        width, _ = page.get_size()
+        image = page.render(scale=PREVIEW_WIDTH / width).to_pil()
+        page.close()
+    finally:
+        document.close()
+
+    images = {}
+    for variant, target_width in (("preview", PREVIEW_WIDTH), ("thumb", THUMB_WIDTH)):
+        if image.width > target_width:
+            image = image.resize((target_width, round(image.height * target_width / image.width)))
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=IMAGE_QUALITY)
+        images[variant] = buffer.getvalue()
+    return images
+
+
+@dataclass
+class ThumbnailRecord:
+    sha256: str
+    mtime_ns: int
+    size: int
+    # Изображения вытеснены из кэша: рендерятся заново только по запросу
+    evicted: bool = False
+
+
+class ThumbnailStore:
+    """
+    Изображения первых страниц PDF на диске, ключ - хэш содержимого.
+    Общий объём ограничен: при превышении удаляются давно не запрашивавшиеся файлы (LRU),
+    а их записи помечаются как вытесненные. Порядок использования переживает перезапуск
+    через mtime файлов (обновляется не чаще раза в TOUCH_INTERVAL).
+    """
+
+    def __init__(self, storage_dir: Path, max_bytes: int):
+        self.storage_dir = storage_dir
+        self.max_bytes = max_bytes
+        self.records: dict[str, ThumbnailRecord] = {}
+        self._usage: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._touched: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.storage_dir / "manifest.json"
+
+    def image_path(self, sha256: str, variant: str) -> Path:
+        return self.storage_dir / f"{sha256}-{variant}.webp"
+
+    def load(self) -> None:
+        """Читает манифест и восстанавливает порядок LRU по mtime файлов"""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.records = {path: ThumbnailRecord(**record) for path, record in json.load(f).items()}
+        except FileNotFoundError:
+            self.records = {}
+        except Exception as e:
+            logger.error(f"Error loading thumbnail manifest: {str(e)}")
+            self.records = {}
+
+        entries = []
+        if self.storage_dir.exists():
+            with os.scandir(self.storage_dir) as it:
+                for item in it:
+                    if item.name.endswith(".webp"):
+                        stat = item.stat()
+                        entries.append((stat.st_mtime_ns, item.name[:-len(".webp")], stat.st_size))
+        with self._lock:
+            self._usage = OrderedDict((name, size) for _, name, size in sorted(entries))
+            self._size = sum(self._usage.values())
+            self._touched = {}
+        for record in self.records.values():
+            record.evicted = not self.has_images(record.sha256)
+
+    def save_manifest(self) -> None:
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({path: asdict(record) for path, record in self.records.items()}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def has_images(self, sha256: str) -> bool:
+        with self._lock:
+            return all(f"{sha256}-{variant}" in self._usage for variant in VARIANTS)
+
+    def save_images(self, sha256: str, images: dict[str, bytes]) -> None:
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        for variant, data in images.items():
+            path = self.image_path(sha256, variant)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                name = f"{sha256}-{variant}"
+                self._size += len(data) - self._usage.pop(name, 0)
+                self._usage[name] = len(data)
+        self._evict()
+
+    def _evict(self) -> None:
+        evicted = set()
+        while True:
+            with self._lock:
+                if self._size <= self.max_bytes or not self._usage:
+                    break
+                name, size = self._usage.popitem(last=False)
+                self._touched.pop(name, None)
+                self._size -= size
+                self.evictions += 1
+            evicted.add(name.rsplit("-", 1)[0])
+            try:
+                (self.storage_dir / f"{name}.webp").unlink()
+            except FileNotFoundError:
+                pass
+        if evicted:
+            for record in list(self.records.values()):
+                if record.sha256 in evicted:
+                    record.evicted = True
+
+    def lookup(self, rel_path: str, variant: str) -> Optional[tuple[Path, ThumbnailRecord]]:
+        """Путь к изображению PDF или None, если оно ещё не готово (или вытеснено)"""
+        record = self.records.get(rel_path)
+        name = f"{record.sha256}-{variant}" if record else None
+        now = time.monotonic()
+        with self._lock:
+            if name is None or name not in self._usage:
+                self.misses += 1
+                return None
+            self._usage.move_to_end(name)
+            self.hits += 1
+            touch = now - self._touched.get(name, float("-inf")) >= TOUCH_INTERVAL
+            if touch:
+                self._touched[name] = now
+        path = self.image_path(record.sha256, variant)
+        if touch:
+            try:
+                # mtime отражает последнее использование и задаёт порядок LRU после перезапуска
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+        return path, record
+
+    def url_for(self, rel_path: str) -> Optional[str]:
+        """Адрес миниатюры с версией по хэшу содержимого (для долгого кэширования)"""
+        record = self.records.get(rel_path)
+        if record is None:
+            return None
+        # Для вытесненной миниатюры адрес тоже отдаётся: запрос к нему запустит повторный рендеринг
+        return f"/pdf/thumb/{quote(rel_path)}?v={record.sha256[:16]}"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._usage),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class ThumbnailGenerator(BackgroundStage):
+    """
+    Фоновая генерация миниатюр и превью первой страницы PDF.
+    Рендеринг идёт в пуле процессов; неизменённые файлы (по mtime/размеру, затем по хэшу)
+    повторно не обрабатываются. Вытесненные из кэша изображения при сверке не рендерятся:
+    их заказывает запрос к миниатюре (request), иначе кэш сверх лимита крутился бы по кругу.
+    """
+
+    unavailable_message = "pypdfium2/Pillow are not installed, PDF thumbnails are disabled"
+    error_message = "Error rendering thumbnail for"
+
+    def __init__(self, library: LibraryIndex, store: ThumbnailStore, workers: int = 0):
+        super().__init__(library, store, workers)
+        self._requested: set[str] = set()
+
+    @staticmethod
+    def available() -> bool:
+        return all(importlib.util.find_spec(name) is not None for name in ("pypdfium2", "PIL"))
+
+    def load(self) -> None:
+        self.store.load()
+
+    def request(self, rel_path: str) -> None:
+        """Заказ повторного рендеринга вытесненных изображений (из обработчика запроса)"""
+        record = self.store.records.get(rel_path)
+        if record is not None and record.evicted and rel_path not in self._requested:
+            self._requested.add(rel_path)
+            self.wake()
+
+    async def reconcile(self, pool: ProcessPoolExecutor) -> None:
+        """Сверяет PDF-файлы библиотеки с манифестом и рендерит только изменившиеся и заказанные"""
+        current, removed, pending = self.scan()
+        requested, self._requested = self._requested, set()
+        changed = {file.path for file in pending}
+        pending += [current[path] for path in requested if path in current and path not in changed]
+
+        await self.process(pool, pending)
+        if pending:
+            await asyncio.to_thread(self.store.save_manifest)
+
+    async def process_file(self, pool: ProcessPoolExecutor, file: FileEntry) -> None:
+        sha256 = await self.content_hash(file)
+        if not self.store.has_images(sha256):
+            images = await self.in_pool(pool, render_pdf_previews, str(self.library.root / file.path))
+            await asyncio.to_thread(self.store.save_images, sha256, images)
+        # Изображения больше всего кэша вытесняются сразу же
+        self.store.records[file.path] = ThumbnailRecord(sha256, file.mtime_ns, file.size,
+                                                        evicted=not self.store.has_images(sha256))
+
+    def status(self) -> dict:
+        return dict(super().status(), **self.store.stats())
+
+
+thumbnail_store = ThumbnailStore(Path(config.DATA_DIR) / "thumbnails", config.THUMBNAIL_CACHE_MAX_BYTES)
+thumbnail_generator = ThumbnailGenerator(library_index, thumbnail_store, config.THUMBNAIL_WORKERS)
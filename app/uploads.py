@@ -0,0 +1,350 @@
+"""
+Загрузка документов в библиотеку без пересборки и перезапуска контейнера.
+
+Тело multipart/form-data разбирается потоково (python-multipart): каждый файл пишется
+блоками во временный файл внутри библиотеки, SHA-256 считается по ходу записи, и только
+после приёма всего тела создаётся целевая папка и файл атомарно появляется под своим именем. Расход памяти не зависит от размера файла.
+Если такое же содержимое уже есть в библиотеке, вторая копия не сохраняется.
+
+После загрузки выполняется только точечная работа: пересканируется папка в индексе
+библиотеки (его подписчики переиндексируют файл для поиска, извлекут текст PDF, построят
+миниатюру и линеаризованную копию), а из кэша страниц удаляются версии этого файла.
+"""
+import hashlib
+import os
+import secrets
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Optional
+
+from fastapi import HTTPException
+
+from app import config
+from app.background import content_hashes
+from app.library import LibraryIndex, library_index, normalize_folder
+from app.render_cache import render_cache
+
+try:
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    MultipartParser = None
+
+UPLOAD_SUFFIXES = (".pdf", ".md")
+
+# Временные файлы лежат в ближайшей существующей папке на пути к целевой (os.replace атомарен
+# только в пределах одной ФС); расширение .part не попадает ни в листинги, ни в поиск
+TMP_PREFIX = ".upload-"
+TMP_SUFFIX = ".part"
+
+MAX_NAME_BYTES = 255
+MAX_HEADER_BYTES = 16 * 1024
+
+
+def is_upload_enabled() -> bool:
+    return bool(config.UPLOAD_TOKEN) and MultipartParser is not None
+
+
+def check_token(authorization: Optional[str], token_header: Optional[str]) -> None:
+    """Токен из Authorization: Bearer ... или X-Upload-Token"""
+    if not is_upload_enabled():
+        raise HTTPException(status_code=403, detail="Uploads are disabled")
+    supplied = token_header or ""
+    if authorization and authorization.lower().startswith("bearer "):
+        supplied = authorization[7:].strip()
+    if not supplied or not secrets.compare_digest(supplied.encode(), config.UPLOAD_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid upload token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def safe_file_name(raw: bytes) -> str:
+    """Имя файла из заголовка части: только последний компонент пути, без скрытых и служебных имён"""
+    try:
+        name = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        name = raw.decode("latin-1")
+    name = unicodedata.normalize("NFC", name.replace("\\", "/").rsplit("/", 1)[-1].strip())
+    if (not name or name.startswith(".") or len(name.encode("utf-8")) > MAX_NAME_BYTES
+            or any(ord(char) < 32 for char in name)):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    if not name.lower().endswith(UPLOAD_SUFFIXES):
+        raise HTTPException(status_code=415, detail=f"Only {', '.join(UPLOAD_SUFFIXES)} files can be uploaded")
+    return name
+
+
+@dataclass
+class ReceivedFile:
+    name: str
+    tmp_path: Path
+    size: int = 0
+    sha256: str = ""
+    complete: bool = False
+
+
+@dataclass
+class UploadResult:
+    name: str
+    path: str
+    size: int
+    sha256: str
+    duplicate: bool
+
+
+class ContentIndex:
+    """
+    Хэши содержимого файлов библиотеки для поиска дубликатов.
+    Хэшируются только файлы того же размера, что и загруженный; хэши общие
+    с фоновыми стадиями обработки PDF (content_hashes) и действуют до изменения файла.
+    """
+
+    def __init__(self, library: LibraryIndex):
+        self.library = library
+
+    @staticmethod
+    def remember(rel_path: str, path: Path, sha256: str) -> None:
+        stat = path.stat()
+        content_hashes.remember(rel_path, stat.st_mtime_ns, stat.st_size, sha256)
+
+    def find(self, sha256: str, size: int) -> Optional[str]:
+        """Путь файла библиотеки с таким же содержимым или None"""
+        for file in self.library.iter_files(UPLOAD_SUFFIXES):
+            if file.size != size:
+                continue
+            try:
+                digest = content_hashes.get(self.library.root, file)
+            except OSError:
+                continue
+            if digest == sha256:
+                return file.path
+        return None
+
+
+content_index = ContentIndex(library_index)
+
+
+class UploadReceiver:
+    """
+    Потоковый приём multipart-тела: части с файлами пишутся во временные файлы в папке
+    directory (существующей), остальные поля формы пропускаются. Методы feed/finish/abort блокирующие
+    и вызываются в пуле ввода-вывода.
+    """
+
+    def __init__(self, directory: Path, boundary: bytes, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.files: list[ReceivedFile] = []
+        self.finished = False
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._header_size = 0
+        self._current: Optional[ReceivedFile] = None
+        self._file: Optional[IO[bytes]] = None
+        self._digest = None
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_end": self._on_end,
+        })
+
+    # --- Обработчики парсера ---
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._header_size = 0
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+        self._header_size += end - start
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+        self._header_size += end - start
+        if self._header_size > MAX_HEADER_BYTES:
+            raise HTTPException(status_code=400, detail="Multipart headers are too large")
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            # Обычное поле формы
+            return
+        if not options[b"filename"].strip():
+            # Так браузер отправляет поле выбора файла, в котором ничего не выбрано
+            field = options.get(b"name", b"").decode("utf-8", errors="replace")
+            raise HTTPException(status_code=400, detail=f"No file selected in form field '{field}' (empty filename)")
+        name = safe_file_name(options[b"filename"])
+        tmp_path = self.directory / f"{TMP_PREFIX}{secrets.token_hex(8)}{TMP_SUFFIX}"
+        self._file = open(tmp_path, "xb")
+        self._current = ReceivedFile(name=name, tmp_path=tmp_path)
+        self._digest = hashlib.sha256()
+        self.files.append(self._current)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._file is None:
+            return
+        chunk = data[start:end]
+        self._file.write(chunk)
+        self._digest.update(chunk)
+        self._current.size += len(chunk)
+
+    def _on_part_end(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._current.sha256 = self._digest.hexdigest()
+        self._current.complete = True
+        self._current = None
+
+    def _on_end(self) -> None:
+        self.finished = True
+
+    # --- Приём ---
+
+    def feed(self, chunk: bytes) -> None:
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise HTTPException(status_code=413, detail="Upload is too large")
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError:
+            raise HTTPException(status_code=400, detail="Malformed multipart body")
+
+    def finish(self) -> list[ReceivedFile]:
+        try:
+            self._parser.finalize()
+        except MultipartParseError:
+            raise HTTPException(status_code=400, detail="Malformed multipart body")
+        if not self.finished or any(not file.complete for file in self.files):
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+        if not self.files:
+            raise HTTPException(status_code=400, detail="No files in the request")
+        return self.files
+
+    def abort(self) -> None:
+        """Удаляет временные файлы (ошибка или обрыв соединения)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for file in self.files:
+            file.tmp_path.unlink(missing_ok=True)
+
+
+def multipart_boundary(content_type: Optional[str]) -> bytes:
+    media_type, options = parse_options_header(content_type or "")
+    if media_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+    return options[b"boundary"]
+
+
+def prepare_folder(folder: Optional[str]) -> tuple[str, Path, Path]:
+    """
+    Папка назначения внутри библиотеки и ближайшая существующая папка на пути к ней,
+    где пишутся временные файлы. Недостающие папки создаются только при переносе файлов
+    (create_folder), чтобы оборванная загрузка не оставляла пустых папок
+    """
+    rel = normalize_folder(folder)
+    if rel is None or any(part.startswith(".") for part in rel.split("/")):
+        raise HTTPException(status_code=403, detail="Access denied")
+    directory = library_index.root / rel if rel else library_index.root
+    # Символические ссылки не должны выводить за пределы библиотеки
+    if not directory.resolve().is_relative_to(library_index.root):
+        raise HTTPException(status_code=403, detail="Access denied")
+    staging = next(parent for parent in (directory, *directory.parents) if parent.is_dir())
+    return rel, directory, staging
+
+
+def create_folder(directory: Path) -> Optional[Path]:
+    """Создаёт недостающие папки; возвращает верхнюю из созданных (её нужно добавить в индекс библиотеки)"""
+    created = None
+    for parent in reversed((directory, *directory.parents)):
+        if not parent.exists() and parent.is_relative_to(library_index.root):
+            created = parent
+            break
+    directory.mkdir(parents=True, exist_ok=True)
+    return created
+
+
+def remove_created_folder(directory: Path, created: Path) -> None:
+    """Удаляет созданные для загрузки папки, если в них ничего не попало"""
+    for path in (directory, *directory.parents):
+        try:
+            path.rmdir()
+        except OSError:
+            return
+        if path == created:
+            return
+
+
+def _place(tmp_path: Path, target: Path, overwrite: bool) -> None:
+    """Атомарно переносит временный файл на место; без overwrite существующий файл не заменяется"""
+    if overwrite:
+        os.replace(tmp_path, target)
+        return
+    try:
+        # Жёсткая ссылка не создаётся поверх существующего файла - проверка и перенос атомарны
+        os.link(tmp_path, target)
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"File already exists: {target.name}")
+    except OSError:
+        # ФС без жёстких ссылок
+        if target.exists():
+            raise HTTPException(status_code=409, detail=f"File already exists: {target.name}")
+        os.replace(tmp_path, target)
+        return
+    tmp_path.unlink()
+
+
+def commit_files(rel_folder: str, directory: Path, files: list[ReceivedFile],
+                 overwrite: bool) -> list[UploadResult]:
+    """
+    Создаёт папку назначения, переносит в неё принятые файлы (дубликаты по хэшу отбрасываются)
+    и выполняет точечные обновления индексов и кэшей
+    """
+    results: list[UploadResult] = []
+    placed: list[Path] = []
+    created = None
+    # Одинаковые файлы внутри одного запроса: индекс библиотеки обновляется после переноса всех
+    accepted: dict[str, str] = {}
+    try:
+        created = create_folder(directory)
+        for file in files:
+            rel_path = f"{rel_folder}/{file.name}" if rel_folder else file.name
+            existing = accepted.get(file.sha256) or content_index.find(file.sha256, file.size)
+            if existing is not None:
+                file.tmp_path.unlink(missing_ok=True)
+                results.append(UploadResult(file.name, existing, file.size, file.sha256, duplicate=True))
+                continue
+            target = directory / file.name
+            _place(file.tmp_path, target, overwrite)
+            placed.append(target)
+            content_index.remember(rel_path, target, file.sha256)
+            accepted[file.sha256] = rel_path
+            results.append(UploadResult(file.name, rel_path, file.size, file.sha256, duplicate=False))
+    finally:
+        for file in files:
+            file.tmp_path.unlink(missing_ok=True)
+        for target in placed:
+            render_cache.invalidate(target)
+        if created is not None and not placed:
+            # Только дубликаты или ошибка: новая папка осталась бы пустой
+            remove_created_folder(directory, created)
+            created = None
+        changed = ([created] if created is not None else []) + placed
+        if changed:
+            # Индекс папки; подписчики (поиск, текст PDF, миниатюры, линеаризация) получают эти пути
+            library_index.apply_changes([str(path) for path in changed])
+    return results
@@ -0,0 +1,286 @@
+"""
+Прогрев самых посещаемых страниц после перезапуска.
+
+Просмотры документов и листинги папок учитываются затухающими счётчиками: вклад
+обращения уменьшается вдвое за ACCESS_STATS_HALF_LIFE_HOURS, поэтому наверху оказываются
+страницы, популярные сейчас, а не когда-то. Счётчики периодически сохраняются в небольшой
+JSON-файл в DATA_DIR и переживают docker-compose down/up.
+
+После старта фоновая задача открывает top-N страниц теми же запросами, что и посетители
+(прямой вызов ASGI-приложения, без сети): заполняются кэш отрендеренных страниц, сжатые
+варианты и сортировки листингов, а файлы документов заранее читаются в кэш страниц ОС.
+Прогрев ограничен по времени и процессорному времени; /ready сообщает о его окончании.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import Request
+
+from app import config
+from app.library import LibraryIndex, library_index
+
+logger = logging.getLogger(__name__)
+
+# Запросы прогрева помечаются заголовком и не учитываются в статистике
+WARMUP_HEADER = b"x-library-warmup"
+
+# Страницы просмотра: путь после префикса - путь документа в библиотеке
+VIEW_PREFIXES = ("/pdf/view/", "/markdown/view/")
+
+
+class AccessStats:
+    """
+    Затухающие счётчики обращений: ключ - путь страницы (с ?folder= для листингов),
+    значение - счёт на момент последнего обращения и время этого обращения
+    """
+
+    def __init__(self, path: Path, half_life_hours: float, max_entries: int):
+        self.path = path
+        self.half_life = max(half_life_hours, 0.001) * 3600
+        self.max_entries = max_entries
+        self._entries: dict[str, tuple[float, float]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _decayed(self, score: float, stamp: float, now: float) -> float:
+        return score * math.pow(0.5, max(now - stamp, 0.0) / self.half_life)
+
+    def record(self, key: str) -> None:
+        now = time.time()
+        with self._lock:
+            score, stamp = self._entries.get(key, (0.0, now))
+            self._entries[key] = (self._decayed(score, stamp, now) + 1.0, now)
+            self._dirty = True
+            if len(self._entries) > self.max_entries:
+                self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        """Оставляет 90% записей с наибольшим текущим счётом (под блокировкой)"""
+        ranked = sorted(self._entries.items(), key=lambda item: self._decayed(*item[1], now), reverse=True)
+        self._entries = dict(ranked[:self.max_entries * 9 // 10])
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+
+    def top(self, count: int) -> list[str]:
+        """Ключи с наибольшим текущим счётом"""
+        now = time.time()
+        with self._lock:
+            ranked = sorted(self._entries.items(), key=lambda item: self._decayed(*item[1], now), reverse=True)
+        return [key for key, _ in ranked[:count]]
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = {key: (float(score), float(stamp)) for key, (score, stamp) in data["entries"].items()}
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error(f"Error loading access stats: {str(e)}")
+            return
+        with self._lock:
+            self._entries = entries
+            self._dirty = False
+
+    def save(self) -> None:
+        """Записывает счётчики, если они менялись с прошлого сохранения"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"entries": {key: [round(score, 4), round(stamp)] for key, (score, stamp) in self._entries.items()}}
+            self._dirty = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Периодическое сохранение до остановки приложения"""
+        interval = max(config.ACCESS_STATS_SAVE_INTERVAL, 1)
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception as e:
+                logger.error(f"Error saving access stats: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries)}
+
+
+access_stats = AccessStats(
+    Path(config.DATA_DIR) / "access_stats.json",
+    config.ACCESS_STATS_HALF_LIFE_HOURS,
+    config.ACCESS_STATS_MAX_ENTRIES,
+)
+
+
+def record_access(request: Request, folder: Optional[str] = None) -> None:
+    """
+    Учитывает просмотр документа (путь запроса) или листинга папки folder.
+    Вызывается обработчиками после проверки, что документ или папка существуют.
+    """
+    if WARMUP_HEADER.decode() in request.headers:
+        return
+    key = request.scope["path"]
+    if folder:
+        key += "?folder=" + quote(folder)
+    access_stats.record(key)
+
+
+async def _replay(app, url: str) -> int:
+    """GET-запрос к приложению в обход сети; тело ответа отбрасывается, возвращается статус"""
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": quote(path).encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        # Как у браузера: прогревается и сжатый вариант страницы
+        "headers": [(b"host", b"localhost"), (b"accept-encoding", b"br, gzip"), (WARMUP_HEADER, b"1")],
+        "client": None,
+        "server": ("localhost", 80),
+    }
+    disconnected = asyncio.Event()
+    status = 0
+    sent_request = False
+
+    async def receive() -> dict:
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+    return status
+
+
+def _readahead(path: Path) -> None:
+    """Просит ОС заранее прочитать файл в кэш страниц (без копирования в память процесса)"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+class HotsetWarmer:
+    """
+    Фоновая стадия прогрева: открывает самые посещаемые страницы, пока не кончится
+    список, бюджет времени или процессорного времени (CPU процесса, включая потоки)
+    """
+
+    def __init__(self, library: LibraryIndex, stats: AccessStats, top_n: int,
+                 time_budget: float, cpu_budget: float, concurrency: int):
+        self.library = library
+        self.stats = stats
+        self.top_n = top_n
+        self.time_budget = time_budget
+        self.cpu_budget = cpu_budget
+        self.concurrency = max(concurrency, 1)
+        self.progress = {"state": "idle", "total": 0, "done": 0, "failed": 0, "elapsed": 0.0, "cpu": 0.0,
+                         "budget_exhausted": False}
+
+    @property
+    def ready(self) -> bool:
+        return self.progress["state"] in ("done", "disabled", "stopped")
+
+    def _document_path(self, url: str) -> Optional[Path]:
+        for prefix in VIEW_PREFIXES:
+            if url.startswith(prefix):
+                path = (self.library.root / url[len(prefix):]).resolve()
+                if path.is_relative_to(self.library.root) and path.is_file():
+                    return path
+        return None
+
+    async def warm(self, app, url: str) -> bool:
+        document = await asyncio.to_thread(self._document_path, url)
+        if document is not None:
+            await asyncio.to_thread(_readahead, document)
+        status = await _replay(app, url)
+        if status == 404:
+            # Документ или папка удалены - больше не прогреваем
+            self.stats.forget(url)
+        return 200 <= status < 400
+
+    async def run(self, app, stop_event: asyncio.Event) -> None:
+        try:
+            if self.top_n <= 0:
+                self.progress["state"] = "disabled"
+                return
+            urls = self.stats.top(self.top_n)
+            self.progress.update(state="running", total=len(urls))
+            started, cpu_started = time.perf_counter(), time.process_time()
+            queue = iter(urls)
+
+            def over_budget() -> bool:
+                self.progress["elapsed"] = round(time.perf_counter() - started, 3)
+                self.progress["cpu"] = round(time.process_time() - cpu_started, 3)
+                if self.progress["elapsed"] >= self.time_budget or self.progress["cpu"] >= self.cpu_budget:
+                    self.progress["budget_exhausted"] = True
+                return self.progress["budget_exhausted"]
+
+            async def worker() -> None:
+                for url in queue:
+                    if stop_event.is_set() or over_budget():
+                        return
+                    try:
+                        ok = await self.warm(app, url)
+                    except Exception as e:
+                        logger.error(f"Error warming {url}: {str(e)}")
+                        ok = False
+                    self.progress["done" if ok else "failed"] += 1
+
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(urls)) or 1)))
+            over_budget()
+            self.progress["state"] = "stopped" if stop_event.is_set() else "done"
+            logger.info(f"Warm-up finished: {self.progress}")
+        finally:
+            if not self.ready:
+                self.progress["state"] = "stopped"
+
+    def status(self) -> dict:
+        return dict(self.progress, ready=self.ready, top_n=self.top_n, **self.stats.stats())
+
+
+hotset_warmer = HotsetWarmer(
+    library_index,
+    access_stats,
+    config.WARMUP_TOP_N,
+    config.WARMUP_TIME_BUDGET,
+    config.WARMUP_CPU_BUDGET,
+    config.WARMUP_CONCURRENCY,
+)
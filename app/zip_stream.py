@@ -0,0 +1,213 @@
+"""
+Потоковая сборка ZIP-архива без временных файлов.
+
+Все записи используют дескриптор данных (CRC считается на лету), поэтому архив
+пишется за один проход с постоянным расходом памяти. PDF сохраняются без сжатия (STORED),
+Markdown сжимается (DEFLATE); размер сжатых записей вычисляется предварительным проходом
+и запоминается, так что итоговый размер архива известен до начала передачи.
+"""
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from app.executor import run_io
+
+CHUNK_SIZE = 64 * 1024
+CENTRAL_BATCH = 256
+DEFLATE_LEVEL = 6
+
+STORED = 0
+DEFLATED = 8
+
+# Флаги записи: бит 3 - дескриптор данных, бит 11 - имена в UTF-8
+FLAGS = 0x0808
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_ENTRY_LIMIT = 0xFFFF
+
+# Расширения, которые сжимаются; остальное (PDF) сохраняется как есть
+DEFLATE_SUFFIXES = (".md", ".markdown")
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    path: Path
+    size: int
+    mtime: float
+    method: int = STORED
+    compressed_size: int = 0
+    offset: int = 0
+    crc: int = 0
+
+
+def _new_compressor():
+    return zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+
+
+@lru_cache(maxsize=4096)
+def deflated_size(path: str, mtime_ns: int, size: int) -> int:
+    """Размер сжатых данных файла; сжатие детерминировано, поэтому совпадёт при передаче"""
+    compressor = _new_compressor()
+    total = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            total += len(compressor.compress(chunk))
+    return total + len(compressor.flush())
+
+
+def _dos_datetime(timestamp: float) -> tuple[int, int]:
+    t = time.localtime(max(timestamp, 315532800))  # ZIP не хранит даты раньше 1980 года
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class ZipStream:
+    """Архив из списка файлов: размер вычисляется заранее, содержимое отдаётся блоками"""
+
+    def __init__(self, files: list[tuple[str, Path]]):
+        self.entries: list[ZipEntry] = []
+        for name, path in files:
+            stat = path.stat()
+            entry = ZipEntry(name=name, path=path, size=stat.st_size, mtime=stat.st_mtime)
+            if name.lower().endswith(DEFLATE_SUFFIXES):
+                entry.method = DEFLATED
+                entry.compressed_size = deflated_size(str(path), stat.st_mtime_ns, stat.st_size)
+            else:
+                entry.compressed_size = entry.size
+            self.entries.append(entry)
+
+        # ZIP64 включается для всего архива, если не хватает 32-битных полей
+        self.zip64 = False
+        self._layout()
+        if (self.central_offset + self.central_size >= ZIP64_LIMIT or len(self.entries) >= ZIP64_ENTRY_LIMIT
+                or any(entry.size >= ZIP64_LIMIT for entry in self.entries)):
+            self.zip64 = True
+            self._layout()
+
+    def _layout(self) -> None:
+        """Смещения записей и итоговый размер архива"""
+        offset = 0
+        for entry in self.entries:
+            entry.offset = offset
+            offset += self._local_header_size(entry) + entry.compressed_size + self._descriptor_size()
+        self.central_offset = offset
+        self.central_size = sum(self._central_header_size(entry) for entry in self.entries)
+        self.content_length = self.central_offset + self.central_size + len(self._end_records())
+
+    # --- Размеры структур ---
+
+    def _local_header_size(self, entry: ZipEntry) -> int:
+        return 30 + len(entry.name.encode()) + (20 if self.zip64 else 0)
+
+    def _descriptor_size(self) -> int:
+        return 24 if self.zip64 else 16
+
+    def _central_header_size(self, entry: ZipEntry) -> int:
+        return 46 + len(entry.name.encode()) + (28 if self.zip64 else 0)
+
+    # --- Структуры ---
+
+    def _local_header(self, entry: ZipEntry) -> bytes:
+        name = entry.name.encode()
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        extra = b""
+        sizes = 0
+        version = 20
+        if self.zip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+            sizes = ZIP64_LIMIT
+            version = 45
+        return struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, version, FLAGS, entry.method, dos_time, dos_date,
+            0, sizes, sizes, len(name), len(extra)
+        ) + name + extra
+
+    def _descriptor(self, entry: ZipEntry) -> bytes:
+        if self.zip64:
+            return struct.pack("<IIQQ", 0x08074B50, entry.crc, entry.compressed_size, entry.size)
+        return struct.pack("<IIII", 0x08074B50, entry.crc, entry.compressed_size, entry.size)
+
+    def _central_header(self, entry: ZipEntry) -> bytes:
+        name = entry.name.encode()
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        if self.zip64:
+            extra = struct.pack("<HHQQQ", 0x0001, 24, entry.size, entry.compressed_size, entry.offset)
+            compressed = size = offset = ZIP64_LIMIT
+            version = 45
+        else:
+            extra = b""
+            compressed, size, offset = entry.compressed_size, entry.size, entry.offset
+            version = 20
+        return struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, version, version, FLAGS, entry.method, dos_time, dos_date,
+            entry.crc, compressed, size, len(name), len(extra), 0, 0, 0, 0, offset
+        ) + name + extra
+
+    def _end_records(self) -> bytes:
+        count = len(self.entries)
+        records = b""
+        if self.zip64:
+            zip64_end_offset = self.central_offset + self.central_size
+            records += struct.pack(
+                "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, self.central_size, self.central_offset
+            )
+            records += struct.pack("<IIQI", 0x07064B50, 0, zip64_end_offset, 1)
+            return records + struct.pack(
+                "<IHHHHIIH", 0x06054B50, 0, 0, 0xFFFF, 0xFFFF, ZIP64_LIMIT, ZIP64_LIMIT, 0)
+        return struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, count, count, self.central_size, self.central_offset, 0)
+
+    # --- Передача ---
+
+    @staticmethod
+    def _read_chunk(f, entry: ZipEntry, compressor) -> tuple[bytes, bool]:
+        """Читает и (при необходимости) сжимает следующий блок; выполняется в пуле ввода-вывода"""
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return (compressor.flush() if compressor else b""), True
+        entry.crc = zlib.crc32(chunk, entry.crc)
+        return (compressor.compress(chunk) if compressor else chunk), False
+
+    async def iter_bytes(self) -> AsyncIterator[bytes]:
+        for entry in self.entries:
+            yield self._local_header(entry)
+            entry.crc = 0
+            compressor = _new_compressor() if entry.method == DEFLATED else None
+            written = 0
+            f = await run_io(open, entry.path, "rb")
+            try:
+                while True:
+                    data, done = await run_io(self._read_chunk, f, entry, compressor)
+                    if data:
+                        written += len(data)
+                        yield data
+                    if done:
+                        break
+            finally:
+                await run_io(f.close)
+            if written != entry.compressed_size:
+                # Файл изменился во время передачи: заявленный размер архива уже не выполнить
+                raise RuntimeError(f"File changed while streaming: {entry.name}")
+            yield self._descriptor(entry)
+
+        # Центральный каталог отдаётся порциями, чтобы не собирать его целиком в памяти
+        for start in range(0, len(self.entries), CENTRAL_BATCH):
+            yield b"".join(self._central_header(entry) for entry in self.entries[start:start + CENTRAL_BATCH])
+        yield self._end_records()
+
+
+def folder_archive_name(folder: str, default: str = "library") -> str:
+    return (folder.rsplit("/", 1)[-1] or default) + ".zip"
+
+
+def build_zip_stream(files: list[tuple[str, Path]]) -> Optional[ZipStream]:
+    """Подготавливает архив (stat и предварительный проход сжатия); выполняется вне цикла событий"""
+    if not files:
+        return None
+    return ZipStream(files)
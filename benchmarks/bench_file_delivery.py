@@ -0,0 +1,120 @@
+"""
+Отдача файлов через прокси (FILE_DELIVERY=accel|sendfile) и приложением: сквозная проверка
+заголовков на приложении в процессе. В каждом режиме скачиваются PDF, линеаризованная копия
+(строится фоновой стадией, если установлен pikepdf) и Markdown с кириллицей в имени;
+проверяются X-Accel-Redirect / X-Sendfile, Content-Disposition и пустое тело, а в режиме
+app - содержимое. Пропускная способность nginx здесь не измеряется.
+
+    python -m benchmarks.bench_file_delivery --size-mb 64
+
+При несовпадении заголовков процесс завершается с кодом 1.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+def make_library(root: Path, size_mb: int) -> None:
+    from benchmarks.synthetic_library import pdf_document
+
+    pages = max(5, size_mb * 16)
+    (root / "big.pdf").write_bytes(pdf_document(pages, size_mb * 1024 * 1024 // pages))
+    (root / "small.pdf").write_bytes(pdf_document(2, 1024))
+    (root / "Заметки").mkdir()
+    (root / "Заметки" / "Шпаргалка по nginx.md").write_text("# nginx\n\nX-Accel-Redirect\n", encoding="utf-8")
+
+
+# --- Заголовки ---
+
+def check_headers(root: Path) -> list[str]:
+    from fastapi.testclient import TestClient
+    from app import config
+    from app.main import app
+    from app.pdf_optimize import pdf_optimize_store
+
+    failures = []
+
+    def expect(condition: bool, message: str) -> None:
+        print(f"  {'ok' if condition else 'FAIL'}: {message}")
+        if not condition:
+            failures.append(message)
+
+    markdown_path = "Заметки/Шпаргалка по nginx.md"
+    downloads = {
+        "pdf": ("/pdf/download/big.pdf", "big.pdf"),
+        "linearized": ("/pdf/download/small.pdf", "small.pdf"),
+        "markdown": ("/markdown/download/" + quote(markdown_path), markdown_path),
+    }
+
+    def expected(rel_path: str) -> tuple[Path, str]:
+        """Отдаваемый файл (PDF - линеаризованная копия, если готова) и его внутренний адрес nginx"""
+        path = pdf_optimize_store.serving_path(rel_path, root / rel_path)
+        if path.is_relative_to(root):
+            return path, "/_protected/library/" + quote(rel_path)
+        return path, f"/_protected/linearized/{path.name}"
+
+    with TestClient(app) as client:
+        # Линеаризованную копию small.pdf строит фоновая стадия после старта приложения
+        deadline = time.perf_counter() + 60
+        while time.perf_counter() < deadline and pdf_optimize_store.current_record("small.pdf", root / "small.pdf") is None:
+            time.sleep(0.1)
+        if expected("small.pdf")[0].is_relative_to(root):
+            print("  linearized copy is not available (pikepdf is not installed?)")
+
+        for mode in ("app", "accel", "sendfile"):
+            config.FILE_DELIVERY = mode
+            print(f"FILE_DELIVERY={mode}")
+            for label, (url, rel_path) in downloads.items():
+                path, accel_uri = expected(rel_path)
+                response = client.get(url)
+                expect(response.status_code == 200, f"{label}: status {response.status_code}")
+                expect("attachment" in response.headers.get("content-disposition", ""),
+                       f"{label}: Content-Disposition")
+                if mode == "app":
+                    expect(response.content == path.read_bytes(), f"{label}: body matches the file")
+                    expect("x-accel-redirect" not in response.headers and "x-sendfile" not in response.headers,
+                           f"{label}: no proxy headers")
+                    continue
+                if mode == "sendfile" and not str(path.resolve()).isascii():
+                    # Путь не в ASCII нельзя передать в X-Sendfile - файл отдаёт приложение
+                    expect(response.content == path.read_bytes() and "x-sendfile" not in response.headers,
+                           f"{label}: non-ASCII path served by the app")
+                    continue
+                expect(response.content == b"", f"{label}: empty body")
+                if mode == "accel":
+                    expect(response.headers.get("x-accel-redirect") == accel_uri,
+                           f"{label}: X-Accel-Redirect {response.headers.get('x-accel-redirect')}")
+                elif str(path.resolve()).isascii():
+                    value = response.headers.get("x-sendfile")
+                    expect(value == str(path.resolve()), f"{label}: X-Sendfile {value}")
+        config.FILE_DELIVERY = "app"
+        expect(client.get("/pdf/download/../etc/passwd").status_code in (403, 404), "path outside the library")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "library"
+        data_dir = Path(tmp) / "data"
+        root.mkdir()
+        # Конфигурация читается при импорте модулей приложения, поэтому задаётся заранее
+        os.environ["LIBRARY_ROOT"] = str(root)
+        os.environ["LIBRARY_DATA_DIR"] = str(data_dir)
+        os.environ["LIBRARY_WATCH"] = "false"
+        make_library(root, args.size_mb)
+
+        failures = check_headers(root)
+        if failures:
+            print(f"{len(failures)} header checks failed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
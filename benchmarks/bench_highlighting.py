@@ -0,0 +1,170 @@
+"""
+Подсветка кода на сервере (Pygments) против highlight.js в браузере.
+
+Серверная часть: время рендеринга документа без подсветки и с ней, размер HTML
+и время ответа /markdown/view при промахе и попадании в кэш отрендеренных страниц
+(подсвеченный HTML кэшируется вместе с документом, поэтому попадание не дороже прежнего).
+
+Клиентская часть (если установлен playwright с Chromium): страница в прежнем виде
+(highlight.js и языковые пакеты с CDN, подсветка при загрузке) и в новом (готовый HTML
+и CSS темы) открываются с замедлением CPU, как на телефоне; сравнивается время
+до первой отрисовки и до окончания подсветки.
+
+    python -m benchmarks.bench_highlighting [--repeat 20] [--cpu-throttle 4] [files...]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+from app.library import get_library_root
+from app.rendering import _get_converter, highlight_stylesheet, read_document, render_markdown
+
+HLJS = "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0"
+
+# Прежняя разметка просмотрщика: библиотека с CDN и подсветка всех блоков после загрузки
+LEGACY_HEAD = f"""
+<link rel="stylesheet" href="{HLJS}/styles/atom-one-dark.min.css">
+<script src="{HLJS}/highlight.min.js"></script>
+<script src="{HLJS}/languages/dockerfile.min.js"></script>
+<script src="{HLJS}/languages/powershell.min.js"></script>
+<script src="{HLJS}/languages/bash.min.js"></script>
+<script>
+document.addEventListener('DOMContentLoaded', function() {{
+    hljs.registerAliases(['Dockerfile'], {{ languageName: 'dockerfile' }});
+    document.querySelectorAll('pre code').forEach((block) => hljs.highlightElement(block));
+    performance.mark('highlighted');
+}});
+</script>
+"""
+
+SERVER_HEAD = """
+<style>{css}</style>
+<script>
+document.addEventListener('DOMContentLoaded', function() {{ performance.mark('highlighted'); }});
+</script>
+"""
+
+PAGE = "<!DOCTYPE html><html><head><meta charset='utf-8'>{head}</head><body>{body}</body></html>"
+
+
+def render_plain(content: str) -> str:
+    """Конвертация без подсветки - то, что раньше отдавалось браузеру"""
+    converter = _get_converter()
+    try:
+        return converter.convert(content)
+    finally:
+        converter.reset()
+
+
+def measure(func, contents: list[str], repeat: int) -> float:
+    """Среднее время на документ в миллисекундах"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in contents:
+            func(content)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(contents))
+
+
+async def response_times(paths: list[Path], root: Path, repeat: int) -> tuple[float, float]:
+    """Среднее время ответа /markdown/view при промахе кэша и при попадании"""
+    import httpx
+    from app.main import app
+    from app.render_cache import render_cache
+
+    transport = httpx.ASGITransport(app=app)
+    misses, hits = [], []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in paths:
+            url = "/markdown/view/" + quote(path.relative_to(root).as_posix())
+            render_cache.clear()
+            start = time.perf_counter()
+            await client.get(url)
+            misses.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                await client.get(url)
+            hits.append((time.perf_counter() - start) / repeat)
+    return sum(misses) * 1000 / len(misses), sum(hits) * 1000 / len(hits)
+
+
+async def client_paint(pages: dict[str, Path], cpu_throttle: float) -> dict[str, dict]:
+    """Время до первой отрисовки и до окончания подсветки в Chromium"""
+    from playwright.async_api import async_playwright
+
+    results = {}
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch()
+        try:
+            for label, page_path in pages.items():
+                page = await browser.new_page()
+                session = await page.context.new_cdp_session(page)
+                await session.send("Emulation.setCPUThrottlingRate", {"rate": cpu_throttle})
+                await page.goto(page_path.as_uri(), wait_until="load")
+                await page.wait_for_function("performance.getEntriesByName('highlighted').length > 0")
+                results[label] = await page.evaluate("""() => ({
+                    fcp: (performance.getEntriesByName('first-contentful-paint')[0] || {}).startTime,
+                    highlighted: performance.getEntriesByName('highlighted')[0].startTime,
+                })""")
+                await page.close()
+        finally:
+            await browser.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--cpu-throttle", type=float, default=4.0, help="Замедление CPU в браузере (как на телефоне)")
+    parser.add_argument("--no-browser", action="store_true", help="Пропустить измерение в браузере")
+    args = parser.parse_args()
+
+    root = get_library_root()
+    paths = [path.resolve() for path in args.files] or sorted(root.rglob("*.md"))
+    contents = [read_document(path) for path in paths]
+    blocks = sum(content.count("```") // 2 for content in contents)
+    print(f"documents: {len(paths)}, fenced code blocks: {blocks}")
+
+    plain = measure(render_plain, contents, args.repeat)
+    highlighted = measure(render_markdown, contents, args.repeat)
+    plain_bytes = sum(len(render_plain(content).encode()) for content in contents)
+    highlighted_bytes = sum(len(render_markdown(content).encode()) for content in contents)
+    print(f"render without highlighting: {plain:8.2f} ms/doc  html={plain_bytes // 1024} KB")
+    print(f"render with highlighting:    {highlighted:8.2f} ms/doc  html={highlighted_bytes // 1024} KB")
+
+    miss, hit = asyncio.run(response_times([p for p in paths if p.is_relative_to(root)], root, args.repeat))
+    print(f"/markdown/view: cache miss {miss:.2f} ms, cache hit {hit:.2f} ms")
+
+    if args.no_browser:
+        return
+    try:
+        import playwright  # noqa: F401
+    except ImportError:
+        print("playwright is not installed, client paint time is not measured "
+              "(pip install playwright && playwright install chromium)")
+        return
+
+    # Самый большой документ - худший случай для подсветки в браузере
+    largest = max(range(len(contents)), key=lambda i: len(contents[i]))
+    with tempfile.TemporaryDirectory() as tmp:
+        pages = {
+            "highlight.js": Path(tmp) / "legacy.html",
+            "server": Path(tmp) / "server.html",
+        }
+        pages["highlight.js"].write_text(PAGE.format(
+            head=LEGACY_HEAD, body=render_plain(contents[largest])), encoding="utf-8")
+        pages["server"].write_text(PAGE.format(
+            head=SERVER_HEAD.format(css=highlight_stylesheet()),
+            body=render_markdown(contents[largest])), encoding="utf-8")
+        results = asyncio.run(client_paint(pages, args.cpu_throttle))
+
+    print(f"client ({paths[largest].name}, CPU x{args.cpu_throttle:g}):")
+    for label, result in results.items():
+        print(f"  {label:>12}: first paint {result['fcp'] or 0:8.1f} ms, highlighted {result['highlighted']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
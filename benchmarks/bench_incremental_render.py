@@ -0,0 +1,179 @@
+"""
+Инкрементальный рендеринг Markdown по блокам.
+
+1. Совпадение с конвертацией целиком (вместо property-based теста - тестов в репозитории
+   нет): для --cases случайных документов из всех видов блоков (заголовки, в том числе
+   повторяющиеся и пустые, блоки кода с ``` и ~~~, таблицы, списки, цитаты, отступы,
+   ссылки с определениями, CRLF) и цепочки случайных правок каждого из них
+   render_markdown должен давать ровно тот же HTML, что convert_markdown. Так же
+   проверяются заметки из --corpus.
+2. Замер на многомегабайтных документах: конвертация целиком, первый рендер по блокам
+   (пустой кэш) и повторный рендер после небольшой правки.
+
+    python -m benchmarks.bench_incremental_render --cases 300 --size-mb 2 --edits 5
+
+При расхождении выводится номер случая, и процесс завершается с кодом 1.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_library import markdown_document
+
+WORDS = ("alpha", "beta", "Гамма", "дельта", "epsilon", "zeta", "`code`", "**bold**", "_em_", "[link][ref1]", "[ref2]",
+         "[inline](http://example.com)", "a_1", "C#", ".NET", "x < y", "&amp;")
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def random_block(rng: random.Random) -> str:
+    kind = rng.randrange(14)
+    if kind == 0:
+        # Повторяющиеся и "подозрительные" заголовки проверяют уникальность id
+        return "#" * rng.randint(1, 6) + " " + rng.choice(("Intro", "Intro", "a_1", "Итоги", "", _words(rng, 3)))
+    if kind == 1:
+        fence = rng.choice(("```", "~~~", "````"))
+        language = rng.choice(("", "python", "csharp", "dockerfile", "unknown-lang"))
+        inner = ("x = 1", "", "# not a heading", "    indented", "<div>", "[ref1]: /in-code") + (
+            ("```",) if fence != "```" else ())
+        body = "\n".join(rng.choice(inner) for _ in range(rng.randint(1, 6)))
+        return f"{fence}{language}\n{body}\n{fence}"
+    if kind == 2:
+        rows = "\n".join(f"| {_words(rng, 1)} | {i} |" for i in range(rng.randint(1, 4)))
+        return "| Ключ | Значение |\n|---|---|\n" + rows
+    if kind == 3:
+        marker = rng.choice(("- ", "* ", "1. "))
+        return "\n".join(marker + _words(rng, 4) for _ in range(rng.randint(1, 4)))
+    if kind == 4:
+        return "> " + _words(rng, 6) + ("\n> " + _words(rng, 3) if rng.random() < 0.5 else "")
+    if kind == 5:
+        return "    " + _words(rng, 4) + "\n    " + _words(rng, 2)
+    if kind == 6:
+        # Обычно одно значение на ссылку и отдельный абзац; иногда - переопределение
+        # или определение вплотную к соседнему блоку (такие документы рендерятся целиком)
+        name = rng.choice(("ref1", "ref2"))
+        url = f"http://example.com/{name}" if rng.random() < 0.97 else "http://example.com/other"
+        text = f'[{name}]: {url} "Title"'
+        return text if rng.random() < 0.05 else f"\n{text}\n"
+    if kind == 7:
+        return rng.choice(("---", "***", "* * *"))
+    if kind == 8:
+        return _words(rng, 5) + "\n" + rng.choice(("===", "---"))
+    if kind == 9:
+        return "  - " + _words(rng, 3)
+    return "\n".join(_words(rng, rng.randint(3, 15)) for _ in range(rng.randint(1, 3)))
+
+
+def random_document(rng: random.Random, blocks: int) -> str:
+    separators = ("\n\n", "\n\n", "\n\n\n", "\n", "\n  \n")
+    text = ""
+    for _ in range(blocks):
+        text += random_block(rng) + rng.choice(separators)
+    if rng.random() < 0.2:
+        text = text.replace("\n", "\r\n")
+    return text
+
+
+def random_edit(rng: random.Random, text: str) -> str:
+    position = rng.randrange(len(text) + 1)
+    action = rng.randrange(3)
+    if action == 0:
+        return text[:position] + "\n\n" + random_block(rng) + "\n\n" + text[position:]
+    if action == 1:
+        return text[:position] + text[position + rng.randint(1, 200):]
+    return text[:position] + rng.choice(WORDS) + text[position:]
+
+
+# --- Проверка ---
+
+def check_identical(cases: int, blocks: int, edits: int, corpus: list[Path]) -> tuple[list[str], int]:
+    """Расхождения и число документов, которые действительно рендерились по блокам"""
+    from app.rendering import INCREMENTAL_MIN_SIZE, block_cache, convert_markdown, read_document, render_markdown
+
+    failures = []
+    by_blocks = 0
+
+    def compare(label: str, text: str) -> None:
+        nonlocal by_blocks
+        lookups = block_cache.hits + block_cache.misses
+        if render_markdown(text) != convert_markdown(text):
+            failures.append(label)
+        by_blocks += block_cache.hits + block_cache.misses != lookups
+
+    for case in range(cases):
+        rng = random.Random(case)
+        text = random_document(rng, blocks)
+        # Короткие документы рендерятся целиком - дополняем до порога
+        while len(text) < INCREMENTAL_MIN_SIZE:
+            text += "\n\n" + random_document(rng, blocks)
+        compare(f"case {case}", text)
+        for edit in range(edits):
+            text = random_edit(rng, text)
+            compare(f"case {case}, edit {edit + 1}", text)
+
+    for path in corpus:
+        compare(str(path), read_document(path))
+    return failures, by_blocks
+
+
+# --- Замер ---
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def benchmark(size_mb: float, edits: int) -> None:
+    from app.rendering import block_cache, convert_markdown, render_markdown
+
+    rng = random.Random(42)
+    text = markdown_document(rng, "Large", int(size_mb * 1024 * 1024))
+    full = [timed(convert_markdown, text) for _ in range(2)]
+    block_cache.clear()
+    cold = timed(render_markdown, text)
+    edited = []
+    for _ in range(edits):
+        # Правка одного абзаца в случайном месте документа
+        position = text.find("\n\n", rng.randrange(len(text))) + 2
+        text = text[:position] + _words(rng, 8) + " " + text[position:]
+        edited.append(timed(render_markdown, text))
+    stats = block_cache.stats()
+    print(f"{size_mb:g} MB document ({len(text) / 2 ** 20:.1f} M chars), {stats['entries']} cached blocks")
+    print(f"  full conversion:        {statistics.median(full) * 1000:9.1f} ms")
+    print(f"  blocks, empty cache:    {cold * 1000:9.1f} ms")
+    print(f"  blocks, after an edit:  {statistics.median(edited) * 1000:9.1f} ms "
+          f"(p50 of {edits}; {statistics.median(full) / statistics.median(edited):.0f}x faster)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cases", type=int, default=300)
+    parser.add_argument("--blocks", type=int, default=40, help="Блоков в случайном документе")
+    parser.add_argument("--edits", type=int, default=5, help="Правок на документ")
+    parser.add_argument("--size-mb", type=float, default=2.0)
+    parser.add_argument("--corpus", default="pdf_uploads", help="Каталог с заметками для проверки")
+    args = parser.parse_args()
+    os.environ.setdefault("LIBRARY_WATCH", "false")
+
+    corpus = sorted(Path(args.corpus).rglob("*.md")) if Path(args.corpus).is_dir() else []
+    failures, by_blocks = check_identical(args.cases, args.blocks, args.edits, corpus)
+    checked = args.cases * (args.edits + 1) + len(corpus)
+    print(f"byte-identical output: {checked - len(failures)}/{checked} documents "
+          f"({by_blocks} rendered by blocks, the rest converted whole)")
+    for failure in failures[:20]:
+        print(f"  FAIL: {failure}")
+
+    benchmark(args.size_mb, args.edits)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Бенчмарк индекса библиотеки: время построения и задержка листинга папки
+из индекса в сравнении с прежним сканированием через os.listdir.
+
+    python -m benchmarks.bench_library_index --files 100000 --folders 100
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.library import LibraryIndex
+
+
+def make_tree(root: Path, files: int, folders: int) -> list[str]:
+    """Создаёт синтетическое дерево: folders папок, files пустых файлов"""
+    names = []
+    per_folder = max(1, files // folders)
+    for i in range(folders):
+        rel = f"section_{i // 10}/folder_{i}"
+        folder = root / rel
+        folder.mkdir(parents=True, exist_ok=True)
+        for j in range(per_folder):
+            suffix = ".pdf" if j % 3 == 0 else ".md"
+            (folder / f"doc_{j}{suffix}").touch()
+        names.append(rel)
+    return names
+
+
+def legacy_listing(directory: str) -> list[dict]:
+    """Прежняя реализация get_pdf_files: listdir + stat каждой записи + сортировка"""
+    files = []
+    for file in os.listdir(directory):
+        file_path = os.path.join(directory, file)
+        if os.path.isfile(file_path) and file.lower().endswith(('.pdf', '.md')):
+            files.append({'name': file, 'path': file_path})
+    return sorted(files, key=lambda x: x['name'].lower())
+
+
+def index_listing(index: LibraryIndex, folder: str) -> list[dict]:
+    entry = index.get_folder(folder)
+    return [
+        {'name': file.name, 'path': file.path}
+        for file in entry.files
+        if file.name.lower().endswith(('.pdf', '.md'))
+    ]
+
+
+def measure(func, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--folders", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        folders = make_tree(root, args.files, args.folders)
+
+        index = LibraryIndex(root)
+        start = time.perf_counter()
+        index.build()
+        print(f"build: {(time.perf_counter() - start) * 1000:.1f} ms, {index.stats()}")
+
+        folder = folders[len(folders) // 2]
+        print("legacy listing:", measure(lambda: legacy_listing(str(root / folder)), args.repeat))
+        print("index listing: ", measure(lambda: index_listing(index, folder), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Микробенчмарк конвертации одного документа: прежний конвейер view_pdf
+(новые расширения и экземпляр Markdown на каждый вызов, до трёх чтений файла,
+компиляция регулярного выражения) против общего движка app.rendering.
+
+    python -m benchmarks.bench_markdown_engine [--repeat 20] [files...]
+"""
+import argparse
+import re
+import time
+from pathlib import Path
+
+import markdown
+from markdown.extensions import fenced_code, tables
+
+from app.library import get_library_root
+from app.rendering import read_document, render_markdown
+
+
+def legacy_render(path: Path) -> str:
+    encodings = ['utf-8', 'cp1251', 'latin-1']
+    content = None
+    for encoding in encodings:
+        try:
+            with open(path, 'r', encoding=encoding) as file:
+                content = file.read()
+            break
+        except UnicodeDecodeError:
+            continue
+    fenced_code_ext = fenced_code.FencedCodeExtension(lang_prefix='language-')
+    tables_ext = tables.TableExtension()
+    html_content = markdown.markdown(content, extensions=[fenced_code_ext, tables_ext, 'toc', 'nl2br'])
+    return re.sub(r'<code class=[\'"]dockerfile[\'"]>', '<code class="language-dockerfile">', html_content)
+
+
+def engine_render(path: Path) -> str:
+    return render_markdown(read_document(path))
+
+
+def measure(func, paths: list[Path], repeat: int) -> float:
+    """Среднее время на документ в миллисекундах"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            func(path)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    paths = args.files or sorted(get_library_root().rglob("*.md"))
+    mismatches = [path for path in paths if legacy_render(path) != engine_render(path)]
+    print(f"documents: {len(paths)}, output mismatches: {len(mismatches)}")
+
+    legacy = measure(legacy_render, paths, args.repeat)
+    engine = measure(engine_render, paths, args.repeat)
+    print(f"legacy pipeline: {legacy:.3f} ms/doc")
+    print(f"render engine:   {engine:.3f} ms/doc ({legacy / engine:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
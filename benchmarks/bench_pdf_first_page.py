@@ -0,0 +1,159 @@
+"""
+Время до первой страницы PDF: исходный файл против линеаризованной копии.
+
+Клиент моделирует загрузчик pdf.js с Range-запросами блоками по 64 КБ
+(rangeChunkSize из pdf_viewer.html) поверх приложения в процессе:
+- линеаризованный файл: первый блок, затем (если нужно) байты до конца секции первой страницы (/E);
+- обычный файл: первый блок, хвост с xref, затем по цепочке каталог -> дерево страниц ->
+  страница -> содержимое, каждый шаг - отдельный запрос, если байты ещё не загружены.
+Время = измеренное время ответов + RTT x число последовательных запросов.
+
+    python -m benchmarks.bench_pdf_first_page --rtt-ms 50 --sizes-kb 52 2048 20480
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+CHUNK = 65536
+
+
+def object_offsets(path: Path) -> tuple[dict[int, int], dict]:
+    """Смещения объектов и номера объектов, нужных для первой страницы"""
+    from pypdf import PdfReader
+    from app.pdf_optimize import _reference_ids
+
+    reader = PdfReader(str(path))
+    offsets = {idnum: offset for table in reader.xref.values() for idnum, offset in table.items()}
+    for idnum, (stream_id, _) in getattr(reader, "xref_objStm", {}).items():
+        if stream_id in offsets:
+            offsets.setdefault(idnum, offsets[stream_id])
+    page = reader.pages[0]
+    chain = {
+        "catalog": reader.trailer.raw_get("/Root").idnum,
+        "pages": reader.trailer["/Root"].raw_get("/Pages").idnum,
+        "page": page.indirect_reference.idnum,
+        "contents": _reference_ids(page.raw_get("/Contents")),
+    }
+    return offsets, chain
+
+
+class RangeClient:
+    def __init__(self, client, url: str, rtt: float):
+        self.client = client
+        self.url = url
+        self.rtt = rtt
+        self.loaded: set[int] = set()
+        self.requests = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.length = 0
+
+    async def fetch_chunks(self, chunks: set[int]) -> None:
+        """Один запрос на все недостающие блоки (как один шаг загрузчика)"""
+        missing = sorted(chunks - self.loaded)
+        if not missing:
+            return
+        start = missing[0] * CHUNK
+        end = (missing[-1] + 1) * CHUNK - 1
+        if self.length:
+            end = min(end, self.length - 1)
+        began = time.perf_counter()
+        response = await self.client.get(self.url, headers={"Range": f"bytes={start}-{end}"})
+        self.elapsed += time.perf_counter() - began + self.rtt
+        response.raise_for_status()
+        self.length = int(response.headers["content-range"].rsplit("/", 1)[1])
+        self.requests += 1
+        self.bytes += len(response.content)
+        self.loaded.update(range(missing[0], missing[-1] + 1))
+
+    async def fetch_range(self, start: int, end: int) -> None:
+        await self.fetch_chunks(set(range(start // CHUNK, max(start, end - 1) // CHUNK + 1)))
+
+
+async def first_page_linearized(client, url: str, path: Path, rtt: float) -> RangeClient:
+    from app.pdf_optimize import first_page_end
+
+    loader = RangeClient(client, url, rtt)
+    await loader.fetch_chunks({0})
+    await loader.fetch_range(0, first_page_end(str(path)) or loader.length)
+    return loader
+
+
+async def first_page_regular(client, url: str, path: Path, rtt: float) -> RangeClient:
+    offsets, chain = object_offsets(path)
+    loader = RangeClient(client, url, rtt)
+    await loader.fetch_chunks({0})
+    # Хвост файла: startxref и таблица (или поток) перекрёстных ссылок
+    await loader.fetch_range(max(0, loader.length - CHUNK), loader.length)
+    xref = max(offsets.values()) if offsets else 0
+    await loader.fetch_range(min(xref, loader.length - 1), loader.length)
+    for step in ("catalog", "pages", "page"):
+        await loader.fetch_range(offsets[chain[step]], offsets[chain[step]] + 1)
+    for idnum in chain["contents"]:
+        await loader.fetch_range(offsets[idnum], offsets[idnum] + 1)
+    return loader
+
+
+def make_documents(root: Path, sizes_kb: list[int]) -> list[tuple[str, Path, Path]]:
+    """Пары (исходный, линеаризованный) для каждого размера; плюс Net Junior.pdf из библиотеки"""
+    from app.pdf_optimize import optimize_pdf
+    from benchmarks.synthetic_library import pdf_document
+
+    sources = []
+    library_file = Path("pdf_uploads/.Net/Net Junior.pdf")
+    if library_file.exists():
+        sources.append(("Net Junior.pdf", library_file.read_bytes()))
+    for size in sizes_kb:
+        pages = max(5, size // 64)
+        sources.append((f"synthetic_{size}kb.pdf", pdf_document(pages, size * 1024 // pages)))
+
+    documents = []
+    for name, data in sources:
+        original = root / f"orig_{name}"
+        original.write_bytes(data)
+        linearized = root / f"lin_{name}"
+        optimize_pdf(str(original), str(linearized))
+        documents.append((name, original, linearized))
+    return documents
+
+
+async def run(root: Path, documents, rtt: float, repeat: int) -> None:
+    import httpx
+    from urllib.parse import quote
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, original, linearized in documents:
+            print(f"{name} ({original.stat().st_size // 1024} KB)")
+            for label, path, strategy in (("original", original, first_page_regular),
+                                          ("linearized", linearized, first_page_linearized)):
+                url = f"/pdf/download/{quote(path.name)}"
+                results = [await strategy(client, url, path, rtt) for _ in range(repeat)]
+                best = min(results, key=lambda loader: loader.elapsed)
+                print(f"  {label:>10}: {best.elapsed * 1000:8.1f} ms  size={path.stat().st_size}  "
+                      f"requests={best.requests}  bytes={best.bytes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes-kb", type=int, nargs="*", default=[52, 2048, 20480])
+    parser.add_argument("--rtt-ms", type=float, default=50.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        # Конфигурация читается при импорте модулей приложения, поэтому задаётся заранее;
+        # документы отдаются как есть, фоновая линеаризация здесь не запускается
+        os.environ["LIBRARY_ROOT"] = tmp
+        os.environ.setdefault("LIBRARY_DATA_DIR", str(root / "data"))
+        documents = make_documents(root, args.sizes_kb)
+        asyncio.run(run(root, documents, args.rtt_ms / 1000, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Задержка полнотекстового поиска на десятках тысяч документов.
+
+Создаётся синтетическая библиотека из --docs Markdown-заметок: разметка из
+synthetic_library (её слова есть в каждом документе) и абзацы со словарём, частоты слов
+в котором распределены по закону Ципфа, как в обычных текстах. Индекс строится целиком,
+затем замеряются: запросы (поиск + сниппеты, p50/p99), точечное обновление одного файла
+через обработчик изменений библиотеки, сохранение и загрузка индекса с диска.
+
+Бюджет проверяется на запросах из словаря Ципфа (частые, средние и редкие слова); запросы
+из слов, которые есть в каждом документе, выводятся отдельно как худший случай.
+
+    python -m benchmarks.bench_search --docs 20000 --budget-ms 20
+
+Если p99 запроса превышает --budget-ms, процесс завершается с кодом 1.
+"""
+import argparse
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_library import markdown_document
+
+# Запросы из слов, которые есть в каждом документе
+WORST_CASE_QUERIES = ("кэш", "шаблон страницы", "render template", "сервер запрос индекс")
+
+VOCABULARY_SIZE = 50000
+SYLLABLES = ("ка", "ло", "ми", "ре", "ст", "на", "ви", "до", "ter", "on", "ex", "al", "ri", "pro", "vel", "ка")
+
+
+def vocabulary(rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))))
+    return sorted(words)
+
+
+def zipf_paragraph(rng: random.Random, words: list[str], weights: list[float], count: int) -> str:
+    return " ".join(rng.choices(words, cum_weights=weights, k=count)).capitalize() + "."
+
+
+def make_library(root: Path, docs: int, rng: random.Random, words: list[str]) -> list[str]:
+    weights = list(itertools.accumulate(1 / rank ** 1.1 for rank in range(1, len(words) + 1)))
+    paths = []
+    for i in range(docs):
+        rel = f"section_{i % 50}/note_{i}.md"
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        text = markdown_document(rng, f"Заметка {i}", rng.randint(300, 1000))
+        text += "\n\n".join(zipf_paragraph(rng, words, weights, rng.randint(30, 120)) for _ in range(4))
+        if i % 997 == 0:
+            text += "\n\nKestrel и user-secrets в ASP.NET Core.\n"
+        (root / rel).write_text(text, encoding="utf-8")
+        paths.append(rel)
+    return paths
+
+
+def timed_ms(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def query_latency(index, queries, repeat: int) -> tuple[float, float]:
+    samples = sorted(timed_ms(index.search, query) for query in queries for _ in range(repeat))
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=50, help="Повторов каждого запроса")
+    parser.add_argument("--budget-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    from app.library import LibraryIndex
+    from app.search import SearchIndex
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "library"
+        root.mkdir()
+        words = vocabulary(rng)
+        paths = make_library(root, args.docs, rng, words)
+        library = LibraryIndex(root.resolve())
+        library.build()
+        index = SearchIndex(library, Path(tmp) / "search_index.json")
+        library.add_listener(index.on_library_change)
+
+        print(f"build: {timed_ms(index.sync) / 1000:.1f} s, {index.stats()}")
+        print(f"save:  {timed_ms(index.save):.0f} ms")
+        print(f"load:  {timed_ms(SearchIndex(library, index.storage_path).load):.0f} ms")
+
+        # Одно-, двух- и трёхсловные запросы из частых, средних и редких слов словаря
+        queries = [" ".join(rng.choice(words[low:high]) for _ in range(length))
+                   for low, high in ((0, 100), (100, 5000), (5000, len(words)))
+                   for length in (1, 2, 3)
+                   for _ in range(3)]
+        p50, p99 = query_latency(index, queries, args.repeat)
+        print(f"query (20 results with snippets): p50 {p50:.2f} ms, p99 {p99:.2f} ms (budget {args.budget_ms:g} ms)")
+        worst_p50, worst_p99 = query_latency(index, WORST_CASE_QUERIES, args.repeat)
+        print(f"  worst case, terms in every document: p50 {worst_p50:.2f} ms, p99 {worst_p99:.2f} ms")
+
+        # Правка одного файла: событие библиотеки -> переиндексация только этого документа
+        updates = []
+        for rel in rng.sample(paths, 20):
+            path = root / rel
+            path.write_text(path.read_text(encoding="utf-8") + "\nKestrel\n", encoding="utf-8")
+            updates.append(timed_ms(library.apply_changes, [str(path)]))
+        print(f"single-file update: p50 {statistics.median(updates):.2f} ms, max {max(updates):.2f} ms")
+
+        if p99 > args.budget_ms:
+            print(f"FAIL: query p99 {p99:.2f} ms exceeds the budget")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
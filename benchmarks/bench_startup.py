@@ -0,0 +1,154 @@
+"""
+Время старта приложения.
+
+1. Бюджет импорта: `import app.main` в новом интерпретаторе (медиана нескольких запусков)
+   не должен превышать --import-budget-ms, а тяжёлые модули, которые загружаются лениво
+   (Markdown, Pygments, uvicorn, cProfile, pypdf и т.п.), не должны импортироваться вовсе.
+   Выводятся модули с наибольшим собственным временем импорта (python -X importtime).
+2. Время до первого успешного запроса при холодном старте: uvicorn запускается отдельным
+   процессом, клиент с момента запуска опрашивает страницу Markdown-документа (шаблон +
+   конвертация) до первого ответа 200. Старт с пустым каталогом данных соответствует
+   новому контейнеру, повторный старт с тем же каталогом - перезапуску (кэш байткода
+   шаблонов и статистика обращений уже на диске).
+
+    python -m benchmarks.bench_startup --boots 5 --import-budget-ms 300
+
+При превышении бюджета импорта процесс завершается с кодом 1.
+"""
+import argparse
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+from benchmarks.synthetic_library import markdown_document
+
+# Модули, которые не должны загружаться при импорте приложения
+LAZY_MODULES = ("markdown", "pygments", "uvicorn", "cProfile", "pstats", "pypdf", "pikepdf", "pypdfium2")
+
+IMPORT_PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import app.main\n"
+    "print(time.perf_counter() - start)\n"
+    "print(','.join(name for name in {modules!r} if name in sys.modules))\n"
+)
+
+POLL_INTERVAL = 0.01
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def app_env(root: Path, data_dir: Path) -> dict:
+    return dict(os.environ, LIBRARY_ROOT=str(root), LIBRARY_DATA_DIR=str(data_dir), LIBRARY_WATCH="false")
+
+
+# --- Импорт ---
+
+def measure_import(env: dict) -> tuple[float, list[str]]:
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(modules=LAZY_MODULES)],
+                            env=env, capture_output=True, text=True, check=True).stdout.splitlines()
+    loaded = output[1].split(",") if len(output) > 1 and output[1] else []
+    return float(output[0]), loaded
+
+
+def slowest_imports(env: dict, count: int) -> list[tuple[int, str]]:
+    """Модули с наибольшим собственным временем импорта (мкс)"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                            env=env, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[0].startswith("import time:") and parts[0][12:].strip().isdigit():
+            rows.append((int(parts[0][12:]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+# --- Первый запрос ---
+
+def first_success(root: Path, data_dir: Path, url_path: str, timeout: float = 60.0) -> float:
+    """Секунды от запуска процесса сервера до первого ответа 200 на url_path"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}{url_path}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=app_env(root, data_dir),
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    if response.status == 200:
+                        response.read()
+                        return time.perf_counter() - start
+            except OSError:
+                pass
+            time.sleep(POLL_INTERVAL)
+        raise TimeoutError(f"{url} did not respond in {timeout:g} s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--boots", type=int, default=5, help="Число запусков сервера в каждом режиме")
+    parser.add_argument("--imports", type=int, default=5, help="Число замеров импорта")
+    parser.add_argument("--import-budget-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "library"
+        root.mkdir()
+        text = markdown_document(random.Random(42), "Startup", 64 * 1024)
+        (root / "note.md").write_text(text, encoding="utf-8")
+        env = app_env(root, Path(tmp) / "import-data")
+
+        timings, loaded = [], set()
+        for _ in range(args.imports):
+            seconds, modules = measure_import(env)
+            timings.append(seconds)
+            loaded.update(modules)
+        import_ms = statistics.median(timings) * 1000
+        print(f"import app.main: p50 {import_ms:.1f} ms, min {min(timings) * 1000:.1f} ms "
+              f"(budget {args.import_budget_ms:g} ms)")
+        print("  slowest imports (self time):")
+        for micros, name in slowest_imports(env, 8):
+            print(f"    {micros / 1000:7.1f} ms  {name}")
+        failures = []
+        if import_ms > args.import_budget_ms:
+            failures.append(f"import time {import_ms:.1f} ms exceeds the budget")
+        if loaded:
+            failures.append(f"modules that should load lazily were imported: {', '.join(sorted(loaded))}")
+
+        print(f"time to first successful /markdown/view/note.md, {args.boots} boots")
+        for label, reuse in (("cold", False), ("restart", True)):
+            data_dir = Path(tmp) / "data"
+            results = []
+            for _ in range(args.boots):
+                if not reuse:
+                    shutil.rmtree(data_dir, ignore_errors=True)
+                results.append(first_success(root, data_dir, "/markdown/view/note.md"))
+            print(f"  {label:>8}: p50 {statistics.median(results) * 1000:8.1f} ms, "
+                  f"min {min(results) * 1000:8.1f} ms, max {max(results) * 1000:8.1f} ms")
+
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
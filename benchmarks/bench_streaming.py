@@ -0,0 +1,169 @@
+"""
+Потоковая отдача больших Markdown-документов против сборки всей страницы в памяти.
+
+Сервер (uvicorn) запускается отдельным процессом на синтетической библиотеке дважды:
+с STREAM_MIN_BYTES=0 (страница собирается целиком, как раньше) и с потоковой отдачей.
+Кэш страниц выключен, чтобы каждый запрос рендерил документ. Клиенты одновременно
+открывают разные большие документы; измеряются время до первого байта тела (TTFB),
+время полного ответа и пиковый RSS процесса сервера сверх его RSS до нагрузки.
+
+    python -m benchmarks.bench_streaming --documents 4 --size-mb 2 --rounds 3
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from benchmarks.synthetic_library import markdown_document
+
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def make_library(root: Path, documents: int, size_mb: float) -> list[str]:
+    rng = random.Random(42)
+    names = []
+    for i in range(documents):
+        name = f"large_{i}.md"
+        text = markdown_document(rng, f"Large {i}", int(size_mb * 1024 * 1024))
+        (root / name).write_text(text, encoding="utf-8")
+        names.append(name)
+    return names
+
+
+def process_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class ProcessRssSampler:
+    """Пиковый RSS другого процесса (через /proc)"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, process_rss(self.pid))
+
+    def __enter__(self):
+        self.peak = process_rss(self.pid)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(root: Path, port: int, stream_min_bytes: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        LIBRARY_ROOT=str(root),
+        LIBRARY_DATA_DIR=str(root / ".data"),
+        LIBRARY_WATCH="false",
+        RENDER_CACHE_MAX_BYTES="0",
+        STREAM_MIN_BYTES=str(stream_min_bytes),
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+
+
+async def wait_ready(client, timeout: float = 30.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            await client.get("/pdf/")
+            return
+        except Exception:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def view(client, name: str) -> tuple[float, float, int]:
+    """(TTFB, полное время, байт) одного просмотра"""
+    start = time.perf_counter()
+    ttfb = None
+    size = 0
+    async with client.stream("GET", f"/markdown/view/{name}", headers={"Accept-Encoding": "identity"}) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            size += len(chunk)
+    return ttfb, time.perf_counter() - start, size
+
+
+async def run_mode(root: Path, names: list[str], stream_min_bytes: int, rounds: int) -> dict:
+    import httpx
+
+    port = free_port()
+    server = start_server(root, port, stream_min_bytes)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            await wait_ready(client)
+            # Прогрев: шаблоны, пул рендеринга
+            await view(client, names[0])
+            idle = process_rss(server.pid)
+            ttfbs, totals = [], []
+            with ProcessRssSampler(server.pid) as sampler:
+                for _ in range(rounds):
+                    results = await asyncio.gather(*(view(client, name) for name in names))
+                    ttfbs.extend(result[0] for result in results)
+                    totals.extend(result[1] for result in results)
+            return {
+                "ttfb_p50": statistics.median(ttfbs),
+                "ttfb_max": max(ttfbs),
+                "total_p50": statistics.median(totals),
+                "rss_idle": idle,
+                "rss_peak": sampler.peak,
+                "bytes": results[0][2],
+            }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=4, help="Число одновременных просмотров (разных документов)")
+    parser.add_argument("--size-mb", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--stream-min-bytes", type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        names = make_library(root, args.documents, args.size_mb)
+        print(f"{args.documents} concurrent views of {args.size_mb:g} MB documents, {args.rounds} rounds")
+        for label, stream_min_bytes in (("buffered", 0), ("streamed", args.stream_min_bytes)):
+            result = asyncio.run(run_mode(root, names, stream_min_bytes, args.rounds))
+            print(f"  {label:>8}: TTFB p50 {result['ttfb_p50'] * 1000:8.1f} ms, max {result['ttfb_max'] * 1000:8.1f} ms; "
+                  f"full response p50 {result['total_p50'] * 1000:8.1f} ms; "
+                  f"RSS peak +{(result['rss_peak'] - result['rss_idle']) / 2 ** 20:.1f} MB "
+                  f"(html {result['bytes'] / 2 ** 20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
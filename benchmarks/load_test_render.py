@@ -0,0 +1,98 @@
+"""
+Нагрузочный тест рендеринга: задержка маленьких страниц, пока параллельно
+конвертируются большие Markdown-документы.
+
+    python -m benchmarks.load_test_render --large 8 --large-mb 3 --duration 10
+
+Приложение запускается в процессе (ASGI-транспорт httpx) на синтетической библиотеке.
+Конфигурацию пула можно менять переменными RENDER_EXECUTOR / RENDER_WORKERS.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+
+def make_library(root: Path, large: int, large_mb: float) -> None:
+    (root / "small.md").write_text("# Small\n\nShort note with `code`.\n", encoding="utf-8")
+    section = (
+        "## Раздел\n\nТекст абзаца с **выделением** и [ссылкой](https://example.com).\n\n"
+        "```python\nfor i in range(10):\n    print(i)\n```\n\n"
+        "| a | b |\n|---|---|\n| 1 | 2 |\n\n"
+    )
+    repeat = int(large_mb * 1024 * 1024 / len(section.encode("utf-8")))
+    for i in range(large):
+        (root / f"large_{i}.md").write_text(f"# Large {i}\n\n" + section * repeat, encoding="utf-8")
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def hammer_small(client, duration: float, concurrency: int) -> list[float]:
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get("/pdf/view/small.md")
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def render_large(client, count: int) -> list[int]:
+    responses = await asyncio.gather(*(
+        client.get(f"/pdf/view/{quote(f'large_{i}.md')}") for i in range(count)
+    ))
+    return [response.status_code for response in responses]
+
+
+def report(name: str, latencies: list[float]) -> None:
+    print(f"{name:>28}: n={len(latencies):6d} "
+          f"p50={statistics.median(latencies):7.2f} ms "
+          f"p99={percentile(latencies, 0.99):7.2f} ms "
+          f"max={max(latencies):7.2f} ms")
+
+
+async def run(args) -> None:
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.get("/pdf/view/small.md")
+
+        report("small pages only", await hammer_small(client, args.duration, args.concurrency))
+
+        large_task = asyncio.create_task(render_large(client, args.large))
+        latencies = await hammer_small(client, args.duration, args.concurrency)
+        statuses = await large_task
+        report("small + large renders", latencies)
+        print(f"large documents: {statuses.count(200)} rendered, {statuses.count(503)} rejected with 503")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--large", type=int, default=8)
+    parser.add_argument("--large-mb", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_library(Path(tmp), args.large, args.large_mb)
+        os.environ["LIBRARY_ROOT"] = tmp
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
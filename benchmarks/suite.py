@@ -0,0 +1,220 @@
+"""
+Набор сценариев нагрузки на приложение в процессе (ASGI-транспорт httpx):
+листинги, просмотр и скачивание на синтетической библиотеке.
+
+    python -m benchmarks.suite --shape quick --save benchmarks/baseline.json
+    python -m benchmarks.suite --shape quick --compare benchmarks/baseline.json
+
+Для каждого сценария выводятся пропускная способность, p50/p95/p99 и пиковый RSS.
+При сравнении с базовой линией регрессия (рост p95 или падение пропускной способности
+больше порога) отмечается, и процесс завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from benchmarks.synthetic_library import add_shape_arguments, generate, load_layout, shape_from_args
+
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+class RssSampler:
+    """Пиковый RSS процесса за время сценария (через /proc, иначе ru_maxrss)"""
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def scenarios(layout: dict) -> dict[str, dict]:
+    """Сценарий - набор URL (перебираются по кругу) и заголовки запроса"""
+    def urls(prefix: str, paths: list[str], limit: int = 200) -> list[str]:
+        return [prefix + quote(path) for path in paths[:limit]]
+
+    deepest = max(layout["folders"], key=lambda folder: folder.count("/"))
+    result = {
+        "list_pdf_root": {"urls": ["/pdf/"]},
+        "list_pdf_deep": {"urls": [f"/pdf/?folder={quote(deepest)}"]},
+        "list_markdown_root": {"urls": ["/markdown/"]},
+        "view_small_md": {"urls": urls("/pdf/view/", layout["small"])},
+        "markdown_view_small": {"urls": urls("/markdown/view/", layout["small"])},
+        "view_large_md": {"urls": urls("/pdf/view/", layout["large_md"])},
+        "view_pdf": {"urls": urls("/pdf/view/", layout["pdfs"])},
+        "download_pdf": {"urls": urls("/pdf/download/", layout["pdfs"])},
+        "download_large_pdf_range": {"urls": urls("/pdf/download/", layout["large_pdfs"]),
+                                     "headers": {"Range": "bytes=0-65535"}},
+        "download_md_gzip": {"urls": urls("/markdown/download/", layout["small"]),
+                             "headers": {"Accept-Encoding": "gzip"}},
+    }
+    return {name: scenario for name, scenario in result.items() if scenario["urls"]}
+
+
+async def run_scenario(client, scenario: dict, requests: int, concurrency: int) -> dict:
+    urls = scenario["urls"]
+    headers = scenario.get("headers", {})
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.get(urls[i % len(urls)], headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    await client.get(urls[0], headers=headers)
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1),
+    }
+
+
+async def run_suite(layout: dict, args) -> dict:
+    import httpx
+    from app.main import app
+
+    selected = scenarios(layout)
+    if args.only:
+        selected = {name: scenario for name, scenario in selected.items() if name in args.only}
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, scenario in selected.items():
+            requests = args.requests if not name.startswith(("view_large", "download_large")) else args.large_requests
+            results[name] = await run_scenario(client, scenario, requests, args.concurrency)
+            print(format_row(name, results[name]), flush=True)
+    return results
+
+
+def format_row(name: str, result: dict) -> str:
+    return (f"{name:>26}: {result['throughput_rps']:9.1f} rps  p50={result['p50_ms']:8.2f}  "
+            f"p95={result['p95_ms']:8.2f}  p99={result['p99_ms']:8.2f} ms  "
+            f"rss={result['peak_rss_mb']:7.1f} MB  errors={result['errors']}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Список регрессий относительно базовой линии"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {result['throughput_rps']} rps")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк маршрутов приложения на синтетической библиотеке")
+    add_shape_arguments(parser)
+    parser.add_argument("--library", type=Path, default=None,
+                        help="Каталог библиотеки; переиспользуется, если сгенерирован с теми же параметрами")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--large-requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", nargs="*", default=None, help="Запустить только указанные сценарии")
+    parser.add_argument("--save", type=Path, default=None, help="Сохранить результаты как базовую линию")
+    parser.add_argument("--compare", type=Path, default=None, help="Сравнить с базовой линией")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое ухудшение (доля)")
+    args = parser.parse_args()
+
+    shape = shape_from_args(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.library or Path(tmp)
+        root.mkdir(parents=True, exist_ok=True)
+        layout = load_layout(root, shape)
+        if layout is None:
+            start = time.perf_counter()
+            layout = generate(root, shape)
+            print(f"generated library in {time.perf_counter() - start:.1f}s: {root}")
+
+        # Приложение импортируется после выбора корня библиотеки; индексы на диске - во временном каталоге
+        os.environ["LIBRARY_ROOT"] = str(root)
+        os.environ.setdefault("LIBRARY_DATA_DIR", str(Path(tmp) / "data"))
+        results = asyncio.run(run_suite(layout, args))
+
+    report = {
+        "shape": layout["shape"],
+        "settings": {"requests": args.requests, "large_requests": args.large_requests,
+                     "concurrency": args.concurrency},
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"baseline saved to {args.save}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if baseline.get("shape") != report["shape"] or baseline.get("settings") != report["settings"]:
+            print("warning: baseline was recorded with a different library shape or settings")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"no regressions against {args.compare} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
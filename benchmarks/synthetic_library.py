@@ -0,0 +1,219 @@
+"""
+Генератор синтетических библиотек для бенчмарков.
+
+    python -m benchmarks.synthetic_library OUTPUT_DIR --shape wide
+    python -m benchmarks.synthetic_library OUTPUT_DIR --folders 50 --depth 6 --small 100000
+
+Содержимое детерминировано (фиксированный seed), поэтому замеры на разных машинах
+и коммитах сравнимы. Параметры сохраняются в OUTPUT_DIR/.shape.json.
+"""
+import argparse
+import json
+import random
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+SHAPE_FILE = ".shape.json"
+
+WORDS = (
+    "library document server request cache index render template folder page "
+    "библиотека документ сервер запрос кэш индекс шаблон папка страница файл"
+).split()
+
+CODE_LANGUAGES = ("python", "bash", "dockerfile", "csharp", "yaml", "")
+
+
+@dataclass
+class Shape:
+    folders: int = 20       # папок на каждом уровне
+    depth: int = 3          # глубина вложенности
+    small: int = 1000       # маленьких .md файлов, распределённых по папкам
+    large_md: int = 2       # больших Markdown документов
+    large_md_mb: float = 2.0
+    pdfs: int = 20          # PDF в папках
+    large_pdfs: int = 1
+    large_pdf_mb: float = 8.0
+    seed: int = 42
+
+
+SHAPES = {
+    "quick": Shape(folders=5, depth=2, small=200, large_md=1, large_md_mb=0.5, pdfs=5, large_pdfs=1, large_pdf_mb=2),
+    "default": Shape(),
+    "wide": Shape(folders=500, depth=1, small=10000, large_md=1, pdfs=100),
+    "deep": Shape(folders=2, depth=12, small=5000, large_md=1, pdfs=50),
+    "many": Shape(folders=100, depth=2, small=100000, large_md=2, pdfs=200),
+    "large": Shape(folders=5, depth=1, small=100, large_md=8, large_md_mb=4.0, pdfs=10, large_pdfs=4, large_pdf_mb=32),
+}
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _code_block(rng: random.Random, lines: int) -> str:
+    language = rng.choice(CODE_LANGUAGES)
+    body = "\n".join(f"value_{i} = compute({i}, '{rng.choice(WORDS)}')" for i in range(lines))
+    return f"```{language}\n{body}\n```"
+
+
+def markdown_document(rng: random.Random, title: str, target_bytes: int) -> str:
+    """Markdown с заголовками, абзацами, таблицами и блоками кода до заданного размера"""
+    parts = [f"# {title}", ""]
+    size = 0
+    section = 0
+    while size < target_bytes:
+        section += 1
+        block = [
+            f"## Раздел {section}",
+            _paragraph(rng, rng.randint(20, 80)),
+            _code_block(rng, rng.randint(3, 15)),
+            "| Ключ | Значение |\n|---|---|\n" + "\n".join(f"| {rng.choice(WORDS)} | {i} |" for i in range(4)),
+            "- " + "\n- ".join(_paragraph(rng, 6) for _ in range(3)),
+        ]
+        text = "\n\n".join(block) + "\n\n"
+        parts.append(text)
+        size += len(text.encode("utf-8"))
+    return "\n".join(parts)
+
+
+def pdf_document(pages: int, page_bytes: int) -> bytes:
+    """
+    Минимальный корректный PDF без внешних зависимостей:
+    страницы с несжатыми текстовыми потоками нужного размера
+    """
+    objects: list[bytes] = []
+    kids = []
+    line = b"BT /F1 10 Tf 40 800 Td (Synthetic benchmark page text line) Tj ET\n"
+    for page in range(pages):
+        content_id = 4 + page * 2
+        page_id = content_id + 1
+        stream = line * max(1, page_bytes // len(line))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % page_id)
+
+    header = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % pages,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(header + objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref)
+    return bytes(out)
+
+
+def folder_paths(shape: Shape) -> list[str]:
+    """Все папки дерева: folders подпапок на уровне, вглубь до depth уровней (только первая ветвь)"""
+    paths = [""]
+    level = [""]
+    for depth in range(shape.depth):
+        next_level = []
+        for parent in level:
+            for i in range(shape.folders):
+                rel = f"{parent}/d{depth}_{i}" if parent else f"d{depth}_{i}"
+                paths.append(rel)
+                next_level.append(rel)
+        # Широкие уровни ветвятся только из первой папки, чтобы дерево не росло экспоненциально
+        level = next_level[:1]
+    return paths
+
+
+def generate(root: Path, shape: Shape) -> dict:
+    """Создаёт библиотеку и возвращает пути файлов для сценариев"""
+    rng = random.Random(shape.seed)
+    folders = folder_paths(shape)
+    for rel in folders:
+        (root / rel).mkdir(parents=True, exist_ok=True)
+
+    small = []
+    for i in range(shape.small):
+        rel = f"{folders[i % len(folders)]}/note_{i}.md".lstrip("/")
+        (root / rel).write_text(markdown_document(rng, f"Заметка {i}", rng.randint(300, 3000)), encoding="utf-8")
+        small.append(rel)
+
+    large_md = []
+    for i in range(shape.large_md):
+        rel = f"large/large_{i}.md"
+        (root / "large").mkdir(exist_ok=True)
+        (root / rel).write_text(
+            markdown_document(rng, f"Большой документ {i}", int(shape.large_md_mb * 1024 * 1024)), encoding="utf-8")
+        large_md.append(rel)
+
+    pdfs = []
+    small_pdf = pdf_document(4, 4 * 1024)
+    for i in range(shape.pdfs):
+        rel = f"{folders[(i * 7) % len(folders)]}/paper_{i}.pdf".lstrip("/")
+        (root / rel).write_bytes(small_pdf)
+        pdfs.append(rel)
+
+    large_pdfs = []
+    for i in range(shape.large_pdfs):
+        rel = f"large/book_{i}.pdf"
+        (root / "large").mkdir(exist_ok=True)
+        pages = 200
+        (root / rel).write_bytes(pdf_document(pages, int(shape.large_pdf_mb * 1024 * 1024 / pages)))
+        large_pdfs.append(rel)
+
+    layout = {
+        "shape": asdict(shape),
+        "folders": folders,
+        "small": small,
+        "large_md": large_md,
+        "pdfs": pdfs,
+        "large_pdfs": large_pdfs,
+    }
+    (root / SHAPE_FILE).write_text(json.dumps(layout, ensure_ascii=False), encoding="utf-8")
+    return layout
+
+
+def load_layout(root: Path, shape: Shape) -> Optional[dict]:
+    """Описание уже сгенерированной библиотеки, если она создана с теми же параметрами"""
+    try:
+        layout = json.loads((root / SHAPE_FILE).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    return layout if layout.get("shape") == asdict(shape) else None
+
+
+def add_shape_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="default")
+    for name, value in asdict(Shape()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=None)
+
+
+def shape_from_args(args: argparse.Namespace) -> Shape:
+    shape = asdict(SHAPES[args.shape])
+    for name in shape:
+        value = getattr(args, name)
+        if value is not None:
+            shape[name] = value
+    return Shape(**shape)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетической библиотеки")
+    parser.add_argument("output", type=Path)
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    shape = shape_from_args(args)
+    args.output.mkdir(parents=True, exist_ok=True)
+    layout = generate(args.output, shape)
+    print(f"folders={len(layout['folders'])} small={len(layout['small'])} "
+          f"large_md={len(layout['large_md'])} pdfs={len(layout['pdfs'])} large_pdfs={len(layout['large_pdfs'])}")
+
+
+if __name__ == "__main__":
+    main()
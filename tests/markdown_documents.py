@@ -0,0 +1,144 @@
+"""
+Случайные Markdown-документы для проверки рендеринга по частям.
+
+Документ собирается из элементов, на которых ломается разбиение на блоки и разделы:
+заголовки (в том числе повторяющиеся и setext), блоки кода с ``` и ~~~ (внутри строки
+вида "# комментарий", пустые строки и ограждения другой длины), таблицы, списки
+с вложенными блоками кода, цитаты, определения ссылок. В режиме adversarial к ним
+добавляются блочный HTML с Markdown внутри, маркер [TOC] и HTML в начале строки -
+с ними документ должен рендериться целиком.
+"""
+import random
+
+WORDS = ("кэш", "шаблон", "render", "server", "индекс", "запрос", "ответ", "docker", "nginx",
+         "Kestrel", "поток", "блок", "файл", "page", "token", "C#", "ёлка", "*важно*", "`code`",
+         "**bold**", "[ссылка][doc]", "[site](https://example.com/a_b)", "a_b_c", "&amp;")
+# HTML в начале строки Python-Markdown может принять за блочный HTML
+HTML_WORDS = ("<br>", "<div>", "<em>x</em>")
+
+HEADING_TITLES = ("Введение", "Установка", "Пример", "Example", "Настройка", "Итоги", "FAQ")
+
+
+class DocumentGenerator:
+    def __init__(self, rng: random.Random, adversarial: bool = True):
+        self.rng = rng
+        self.adversarial = adversarial
+        self.words = WORDS + HTML_WORDS if adversarial else WORDS
+
+    def sentence(self, words: int) -> str:
+        return " ".join(self.rng.choice(self.words) for _ in range(words))
+
+    def paragraph(self) -> str:
+        lines = [self.sentence(self.rng.randint(3, 25)) for _ in range(self.rng.randint(1, 4))]
+        return "\n".join(lines).capitalize()
+
+    def heading(self) -> str:
+        rng = self.rng
+        title = rng.choice(HEADING_TITLES) + rng.choice(("", "", " 1", " " + rng.choice(WORDS)))
+        if rng.random() < 0.15:
+            return f"{title}\n{rng.choice('=-') * rng.randint(3, 10)}"
+        return "#" * rng.randint(1, 6) + " " + title
+
+    def fenced_code(self, indent: str = "") -> str:
+        rng = self.rng
+        fence = rng.choice(("```", "````", "~~~"))
+        language = rng.choice(("", "python", "bash", "c#", "dockerfile", "unknown-lang"))
+        lines = ["# комментарий, а не заголовок", "", "x = 1  # комментарий", "| a | b |",
+                 "```" if fence != "```" else "~~~"]
+        if self.adversarial:
+            lines += ["<div>не HTML</div>", "[TOC]", "[doc]: https://example.com/in-code"]
+        body = [rng.choice(lines + [self.sentence(5)]) for _ in range(rng.randint(1, 8))]
+        return "\n".join(indent + line if line else line for line in [fence + language] + body + [fence])
+
+    def table(self) -> str:
+        columns = self.rng.randint(2, 4)
+        rows = ["| " + " | ".join(self.sentence(1) for _ in range(columns)) + " |",
+                "|" + "|".join("---" for _ in range(columns)) + "|"]
+        rows += ["| " + " | ".join(self.sentence(2) for _ in range(columns)) + " |"
+                 for _ in range(self.rng.randint(1, 5))]
+        return "\n".join(rows)
+
+    def bullet_list(self) -> str:
+        rng = self.rng
+        items = []
+        for i in range(rng.randint(1, 5)):
+            marker = rng.choice(("-", "*", "+", f"{i + 1}."))
+            item = f"{marker} {self.sentence(rng.randint(2, 10))}"
+            kind = rng.random()
+            if kind < 0.2:
+                # Блок кода внутри элемента списка (с отступом и без пустой строки перед ним)
+                item += "\n" + self.fenced_code(indent="    ")
+            elif kind < 0.35:
+                item += "\n\n" + self.fenced_code(indent="   ")
+            elif kind < 0.45:
+                item += "\n    - " + self.sentence(4)
+            elif kind < 0.55:
+                # Ограждение с начала строки сразу после элемента списка
+                item += "\n" + self.fenced_code()
+            items.append(item)
+        return ("\n\n" if rng.random() < 0.3 else "\n").join(items)
+
+    def blockquote(self) -> str:
+        lines = ["# Цитата", self.sentence(6), "", "- пункт"]
+        if self.adversarial:
+            # Определение ссылки внутри цитаты нельзя перенести в другие блоки
+            lines.append("[doc]: https://example.com/q")
+        lines = [self.rng.choice(lines) for _ in range(self.rng.randint(1, 4))]
+        return "\n".join("> " + line if line else ">" for line in lines)
+
+    def raw_html(self) -> str:
+        inner = self.rng.choice(("# Заголовок внутри", self.paragraph(), "\n" + self.paragraph() + "\n",
+                                 "```\ncode\n```"))
+        tag = self.rng.choice(("div", "details", "table", "p"))
+        return f"<{tag}>\n{inner}\n</{tag}>"
+
+    def toc_marker(self) -> str:
+        return "[TOC]"
+
+    def indented_code(self) -> str:
+        return "    indented code\n    # not a heading"
+
+    def thematic_break(self) -> str:
+        return self.rng.choice(("---", "***", "* * *"))
+
+    def reference(self) -> str:
+        if self.adversarial:
+            # Переопределение ссылки другим адресом
+            url = self.rng.choice(("https://example.com/doc", "/pdf/view/a.md"))
+            return f"[doc]: {url}" + self.rng.choice(("", ' "Title"'))
+        return self.rng.choice(("[doc]: https://example.com/doc", '[site]: /pdf/view/a.md "Заметка"'))
+
+    def element(self) -> str:
+        elements = [
+            (self.heading, 6), (self.paragraph, 12), (self.fenced_code, 4), (self.table, 2),
+            (self.bullet_list, 3), (self.blockquote, 1), (self.reference, 1), (self.indented_code, 1),
+            (self.thematic_break, 1),
+        ]
+        if self.adversarial:
+            elements += [(self.raw_html, 1), (self.toc_marker, 1)]
+        makers, weights = zip(*elements)
+        return self.rng.choices(makers, weights)[0]()
+
+    def document(self, min_size: int) -> str:
+        """Документ не короче min_size символов"""
+        parts = []
+        size = 0
+        while size < min_size:
+            part = self.element()
+            parts.append(part)
+            size += len(part) + 2
+        return "\n\n".join(parts) + self.rng.choice(("", "\n", "\n\n"))
+
+    def edit(self, content: str) -> str:
+        """Правка документа: вставка, удаление или замена фрагмента в случайном месте"""
+        rng = self.rng
+        lines = content.split("\n")
+        position = rng.randrange(len(lines) + 1)
+        action = rng.random()
+        if action < 0.4:
+            lines[position:position] = ["", self.element(), ""]
+        elif action < 0.7 and lines:
+            del lines[position:position + rng.randint(1, 10)]
+        else:
+            lines[position:position + 1] = [self.sentence(rng.randint(1, 12))]
+        return "\n".join(lines)
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app import config, file_responses
+from app.file_responses import delivery_target, file_download_response
+from app.pdf_optimize import pdf_optimize_store
+
+PDF = b"%PDF-1.4\n" + b"0" * 2048 + b"\n%%EOF\n"
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    root = tmp_path / "library"
+    (root / "Заметки").mkdir(parents=True)
+    (root / "doc.pdf").write_bytes(PDF)
+    (root / "a b#1.pdf").write_bytes(PDF)
+    (root / "Заметки" / "Шпаргалка.md").write_text("# nginx\n", encoding="utf-8")
+    linearized = tmp_path / "linearized"
+    linearized.mkdir()
+    (linearized / "0123abcd.pdf").write_bytes(PDF)
+    (tmp_path / "outside.pdf").write_bytes(PDF)
+    monkeypatch.setattr(file_responses, "get_library_root", lambda: root.resolve())
+    monkeypatch.setattr(pdf_optimize_store, "storage_dir", linearized)
+    return root
+
+
+@pytest.fixture
+def mode(monkeypatch):
+    def set_mode(value: str) -> None:
+        monkeypatch.setattr(config, "FILE_DELIVERY", value)
+    return set_mode
+
+
+def download(path, media_type="application/pdf", filename=None):
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    response = file_download_response(request, path, media_type, filename)
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(response(request.scope, receive, send))
+    headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in messages[0]["headers"]}
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return messages[0]["status"], headers, body
+
+
+def test_app_mode_serves_the_file(library, mode):
+    mode("app")
+    assert delivery_target(library / "doc.pdf") is None
+    status, headers, body = download(library / "doc.pdf", filename="doc.pdf")
+    assert status == 200 and body == PDF
+    assert "x-accel-redirect" not in headers and "x-sendfile" not in headers
+    assert headers["content-disposition"] == 'attachment; filename="doc.pdf"'
+
+
+def test_accel_percent_encodes_library_paths(library, mode):
+    mode("accel")
+    assert delivery_target(library / "a b#1.pdf") == "/_protected/library/a%20b%231.pdf"
+    status, headers, body = download(library / "Заметки" / "Шпаргалка.md", "text/markdown", "Шпаргалка.md")
+    assert status == 200 and body == b""
+    assert headers["x-accel-redirect"] == "/_protected/library/%D0%97%D0%B0%D0%BC%D0%B5%D1%82%D0%BA%D0%B8/" \
+                                          "%D0%A8%D0%BF%D0%B0%D1%80%D0%B3%D0%B0%D0%BB%D0%BA%D0%B0.md"
+    assert headers["content-disposition"] == "attachment; filename*=utf-8''" \
+                                             "%D0%A8%D0%BF%D0%B0%D1%80%D0%B3%D0%B0%D0%BB%D0%BA%D0%B0.md"
+
+
+def test_accel_uses_linearized_prefix(library, mode):
+    mode("accel")
+    status, headers, body = download(pdf_optimize_store.storage_dir / "0123abcd.pdf", filename="doc.pdf")
+    assert status == 200 and body == b""
+    assert headers["x-accel-redirect"] == "/_protected/linearized/0123abcd.pdf"
+
+
+def test_accel_serves_files_outside_known_roots(library, mode):
+    mode("accel")
+    outside = library.parent / "outside.pdf"
+    assert delivery_target(outside) is None
+    assert delivery_target(library / ".." / "outside.pdf") is None
+    status, headers, body = download(outside)
+    assert status == 200 and body == PDF and "x-accel-redirect" not in headers
+
+
+def test_sendfile_passes_absolute_ascii_path(library, mode):
+    mode("sendfile")
+    status, headers, body = download(library / "a b#1.pdf")
+    assert status == 200 and body == b""
+    assert headers["x-sendfile"] == str((library / "a b#1.pdf").resolve())
+
+
+def test_sendfile_falls_back_to_app_for_non_ascii_path(library, mode):
+    mode("sendfile")
+    path = library / "Заметки" / "Шпаргалка.md"
+    assert delivery_target(path) is None
+    status, headers, body = download(path, "text/markdown", "Шпаргалка.md")
+    assert status == 200 and body == "# nginx\n".encode("utf-8")
+    assert "x-sendfile" not in headers
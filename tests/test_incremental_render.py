@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from app import rendering
+from app.rendering import BlockCache, convert_markdown, render_markdown, render_markdown_blocks, split_markdown_blocks
+from tests.markdown_documents import DocumentGenerator
+
+SEEDS = range(80)
+EDITS = 8
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    """Свой кэш блоков и маленькие блоки, чтобы в документе было много границ"""
+    monkeypatch.setattr(rendering, "block_cache", BlockCache(8 * 1024 * 1024))
+    monkeypatch.setattr(rendering, "BLOCK_MIN_SIZE", 200)
+
+
+def document(seed: int) -> tuple[DocumentGenerator, str]:
+    generator = DocumentGenerator(random.Random(seed), adversarial=seed % 3 == 0)
+    return generator, generator.document(rendering.INCREMENTAL_MIN_SIZE)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_blocks_match_full_render(seed):
+    _, content = document(seed)
+    expected = convert_markdown(content)
+    assert render_markdown_blocks(content) == expected
+    # render_markdown сам выбирает рендеринг по блокам для больших документов
+    assert render_markdown(content) == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_edits_of_cached_document_match_full_render(seed):
+    generator, content = document(seed)
+    render_markdown_blocks(content)
+    for _ in range(EDITS):
+        content = generator.edit(content)
+        assert render_markdown_blocks(content) == convert_markdown(content)
+
+
+def test_edit_reuses_cached_blocks():
+    content = "\n\n".join(f"## Раздел {i}\n\n" + "lorem ipsum dolor " * 40 for i in range(20))
+    blocks = split_markdown_blocks(content)
+    assert blocks is not None and len(blocks) > 2
+    render_markdown_blocks(content)
+    hits = rendering.block_cache.hits
+    edited = content.replace("## Раздел 19", "## Последний раздел")
+    assert render_markdown_blocks(edited) == convert_markdown(edited)
+    # Правка в последнем разделе меняет только последний блок, остальные берутся из кэша
+    assert rendering.block_cache.hits - hits == len(blocks) - 1
@@ -0,0 +1,64 @@
+import asyncio
+import random
+
+import pytest
+from jinja2 import Environment
+
+from app import config
+from app.rendering import convert_markdown, sections_are_safe
+from app.streaming import stream_document
+from tests.markdown_documents import DocumentGenerator
+
+TEMPLATE = Environment(autoescape=True).from_string("<main>{{ content }}</main><footer></footer>")
+PREFIX, SUFFIX = "<main>", "</main><footer></footer>"
+
+FILLER = "\n\n".join(f"## Раздел {i}\n\n" + "lorem ipsum dolor " * 40 for i in range(20))
+
+
+@pytest.fixture(autouse=True)
+def small_sections(monkeypatch):
+    monkeypatch.setattr(config, "STREAM_SECTION_SIZE", 500)
+
+
+def streamed(path) -> str:
+    async def collect() -> bytes:
+        return b"".join([chunk async for chunk in stream_document(path, TEMPLATE, {}, None)])
+
+    page = asyncio.run(collect()).decode("utf-8")
+    assert page.startswith(PREFIX) and page.endswith(SUFFIX)
+    return page[len(PREFIX):-len(SUFFIX)]
+
+
+@pytest.mark.parametrize("content", [
+    "[TOC]\n\n" + FILLER,
+    FILLER + "\n\n<div>\n\n# Заголовок внутри HTML\n\ntext\n\n</div>\n\n" + FILLER,
+    FILLER + "\n\n- пункт\n\n    ```\n    # комментарий\n    ```\n\n" + FILLER,
+    FILLER + "\n\n1. шаг\n```bash\n# комментарий\n\n## тоже комментарий\n```\n\n" + FILLER,
+], ids=["toc", "raw-html", "indented-fence-in-list", "fence-after-list-item"])
+def test_unsplittable_documents_match_full_render(tmp_path, content):
+    path = tmp_path / "doc.md"
+    path.write_text(content, encoding="utf-8")
+    assert streamed(path) == convert_markdown(content)
+
+
+def test_template_tail_is_not_escaped(tmp_path):
+    path = tmp_path / "doc.md"
+    path.write_text(FILLER, encoding="utf-8")
+    assert streamed(path) == convert_markdown(FILLER)
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_streamed_html_matches_full_render(tmp_path, seed):
+    rng = random.Random(seed)
+    content = DocumentGenerator(rng, adversarial=seed % 3 == 0).document(4000)
+    path = tmp_path / "doc.md"
+    path.write_text(content, encoding="utf-8")
+    assert streamed(path) == convert_markdown(content)
+
+
+def test_plain_documents_are_streamed_by_sections(tmp_path):
+    path = tmp_path / "doc.md"
+    path.write_text(FILLER, encoding="utf-8")
+    assert sections_are_safe(path)
+    path.write_text("[TOC]\n\n" + FILLER, encoding="utf-8")
+    assert not sections_are_safe(path)